@@ -0,0 +1,276 @@
+"""Benchmark of the non-LLM pipeline on synthetic obfuscated bundles.
+
+    python benchmarks/benchmark.py --sizes 10000 100000 1000000 --output bench.json
+
+Every stage is timed on its own, then run again under tracemalloc for its peak
+memory. Bundles are generated from a fixed seed and the model is a stub, so two
+runs on the same commit compare, and so do runs on two commits.
+
+With --pipeline --record, a run against Ollama records its transcript, which
+--replay then serves with a simulated latency to profile the whole pipeline
+without a model."""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import esprima
+import escodegen
+from esprima.nodes import Node
+
+from src.visitor import Visitor, Scope, allow_deep_recursion
+from src.scoring import NameScorer
+from src.rules import RuleEngine
+from src.local import Model
+from src.backend import Backend, OllamaBackend, RecordingBackend, ReplayBackend
+
+PROPERTIES = [
+    'length', 'push', 'width', 'height', 'style', 'src', 'value', 'call', 'apply',
+    'getContext', 'createElement', 'appendChild', 'addEventListener', 'forEach',
+    'indexOf', 'slice', 'prototype', 'toString', 'parentNode', 'innerHTML'
+]
+GLOBALS = ['window', 'document', 'Math', 'JSON', 'console', 'Object', 'Array']
+STRINGS = ['canvas', '2d', 'click', 'div', 'load', 'error', 'data', 'px', 'none', 'auto']
+
+class Generator:
+    """Deterministic obfuscated-style JavaScript: short names, nested callbacks,
+    loops, member chains and object literals."""
+
+    def __init__(self, seed: int = 0):
+        self.random = random.Random(seed)
+
+    def name(self) -> str:
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        if self.random.random() < 0.8:
+            return self.random.choice(letters)
+        name = self.random.choice(letters) + self.random.choice(letters + '0123456789')
+        return name if name not in ('do', 'if', 'in') else name[0]
+
+    def expression(self, names: list[str], depth: int = 0) -> str:
+        choice = self.random.random()
+        if depth > 2 or choice < 0.25:
+            return self.random.choice(names + GLOBALS + ['0', '1', f"'{self.random.choice(STRINGS)}'"])
+        if choice < 0.45:
+            return f"{self.random.choice(names)}.{self.random.choice(PROPERTIES)}"
+        if choice < 0.65:
+            args = ", ".join(self.expression(names, depth + 1) for _ in range(self.random.randint(0, 3)))
+            return f"{self.random.choice(names + GLOBALS)}.{self.random.choice(PROPERTIES)}({args})"
+        if choice < 0.8:
+            operator = self.random.choice(['+', '-', '*', '&&', '||', '==', '<'])
+            return f"{self.expression(names, depth + 1)} {operator} {self.expression(names, depth + 1)}"
+        if choice < 0.9:
+            keys = self.random.sample(PROPERTIES, 2)
+            return "{" + ", ".join(f"{key}: {self.expression(names, depth + 1)}" for key in keys) + "}"
+        return self.function(names, depth + 1)
+
+    def statements(self, names: list[str], depth: int, count: int) -> str:
+        lines = []
+        for _ in range(count):
+            choice = self.random.random()
+            if choice < 0.3:
+                declared = [self.name() for _ in range(self.random.randint(1, 3))]
+                lines.append("var " + ", ".join(f"{name} = {self.expression(names, depth)}" for name in declared) + ";")
+                names = names + declared
+            elif choice < 0.5:
+                lines.append(f"{self.random.choice(names)}.{self.random.choice(PROPERTIES)} = {self.expression(names, depth)};")
+            elif choice < 0.6 and depth < 4:
+                counter = self.name()
+                body = self.statements(names + [counter], depth + 1, 2)
+                lines.append(f"for (var {counter} = 0; {counter} < {self.random.choice(names)}.length; {counter}++) {{ {body} }}")
+            elif choice < 0.7 and depth < 4:
+                lines.append(f"if ({self.expression(names, depth)}) {{ {self.statements(names, depth + 1, 2)} }}")
+            elif choice < 0.8 and depth < 4:
+                lines.append(f"{self.random.choice(names)}.addEventListener('{self.random.choice(STRINGS)}', {self.function(names, depth + 1)});")
+            else:
+                # Parenthesized so that functions and objects are not read as statements
+                lines.append(f"({self.expression(names, depth)});")
+        return " ".join(lines)
+
+    def function(self, names: list[str], depth: int) -> str:
+        params = list(dict.fromkeys(self.name() for _ in range(self.random.randint(0, 4))))
+        body = self.statements(names + params, depth + 1, self.random.randint(1, 4)) if depth < 4 else ""
+        return f"function ({', '.join(params)}) {{ {body} return {self.expression(names + params, 3)}; }}"
+
+    def bundle(self, size: int) -> str:
+        modules = []
+        total = 0
+        while total < size:
+            names = [self.name() for _ in range(self.random.randint(2, 5))]
+            module = f"(function ({', '.join(dict.fromkeys(names))}) {{ {self.statements(names, 0, self.random.randint(4, 10))} }})({', '.join(GLOBALS[:3])});\n"
+            modules.append(module)
+            total += len(module)
+        return "".join(modules)
+
+class StubModel(Model):
+    """Offline model answering with a name derived from the variable."""
+
+    def predict(self, var: str, context: str, declared: set):
+        name = f"{var}Value"
+        while name in declared:
+            name = "_" + name
+        return name
+
+    def predict_batch(self, vars: list[str], context: str, declared: set, attempts: int = 3) -> dict[str, str]:
+        names = {}
+        for var in vars:
+            names[var] = self.predict(var, context, declared | set(names.values()))
+        return names
+
+def measure(function, memory: bool) -> dict:
+    gc.collect()
+    start = time.perf_counter()
+    ops = function()
+    seconds = time.perf_counter() - start
+    if isinstance(ops, tuple):
+        # Stages with a setup time their own part
+        ops, seconds = ops
+
+    result = {'seconds': seconds, 'ops': ops, 'ops_per_sec': ops / seconds if seconds else 0.0}
+    if memory:
+        tracemalloc.start()
+        function()
+        result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+def sample_declarations(visitor: Visitor, count: int) -> list[tuple[Scope, str]]:
+    declarations = [(scope, var) for scope in visitor.global_scope for var in sorted(scope.declared)]
+    return random.Random(0).sample(declarations, min(count, len(declarations)))
+
+def benchmark(size: int, samples: int, memory: bool, pipeline: bool, backend: Backend = None) -> dict:
+    program = Generator(seed=size).bundle(size)
+    ast = esprima.parseScript(program, range=True, loc=True)
+
+    def parse():
+        esprima.parseScript(program, range=True, loc=True)
+        return 1
+
+    def build():
+        Visitor(ast)
+        return 1
+
+    def change_name():
+        visitor = Visitor(esprima.parseScript(program, range=True, loc=True))
+        declarations = sample_declarations(visitor, samples)
+        start = time.perf_counter()
+        for scope, var in declarations:
+            scope.change_name(visitor, var, var + "Renamed")
+        return len(declarations), time.perf_counter() - start
+
+    def get_context():
+        visitor = Visitor(esprima.parseScript(program, range=True, loc=True))
+        declarations = sample_declarations(visitor, samples)
+        start = time.perf_counter()
+        for scope, var in declarations:
+            scope.get_context(visitor, 1024, var)
+        return len(declarations), time.perf_counter() - start
+
+    def generate():
+        escodegen.generate(ast)
+        return 1
+
+    visitor = Visitor(ast)
+    def render():
+        visitor.render(program)
+        return 1
+
+    stages = {
+        'parse': measure(parse, memory),
+        'visitor': measure(build, memory),
+        'change_name': measure(change_name, memory),
+        'get_context': measure(get_context, memory),
+        'generate': measure(generate, memory),
+        'render': measure(render, memory),
+    }
+
+    if pipeline:
+        stages['desobfuscate'] = measure(lambda: run_pipeline(program, backend), memory)
+
+    return {'size': size, 'bytes': len(program), 'declared': visitor.global_scope.count_declared(), 'stages': stages, 'rules': rule_coverage(ast, visitor)}
+
+def rule_coverage(ast: Node, visitor: Visitor) -> dict:
+    # Names sent to the model without the rules, and those the rules give instead
+    scorer = NameScorer(ast)
+    rules = RuleEngine(ast)
+    selected = 0
+    for scope in visitor.global_scope:
+        for var in scorer.select(scope):
+            selected += 1
+            rules.name(scope.bindings[var])
+    named = sum(rules.stats.values())
+    return {'selected': selected, 'named': named, 'share': named / selected if selected else 0.0, 'by_rule': dict(rules.stats)}
+
+def run_pipeline(program: str, backend: Backend = None) -> int:
+    from src.deobfuscator import Desobfuscator
+
+    folder = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            with open('bundle.js', 'w') as file:
+                file.write(program)
+            engine = Desobfuscator('bundle.js', cache_file=None, backend=backend)
+            if not backend:
+                engine.model = StubModel()
+            engine.progress_bar.disable = True
+            engine.desobfuscate()
+            engine.writer.close()
+            return engine.checkpoint.progress
+        finally:
+            os.chdir(folder)
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the non-LLM pipeline on synthetic bundles")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help="bundle sizes in bytes, up to 10000000")
+    parser.add_argument('--samples', type=int, default=200, help="variables renamed and looked up per bundle")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc runs")
+    parser.add_argument('--pipeline', action='store_true', help="also run Desobfuscator end to end with a stub model")
+    parser.add_argument('--record', help="with --pipeline, query Ollama and record the transcript to this file")
+    parser.add_argument('--replay', help="with --pipeline, serve the model responses from this transcript")
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated time to first token of replayed responses")
+    parser.add_argument('--token-latency', type=float, default=0.0, help="simulated time between replayed chunks")
+    parser.add_argument('--output', help="JSON file to write, printed otherwise")
+    args = parser.parse_args()
+
+    backend = None
+    if args.record:
+        # The pipeline runs in a temporary folder
+        backend = RecordingBackend(OllamaBackend(), os.path.abspath(args.record))
+    elif args.replay:
+        backend = ReplayBackend(args.replay, args.latency, args.token_latency)
+
+    allow_deep_recursion()
+    # Logs of the pipeline go to stderr so that stdout stays valid JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        results = {
+            'commit': commit(),
+            'python': platform.python_version(),
+            'results': [benchmark(size, args.samples, not args.no_memory, args.pipeline, backend) for size in args.sizes],
+        }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
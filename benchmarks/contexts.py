@@ -0,0 +1,103 @@
+"""Comparison of the contexts of Scope.get_context with the def-use slices of Slicer.
+
+    python benchmarks/contexts.py jquery.js --samples 200 --output contexts.json
+
+The names of an unminified file are mangled into short ones, then both contexts of a
+sample of the bindings are built within the same budget and their tokens compared.
+With --model, the name predicted from each context is scored against the original
+name: exact matches, and the share of the words of the original name found back."""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import esprima
+
+from src.visitor import Visitor, Binding, allow_deep_recursion, count_tokens
+from src.scoring import split_words
+from src.slicer import Slicer
+from src.local import Model
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+def short_name(index: int) -> str:
+    name = LETTERS[index % 26]
+    index //= 26
+    while index:
+        name += LETTERS[index % 26]
+        index //= 26
+    return name
+
+def mangle(visitor: Visitor) -> dict[Binding, str]:
+    # Short names for the bindings of every scope but the global one, like a minifier
+    originals: dict[Binding, str] = {}
+    for scope in visitor.global_scope:
+        if scope.parent is None:
+            continue
+        bindings = [scope.bindings[name] for name in sorted(scope.declared)]
+        changes = {binding.name: short_name(index) for index, binding in enumerate(bindings)}
+        originals.update({binding: binding.name for binding in bindings})
+        scope.change_names(visitor, changes)
+    return originals
+
+def score(original: str, predicted: str) -> tuple[bool, float]:
+    words = set(split_words(original))
+    found = words & set(split_words(predicted))
+    return original.lower() == predicted.lower(), len(found) / len(words) if words else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the context builders on an unminified file")
+    parser.add_argument('file', help="unminified Javascript file")
+    parser.add_argument('--samples', type=int, default=200, help="bindings compared")
+    parser.add_argument('--budget', type=int, default=1024, help="tokens of context")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model', action='store_true', help="predict the names with Ollama and score them")
+    parser.add_argument('--output', help="JSON file of the results")
+    args = parser.parse_args()
+
+    allow_deep_recursion()
+    with open(args.file, 'r') as file:
+        program = file.read()
+    visitor = Visitor(esprima.parseScript(program, range=True, loc=True))
+    originals = mangle(visitor)
+    slicer = Slicer(visitor)
+
+    # Bindings used at least once besides their declaration
+    candidates = [binding for binding in originals if len(binding.references) >= 2]
+    sample = random.Random(args.seed).sample(candidates, min(args.samples, len(candidates)))
+    model = Model(cache=None) if args.model else None
+
+    rows = []
+    for binding in sample:
+        scope, var = binding.scope, binding.name
+        contexts = {
+            'scope': scope.get_context(visitor, args.budget, var),
+            'slice': slicer.get_context(scope, var, args.budget),
+        }
+        row = {'name': originals[binding], 'tokens': {key: count_tokens(context) for key, context in contexts.items()}}
+        if model:
+            row['predicted'] = {key: model.predict(var, context, scope.declared - {var}) for key, context in contexts.items()}
+        rows.append(row)
+
+    result = {'file': args.file, 'budget': args.budget, 'samples': len(rows)}
+    for key in ('scope', 'slice'):
+        tokens = [row['tokens'][key] for row in rows]
+        result[key] = {'mean_tokens': statistics.mean(tokens), 'median_tokens': statistics.median(tokens)}
+        if model:
+            scores = [score(row['name'], row['predicted'][key]) for row in rows]
+            result[key]['exact'] = sum(exact for exact, _ in scores) / len(scores)
+            result[key]['words'] = statistics.mean(words for _, words in scores)
+    result['reduction'] = 1 - result['slice']['mean_tokens'] / result['scope']['mean_tokens']
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({**result, 'rows': rows}, file, indent=2)
+
+if __name__ == '__main__':
+    main()
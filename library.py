@@ -0,0 +1,28 @@
+import argparse
+
+from src.batch import expand_inputs
+from src.signatures import SignatureDatabase
+from src.visitor import allow_deep_recursion
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the signatures of the known libraries, whose functions get their original names back without the model")
+    parser.add_argument('--database', default=".cache/signatures.db", help="signature database")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help="fingerprint the unminified sources of a library")
+    add.add_argument('library', help="name of the library, e.g. jquery-3.7.1")
+    add.add_argument('sources', nargs='+', help="files, folders or globs of the sources")
+    commands.add_parser('list', help="list the libraries with their number of functions")
+    args = parser.parse_args()
+
+    allow_deep_recursion()
+    database = SignatureDatabase(args.database)
+    if args.command == 'add':
+        added = database.add_library(args.library, expand_inputs(args.sources))
+        print(f"{added} functions of {args.library} added to {args.database}")
+    else:
+        for library, count in database.libraries().items():
+            print(f"{library}: {count} functions")
+    database.close()
+
+if __name__ == '__main__':
+    main()
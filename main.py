@@ -1,7 +1,44 @@
-from deobfuscator import Desobfuscator
+import argparse
 
-from rich import print
+from src.batch import run_batch
+from src.visitor import allow_deep_recursion
 
-engine = Desobfuscator('script.js')
-engine.desobfuscate()
-#print(engine.desobfuscate()[:5000])
\ No newline at end of file
+def main():
+    parser = argparse.ArgumentParser(description="Rename the variables of obfuscated Javascript files with a local LLM")
+    parser.add_argument('inputs', nargs='+', help="files, folders or globs of the files to deobfuscate")
+    parser.add_argument('--output', default="output", help="folder of the outputs, one subfolder per input")
+    parser.add_argument('--workers', type=int, help="processes parsing and analysing the inputs, the number of CPUs by default")
+    parser.add_argument('--parallel', type=int, help="model requests in flight for all the workers, OLLAMA_NUM_PARALLEL by default")
+    parser.add_argument('--rate', type=float, default=0.0, help="model requests started per second for all the workers, unlimited by default")
+    parser.add_argument('--cache', default=".cache/predictions.db", help="prediction cache shared by the workers")
+    parser.add_argument('--no-cache', action='store_true', help="do not cache the predictions")
+    parser.add_argument('--no-batch', action='store_true', help="ask the name of each variable in its own request")
+    parser.add_argument('--structured', action='store_true', help="constrain the answers with a JSON schema")
+    parser.add_argument('--no-rules', action='store_true', help="ask the model even for the names found by the rules")
+    parser.add_argument('--signatures', default=".cache/signatures.db", help="functions of the known libraries, added with library.py")
+    parser.add_argument('--simplify', action='store_true', help="decode the string arrays, fold constants and collapse proxy functions of javascript-obfuscator first")
+    parser.add_argument('--slice', action='store_true', help="show the model only the statements defining and using each variable asked on its own")
+    parser.add_argument('--transform', action='store_true', help="rewrite the functions fitting in the context in one request each")
+    parser.add_argument('--budget', type=int, help="stop starting new scopes once this many variables have been predicted")
+    parser.add_argument('--time-budget', type=float, help="stop starting new scopes after this many seconds")
+    parser.add_argument('--resume', action='store_true', help="continue the runs interrupted in the output folder")
+    args = parser.parse_args()
+
+    allow_deep_recursion()
+    run_batch(
+        args.inputs, args.output, args.workers, args.parallel, args.rate,
+        cache_file=None if args.no_cache else args.cache,
+        batch=not args.no_batch,
+        structured=args.structured,
+        rules=not args.no_rules,
+        signatures_file=args.signatures,
+        simplify=args.simplify,
+        slicing=args.slice,
+        transform=args.transform,
+        budget=args.budget,
+        time_budget=args.time_budget,
+        resume=args.resume,
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Iterator
+
+import ollama
+
+# Fields of the last chunk kept in transcripts
+STATS = [
+    'context', 'prompt_eval_count', 'eval_count', 'total_duration',
+    'load_duration', 'prompt_eval_duration', 'eval_duration'
+]
+
+def prompt_key(model: str, system: str, prompt: str, format: dict = None) -> str:
+    # Transcripts made without a schema keep their keys
+    schema = f"\0{json.dumps(format, sort_keys=True)}" if format else ""
+    return hashlib.sha256(f"{model}\0{system}\0{prompt}{schema}".encode()).hexdigest()
+
+class Backend:
+    """Source of the streamed chunks read by Model.generate. Chunks behave like the
+    ones of ollama.generate: 'response' holds the text, and the last one has
+    'done' set along with the statistics. 'format' is a JSON schema the response
+    has to follow."""
+
+    def generate(self, model: str, prompt: str, system: str, options: dict, format: dict = None) -> Iterator:
+        raise NotImplementedError
+
+class OllamaBackend(Backend):
+    def generate(self, model: str, prompt: str, system: str, options: dict, format: dict = None) -> Iterator:
+        return ollama.generate(model, prompt, system=system, options=options, format=format, stream=True)
+
+class RateLimitedBackend(Backend):
+    """Forward to 'backend' with at most 'slots' requests in flight, started at most 'rate'
+    times per second. The semaphore and the time of the next start ('clock', a shared
+    double) may come from multiprocessing to limit several processes together."""
+
+    def __init__(self, backend: Backend, slots, rate: float = 0.0, clock=None):
+        self.backend: Backend = backend
+        self.slots = slots
+        self.rate: float = rate
+        self.clock = clock
+
+    def wait(self):
+        if not self.rate or self.clock is None:
+            return
+        with self.clock.get_lock():
+            now = time.time()
+            start = max(now, self.clock.value)
+            self.clock.value = start + 1 / self.rate
+        time.sleep(start - now)
+
+    def generate(self, model: str, prompt: str, system: str, options: dict, format: dict = None) -> Iterator:
+        with self.slots:
+            self.wait()
+            # The slot is held until the stream ends or is closed
+            yield from self.backend.generate(model, prompt, system, options, format)
+
+class RecordingBackend(Backend):
+    """Forward to 'backend' and append every prompt with its response to a JSONL transcript."""
+
+    def __init__(self, backend: Backend, file: str):
+        self.backend: Backend = backend
+        self.file: str = file
+        self.lock = threading.Lock()
+
+        folder = os.path.dirname(file)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def generate(self, model: str, prompt: str, system: str, options: dict, format: dict = None) -> Iterator:
+        response = ''
+        stats = {}
+        try:
+            for chunk in self.backend.generate(model, prompt, system, options, format):
+                response += chunk['response']
+                if chunk['done']:
+                    stats = {key: chunk[key] for key in STATS if key in chunk and chunk[key] is not None}
+                yield chunk
+        finally:
+            # Also reached when the reader stops early, the transcript then holds what it has read
+            self.record(model, prompt, system, format, response, stats)
+
+    def record(self, model: str, prompt: str, system: str, format: dict, response: str, stats: dict):
+        entry = {
+            'key': prompt_key(model, system, prompt, format),
+            'model': model,
+            'prompt': prompt,
+            'response': response,
+            'stats': stats,
+        }
+        with self.lock:
+            with open(self.file, 'a') as file:
+                file.write(json.dumps(entry) + '\n')
+
+class ReplayBackend(Backend):
+    """Serve the responses of a transcript made by RecordingBackend. 'latency' is waited
+    before the first chunk and 'token_latency' before each of the next ones."""
+
+    def __init__(self, file: str, latency: float = 0.0, token_latency: float = 0.0, chunk_size: int = 4):
+        self.latency: float = latency
+        self.token_latency: float = token_latency
+        self.chunk_size: int = chunk_size
+
+        # The last response recorded for a prompt wins
+        self.transcript: dict[str, dict] = {}
+        with open(file, 'r') as transcript:
+            for line in transcript:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.transcript[entry['key']] = entry
+
+    def generate(self, model: str, prompt: str, system: str, options: dict, format: dict = None) -> Iterator:
+        entry = self.transcript.get(prompt_key(model, system, prompt, format))
+        if entry is None:
+            raise KeyError(f"No recorded response for this prompt: {prompt[:100]}")
+
+        time.sleep(self.latency)
+        response = entry['response']
+        for start in range(0, len(response), self.chunk_size):
+            if start:
+                time.sleep(self.token_latency)
+            yield {'response': response[start:start + self.chunk_size], 'done': False}
+
+        yield {'response': '', 'done': True, **entry['stats']}
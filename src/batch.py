@@ -0,0 +1,104 @@
+import contextlib
+import glob
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.backend import Backend, OllamaBackend, RateLimitedBackend
+from src.visitor import allow_deep_recursion
+
+EXTENSIONS = ('.js', '.mjs', '.cjs')
+
+# Limits of the model requests shared by the processes, set by 'init_worker'
+limits: dict = {}
+
+def expand_inputs(patterns: list[str]) -> list[str]:
+    """Files of 'patterns', which may be files, folders searched recursively or globs."""
+    files: list[str] = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for folder, _, names in os.walk(pattern):
+                files += [os.path.join(folder, name) for name in names if name.endswith(EXTENSIONS)]
+        elif glob.has_magic(pattern):
+            files += [file for file in glob.glob(pattern, recursive=True) if os.path.isfile(file)]
+        elif os.path.isfile(pattern):
+            files.append(pattern)
+        else:
+            raise FileNotFoundError(f"No such file or folder: {pattern}")
+    return sorted(set(os.path.abspath(file) for file in files))
+
+def output_folders(files: list[str], output: str) -> dict[str, str]:
+    """An output folder per input, following its path from the folder common to all inputs."""
+    common = os.path.commonpath([os.path.dirname(file) for file in files]) if files else ""
+    folders: dict[str, str] = {}
+    used: set[str] = set()
+    for file in files:
+        relative = os.path.relpath(file, common)
+        folder = os.path.join(output, os.path.splitext(relative)[0])
+        if folder in used:
+            # Same name with another extension
+            folder = os.path.join(output, relative.replace('.', '_'))
+        used.add(folder)
+        folders[file] = folder
+    return folders
+
+def init_worker(slots, clock, rate: float):
+    allow_deep_recursion()
+    limits.update(slots=slots, clock=clock, rate=rate)
+
+def run_file(file: str, folder: str, options: dict, backend: Backend = None) -> dict:
+    from src.deobfuscator import Desobfuscator
+
+    if backend is None:
+        backend = RateLimitedBackend(OllamaBackend(), limits['slots'], limits['rate'], limits['clock'])
+
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(folder) or ".", exist_ok=True)
+    # Logs of concurrent inputs would be interleaved, and the output folder is emptied
+    with open(f"{folder}.log", 'a' if options.get('resume') else 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        engine = Desobfuscator(file, output_folder=folder, backend=backend, **options)
+        engine.progress_bar.disable = True
+        engine.model.verbose = False
+        engine.desobfuscate()
+        engine.writer.close()
+        if engine.cache:
+            engine.cache.close()
+
+    return {
+        'file': file,
+        'output': os.path.join(folder, "output.js"),
+        'variables': engine.checkpoint.progress,
+        'requests': engine.metrics.requests,
+        'seconds': time.perf_counter() - start,
+    }
+
+def run_batch(patterns: list[str], output: str = "output", workers: int = None, parallel: int = None, rate: float = 0.0, **options) -> list[dict]:
+    """Deobfuscate every input in a pool of 'workers' processes. Parsing, scope analysis and
+    cache lookups run in the workers, while model requests go through a client limited to
+    'parallel' requests in flight and 'rate' requests per second for all of them."""
+    files = expand_inputs(patterns)
+    folders = output_folders(files, output)
+    parallel = parallel or int(os.environ.get('OLLAMA_NUM_PARALLEL', 1))
+    workers = min(workers or os.cpu_count() or 1, len(files)) or 1
+    options['parallel'] = parallel
+
+    slots = multiprocessing.Semaphore(parallel)
+    clock = multiprocessing.Value('d', 0.0)
+    start = time.perf_counter()
+    results: list[dict] = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(slots, clock, rate)) as executor:
+        futures = {executor.submit(run_file, file, folders[file], options): file for file in files}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[FAILED] {futures[future]}: {e}")
+                continue
+            results.append(result)
+            print(f"[DONE] {result['file']} -> {result['output']} ({result['variables']} variables in {result['seconds']:.1f}s)")
+
+    hours = (time.perf_counter() - start) / 3600
+    variables = sum(result['variables'] for result in results)
+    print(f"[THROUGHPUT] {len(results)} / {len(files)} files, {variables} variables in {hours * 3600:.1f}s: {len(results) / hours if hours else 0.0:.1f} files/hour, {variables / hours if hours else 0.0:.1f} variables/hour")
+    return results
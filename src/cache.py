@@ -0,0 +1,92 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+class PredictionCache:
+    """On-disk cache of accepted names, keyed on the model, the prompt version,
+    the variable and its context with short identifiers canonicalized, so that
+    re-running on a new build of the same code hits even if the minifier picked
+    other names. Least recently used entries are evicted above 'max_entries'."""
+
+    KEYWORDS = {
+        'break', 'case', 'catch', 'class', 'const', 'continue', 'debugger', 'default',
+        'delete', 'do', 'else', 'export', 'extends', 'finally', 'for', 'function', 'if',
+        'import', 'in', 'instanceof', 'let', 'new', 'return', 'super', 'switch', 'this',
+        'throw', 'try', 'typeof', 'var', 'void', 'while', 'with', 'yield', 'async', 'await',
+        'of', 'null', 'true', 'false', 'undefined', 'NaN'
+    }
+    IDENTIFIER = re.compile(r"(?<![\w$.])[A-Za-z_$][\w$]*")
+
+    def __init__(self, file: str, max_entries: int = 100000):
+        self.file: str = file
+        self.max_entries: int = max_entries
+        self.hits: int = 0
+        self.misses: int = 0
+
+        folder = os.path.dirname(file)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        # Predictions may run on a thread pool, and several processes may share the file
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file, check_same_thread=False, timeout=60.0)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, name TEXT NOT NULL, used INTEGER NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS predictions_used ON predictions (used)")
+        self.clock: int = self.connection.execute("SELECT COALESCE(MAX(used), 0) FROM predictions").fetchone()[0]
+        self.count: int = self.connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def normalize(self, var: str, context: str) -> tuple[str, str]:
+        # Short names are the ones a minifier changes between builds
+        names: dict[str, str] = {var: "$v"}
+        def canonical(match: re.Match) -> str:
+            name = match.group(0)
+            if len(name) >= 3 or name in self.KEYWORDS:
+                return name
+            if name not in names:
+                names[name] = f"${len(names)}"
+            return names[name]
+
+        return names[var], " ".join(self.IDENTIFIER.sub(canonical, context).split())
+
+    def key(self, model: str, version: int, var: str, context: str) -> str:
+        var, context = self.normalize(var, context)
+        return hashlib.sha256(f"{model}\0{version}\0{var}\0{context}".encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self.lock:
+            row = self.connection.execute("SELECT name FROM predictions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.clock += 1
+            self.connection.execute("UPDATE predictions SET used = ? WHERE key = ?", (self.clock, key))
+            self.connection.commit()
+            return row[0]
+
+    def put(self, key: str, name: str):
+        with self.lock:
+            self.clock += 1
+            if self.connection.execute("SELECT 1 FROM predictions WHERE key = ?", (key,)).fetchone() is None:
+                self.count += 1
+            self.connection.execute("INSERT OR REPLACE INTO predictions (key, name, used) VALUES (?, ?, ?)", (key, name, self.clock))
+
+            if self.count > self.max_entries:
+                self.connection.execute("DELETE FROM predictions WHERE key IN (SELECT key FROM predictions ORDER BY used LIMIT ?)", (self.count - self.max_entries,))
+                self.count = self.max_entries
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
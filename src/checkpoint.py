@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import time
+
+class Checkpoint:
+    """Progress of a run: the renames applied per scope (scopes are numbered in
+    traversal order), the scopes completed in the order they were, which is not
+    the traversal order as scopes are scheduled by impact, the predictions of the
+    scope in progress not applied yet and the progress counter."""
+
+    def __init__(self, file: str, program: str, interval: float = 30.0):
+        self.file: str = file
+        self.input_hash: str = hashlib.sha256(program.encode()).hexdigest()
+        self.interval: float = interval
+        self.last_save: float = time.monotonic()
+
+        self.renames: dict[int, dict[str, str]] = {}
+        self.completed: set[int] = set()
+        # Collisions are resolved against the names already applied, so renames are replayed in this order
+        self.order: list[int] = []
+        self.current: int | None = None
+        self.pending: dict[str, str] = {}
+        self.progress: int = 0
+
+    def load(self) -> bool:
+        if not os.path.exists(self.file):
+            return False
+
+        with open(self.file, 'r') as file:
+            data = json.load(file)
+        if data['input_hash'] != self.input_hash:
+            raise ValueError(f"Checkpoint {self.file} has been made for another input")
+
+        self.renames = {int(index): changes for index, changes in data['renames'].items()}
+        self.order = data['completed']
+        self.completed = set(self.order)
+        self.current = data['current']
+        self.pending = data['pending']
+        self.progress = data['progress']
+        return True
+
+    def update(self):
+        if time.monotonic() - self.last_save >= self.interval:
+            self.save()
+
+    def save(self):
+        data = {
+            'input_hash': self.input_hash,
+            'renames': self.renames,
+            'completed': self.order,
+            'current': self.current,
+            'pending': self.pending,
+            'progress': self.progress,
+        }
+
+        temp = f"{self.file}.tmp"
+        with open(temp, 'w') as file:
+            json.dump(data, file)
+        os.replace(temp, self.file)
+        self.last_save = time.monotonic()
+
+    def start_scope(self, position: int) -> dict[str, str]:
+        # Predictions made for the scope before an interruption are not asked again
+        if position != self.current:
+            self.current = position
+            self.pending = {}
+        return dict(self.pending)
+
+    def add_prediction(self, var: str, new_var: str):
+        self.pending[var] = new_var
+        self.progress += 1
+        self.update()
+
+    def complete_scope(self, position: int, applied: dict[str, str]):
+        if applied:
+            self.renames[position] = applied
+        self.completed.add(position)
+        self.order.append(position)
+        self.current = None
+        self.pending = {}
+        self.update()
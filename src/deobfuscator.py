@@ -1,76 +1,336 @@
 import esprima
-import escodegen
 import os
-import threading
+import time
 from esprima.nodes import *
-import jsbeautifier
 import tqdm # type: ignore
+from typing import Iterator
+from collections import Counter
 
 from src.visitor import *
 from src.local import Model
-
-from rich import print as bprint
+from src.cache import PredictionCache
+from src.backend import Backend
+from src.writer import Writer
+from src.checkpoint import Checkpoint
+from src.metrics import Metrics
+from src.scoring import NameScorer
+from src.rules import RuleEngine
+from src.fingerprint import find_duplicates
+from src.signatures import SignatureDatabase
+from src.simplify import simplify_program
+from src.slicer import Slicer
 
 class Desobfuscator:
-    def __init__(self, file: str):
-        self.output_folder: str = "output"
+    def __init__(self, file: str, save_interval: float = 5.0, save_every: int = 50, parallel: int = None, cache_file: str = ".cache/predictions.db", resume: bool = False, batch: bool = True, backend: Backend = None, prometheus_file: str = None, structured: bool = False, output_folder: str = "output", transform: bool = False, budget: int = None, time_budget: float = None, rules: bool = True, signatures_file: str = ".cache/signatures.db", simplify: bool = False, slicing: bool = False):
+        self.output_folder: str = output_folder
         if not os.path.exists(self.output_folder):
             os.makedirs(self.output_folder)
-        else:
+        elif not resume:
+            # Folders may hold the outputs of other inputs
             for f in os.listdir(self.output_folder):
-                os.remove(os.path.join(self.output_folder, f))
+                if os.path.isfile(os.path.join(self.output_folder, f)):
+                    os.remove(os.path.join(self.output_folder, f))
 
         self.program: str = ""
         with open(file, 'r') as file:
             self.program = file.read()
+        if simplify:
+            # Decoded strings and collapsed proxies, the output is the simplified code
+            tokens = count_tokens(self.program)
+            self.program, stats = simplify_program(self.program)
+            print(f"[SIMPLIFY]: {dict(stats)}, {tokens} -> {count_tokens(self.program)} tokens")
 
-        self.ast: Script = esprima.parseScript(self.program)
+        self.ast: Script = esprima.parseScript(self.program, range=True, loc=True)
         self.visitor = Visitor(self.ast)
-        self.model: Model = Model()
 
-        self.progress_bar = tqdm.tqdm(total=self.visitor.global_scope.count_declared())
+        # Scopes are numbered in traversal order to locate the progress of a run
+        self.scopes: list[Scope] = list(self.visitor.global_scope)
+        self.positions: dict[Scope, int] = {scope: position for position, scope in enumerate(self.scopes)}
+
+        # Names needing the model with their impact, scored before the renames of a resumed run
+        self.scorer = NameScorer(self.ast)
+        self.selection: dict[Scope, dict[str, float]] = {scope: self.scorer.select(scope) for scope in self.scopes}
+
+        # Names given without the model: original names of known library functions, then the rules
+        self.given: dict[Scope, dict[str, str]] = {scope: {} for scope in self.scopes}
+        self.coverage: Counter = Counter()
+        if signatures_file and os.path.exists(signatures_file):
+            database = SignatureDatabase(signatures_file)
+            names, self.coverage = database.match(self.visitor)
+            database.close()
+            for binding, name in names.items():
+                if name != binding.name and binding.name in binding.scope.declared:
+                    self.given[binding.scope][binding.name] = name
+                self.selection[binding.scope].pop(binding.name, None)
+
+        self.rules = RuleEngine(self.ast) if rules else None
+        if self.rules:
+            for scope in self.scopes:
+                for var in list(self.selection[scope]):
+                    new_var = self.rules.name(scope.bindings[var])
+                    if new_var:
+                        self.given[scope][var] = new_var
+                        del self.selection[scope][var]
+
+        self.checkpoint = Checkpoint(os.path.join(self.output_folder, "checkpoint.json"), self.program)
+        self.cache = PredictionCache(cache_file) if cache_file else None
+        self.metrics = Metrics(os.path.join(self.output_folder, "metrics.jsonl"), prometheus_file)
+        self.model: Model = Model(parallel=parallel, cache=self.cache, backend=backend, metrics=self.metrics, structured=structured)
+        self.batch: bool = batch
+        # Scopes fitting in the context budget are rewritten at once with their nested scopes
+        self.transform: bool = transform
+        # Contexts of the variables asked one by one reduced to their def-use slice
+        self.slicer = Slicer(self.visitor) if slicing else None
+        self.writer = Writer(os.path.join(self.output_folder, "output.js"), self.render, save_interval, save_every)
+
+        # No new scope is started once 'budget' variables have been predicted or after 'time_budget' seconds
+        self.budget: int | None = budget
+        self.time_budget: float | None = time_budget
+        self.spent: int = 0
+        self.started: float = time.monotonic()
+        self.schedule: list[Scope] = self.plan()
+
+        # Copies of a function take the names given to the first one scheduled
+        self.duplicates: dict[Scope, tuple[Scope, dict[str, str]]] = find_duplicates(self.visitor, self.schedule)
+        self.reused: int = 0
+        self.skipped: int = 0
+
+        if resume and self.checkpoint.load():
+            self.replay()
 
-    def save(self, output: str, file: str):
-        with open(os.path.join(self.output_folder, file), 'w') as file:
-            file.write(output)
+        total = sum(len(self.selection[scope]) + len(self.given[scope]) for scope in self.scopes)
+        self.progress_bar = tqdm.tqdm(total=total, initial=self.checkpoint.progress)
 
-        print(f"Saved {file}")
+    def render(self) -> str:
+        return self.visitor.render(self.program)
+
+    def replay(self):
+        # Renames of the previous run are re-applied in the order the scopes were completed
+        for position in self.checkpoint.order:
+            if position in self.checkpoint.renames:
+                self.scopes[position].change_names(self.visitor, self.checkpoint.renames[position])
+        print(f"Resuming with {len(self.checkpoint.completed)} / {len(self.scopes)} scopes done")
+
+    def plan(self) -> list[Scope]:
+        """Scopes by decreasing impact of their names, in traversal order for equal impacts.
+        In transform mode, the scopes of a chunk are kept together."""
+        units: list[tuple[float, list[Scope]]] = []
+        stack = [self.visitor.global_scope]
+        while stack:
+            scope = stack.pop()
+            if self.transform and scope.get_tokens() <= self.model.context_budget:
+                unit = list(scope)
+            else:
+                unit = [scope]
+                stack.extend(reversed(scope.children))
+            units.append((sum(sum(self.selection[current].values()) for current in unit), unit))
+
+        units.sort(key=lambda unit: -unit[0])
+        return [scope for impact, unit in units for scope in unit]
+
+    def exhausted(self) -> bool:
+        if self.budget is not None and self.spent >= self.budget:
+            return True
+        return self.time_budget is not None and time.monotonic() - self.started >= self.time_budget
+
+    def predict_scope(self, scope: Scope, names: list[str], declared: set) -> Iterator[tuple[str, str]]:
+        if not names:
+            return
+
+        with self.metrics.span('context', *names):
+            enclosing = scope.get_enclosing(self.model.context_budget)
+            batch = self.batch and len(names) > 1 and enclosing.get_tokens() <= self.model.context_budget
+            code = enclosing.get_code() if batch else None
+        if batch:
+            # The whole code fits, all names are asked at once
+            predictions = self.model.predict_batch(names, code, declared)
+            for var in names:
+                yield var, predictions[var]
+            return
+
+        queries: list[tuple[str, str]] = []
+        for var in names:
+            with self.metrics.span('context', var):
+                if self.slicer:
+                    context = self.slicer.get_context(scope, var, self.model.context_budget)
+                else:
+                    context = scope.get_context(self.model, self.model.context_budget, var)
+            if context:
+                queries.append((var, context))
+            else:
+                print(f"Could not find context for {var}")
 
-    def save_thread(self, file: str):
-        threading.Thread(target=self.save, args=(escodegen.generate(self.visitor.ast), file)).start()
+        accepted: set[str] = set()
+        for (var, context), new_var in zip(queries, self.model.predict_many(queries, declared)):
+            if new_var != var and new_var in accepted:
+                # Predicted concurrently with another variable of this scope
+                new_var = self.model.predict(var, context, declared | accepted)
+            accepted.add(new_var)
+            yield var, new_var
 
     def desobfuscate(self, scope: Scope = None) -> str:
         if not scope:
-            self.save_thread(f"output.js")
+            self.writer.submit()
             scope = self.visitor.global_scope
-        
+        self.started = time.monotonic()
+
         code = scope.get_code()
-        if len(code) > 1000000000:
-            ast, changes = self.model.transform(code)
-            for var, new_name in changes.items():
-                scope.change_name(self.visitor, var, new_name)
-            # scope.replace_ast(self.visitor, ast)
+        # Scopes by impact, or in traversal order for a part of the code
+        exhausted = False
+        for current_scope in self.schedule if scope == self.visitor.global_scope else scope:
+            if not exhausted and self.exhausted():
+                print(f"Budget exhausted after {self.spent} variables")
+                exhausted = True
+            if exhausted and self.selection[current_scope]:
+                # Names given without the model are still applied
+                self.apply_given(current_scope)
+                continue
+            self.desobfuscate_scope(current_scope, exhausted)
+
+        if scope == self.visitor.global_scope:
+            with self.metrics.span('save'):
+                self.checkpoint.save()
+                self.writer.flush()
+            self.metrics.flush(final=True)
+            if self.cache:
+                print(f"[CACHE]: {self.cache.stats()}")
+            if self.duplicates:
+                print(f"[DUPLICATES]: {self.reused} names reused from the copies of a function, {self.skipped} scopes without request")
+            if self.coverage:
+                libraries = ", ".join(f"{library} {characters / len(self.program):.1%}" for library, characters in self.coverage.most_common())
+                print(f"[LIBRARIES]: {libraries} of the code")
+            if self.rules:
+                print(f"[RULES]: {sum(self.rules.stats.values())} names without the model {dict(self.rules.stats)}")
+            print(self.metrics.summary())
+            return code
+
+    def desobfuscate_scope(self, scope: Scope, exhausted: bool = False):
+        position = self.positions[scope]
+        self.metrics.scope = position
+        if position in self.checkpoint.completed:
+            pass # Already renamed by a previous run, or with an enclosing chunk
+        elif self.transform and not exhausted and scope.get_tokens() <= self.model.context_budget and self.transform_chunk(scope, position):
+            pass
         else:
-            print(f"Code too long: {len(code)} chars")
-            for var in scope.declared:
-                if len(var) >= 3: # Assuming no obfuscated names with more than 3 characters
-                    continue
+            pending = self.checkpoint.start_scope(position)
 
-                context = scope.get_context(self.model, self.model.context_size, var)
-                if context:
-                    new_var = self.model.predict(var, context, scope.declared)
-                    if new_var != var:
-                        scope.change_name(self.visitor, var, new_var)
+            # Renames of a scope are collected and applied together, the most used names first
+            names = [var for var in self.selection[scope] if var in scope.declared and var not in pending]
+            changes: dict[str, str] = {var: new_var for var, new_var in pending.items() if new_var != var}
+            given = {var: new_var for var, new_var in self.given[scope].items() if var in scope.declared and var not in pending}
+            shared = self.shared_names(scope, names)
+            for var, new_var in (given | shared).items():
+                if new_var != var:
+                    changes[var] = new_var
+                self.checkpoint.add_prediction(var, new_var)
+                self.progress_bar.update(1)
 
-                    self.save_thread(f"output.js")
+            if shared:
+                self.reused += len(shared)
+                names = [var for var in names if var not in shared]
+                self.skipped += not names
+            self.spent += len(names)
+            for var, new_var in self.predict_scope(scope, names, scope.declared | set(changes.values())):
+                if new_var != var:
+                    changes[var] = new_var
 
-                    self.progress_bar.update(1)
+                self.checkpoint.add_prediction(var, new_var)
+                self.progress_bar.update(1)
 
-                else:
-                    print(f"Could not find context for {var}")
+            with self.metrics.span('rename', *changes):
+                applied = scope.change_names(self.visitor, changes) if changes else {}
+            with self.metrics.span('save', *applied):
+                if applied:
+                    self.writer.update(len(applied))
+                self.checkpoint.complete_scope(position, applied)
+            self.metrics.flush()
 
-        for child in scope.children:
-            self.desobfuscate(child)
+    def apply_given(self, scope: Scope):
+        """Rename a scope left to the model with the names given without it. The scope is
+        not completed, so that a resumed run with a larger budget asks for the others."""
+        if self.positions[scope] in self.checkpoint.completed:
+            return
+        changes = {var: new_var for var, new_var in self.given[scope].items() if var in scope.declared}
+        with self.metrics.span('rename', *changes):
+            applied = scope.change_names(self.visitor, changes) if changes else {}
+        if applied:
+            self.writer.update(len(applied))
+        self.progress_bar.update(len(changes))
 
-        if scope == self.visitor.global_scope:
-            return code
\ No newline at end of file
+    def shared_names(self, scope: Scope, names: list[str]) -> dict[str, str]:
+        """Names of 'names' given by the copy of this function completed first."""
+        if scope not in self.duplicates:
+            return {}
+        original, sources = self.duplicates[scope]
+        position = self.positions[original]
+        if position not in self.checkpoint.completed:
+            return {}
+
+        renames = self.checkpoint.renames.get(position, {})
+        shared = {}
+        for var in names:
+            source = sources.get(var)
+            if source in renames:
+                shared[var] = renames[source]
+            elif source in self.selection[original]:
+                # Kept by the model
+                shared[var] = var
+        return shared
+
+    def transform_chunk(self, scope: Scope, position: int, attempts: int = 2) -> bool:
+        """Rename the short names of 'scope' and of its nested scopes with a single request
+        rewriting its code. The answer is only used when it parses with the same structure,
+        and then only for the names given to the bindings, applied through the scope tree.
+        Returns False if no answer was usable, the scopes are then handled one by one."""
+        subtree = list(scope)
+        if any(self.positions[current] in self.checkpoint.completed for current in subtree):
+            return False
+        if scope in self.duplicates and self.positions[self.duplicates[scope][0]] in self.checkpoint.completed:
+            return False # Named after its original scope by scope
+
+        vars = sorted({var for current in subtree for var in self.selection[current] if var in current.declared})
+        code = scope.get_code()
+        names = None
+        if vars:
+            self.spent += len(vars)
+            error = None
+            with self.metrics.span('transform', *vars), self.metrics.track(*vars):
+                for attempt in range(attempts):
+                    rewritten = self.model.transform(code, 3 * scope.get_tokens() + 200, error)
+                    try:
+                        names = align_identifiers(scope.node, code, rewritten)
+                        break
+                    except ValueError as e:
+                        error = str(e)
+                        print(f"Rejected rewrite: {error}")
+            if names is None:
+                return False
+
+        # Scopes of the chunk are consecutive in traversal order
+        for offset, current in enumerate(subtree):
+            self.checkpoint.start_scope(position + offset)
+            changes: dict[str, str] = {}
+            for var in self.selection[current]:
+                if var not in current.declared:
+                    continue
+                # Names are only taken when every reference to the binding agrees
+                proposals = {names.get(id(node)) for node in current.bindings[var].references} - {None}
+                new_var = proposals.pop() if len(proposals) == 1 else var
+                if new_var != var and self.model.is_valid_name(new_var):
+                    changes[var] = new_var
+                self.checkpoint.add_prediction(var, changes.get(var, var))
+                self.progress_bar.update(1)
+            for var, new_var in self.given[current].items():
+                if var in current.declared:
+                    changes[var] = new_var
+                    self.checkpoint.add_prediction(var, new_var)
+                    self.progress_bar.update(1)
+
+            with self.metrics.span('rename', *changes):
+                applied = current.change_names(self.visitor, changes) if changes else {}
+            with self.metrics.span('save', *applied):
+                if applied:
+                    self.writer.update(len(applied))
+                self.checkpoint.complete_scope(position + offset, applied)
+        self.metrics.flush()
+        return True
@@ -0,0 +1,98 @@
+import hashlib
+
+from esprima.nodes import *
+
+from src.visitor import FUNCTIONS, Binding, Scope, Visitor
+
+SKIPPED = {'type', 'range', 'loc', 'raw'}
+
+def binding_index(visitor: Visitor) -> dict[int, Binding]:
+    # Binding of every bound identifier
+    return {id(node): binding for scope in visitor.global_scope for binding in scope.bindings.values() for node in binding.references}
+
+def normalize(node: Node) -> Node:
+    # Literals shortened by minifiers: !0, !1 and void 0
+    if node.type == Syntax.UnaryExpression and node.argument.type == Syntax.Literal and type(node.argument.value) in (int, float):
+        if node.operator == '!' and node.argument.value in (0, 1):
+            return Literal(not node.argument.value, 'true' if not node.argument.value else 'false')
+        if node.operator == 'void' and node.argument.value == 0:
+            return Identifier('undefined')
+    return node
+
+def fingerprint(scope: Scope, bindings: dict[int, Binding], limit: int = 5000, minimum: int = 0) -> tuple[str, list[Binding]] | None:
+    """Hash of the AST of 'scope' where the bindings declared in it are replaced by
+    their order of first use and the bindings of enclosing scopes by theirs, so that
+    copies of a function differing only by their names, and by being declared or
+    not, share it. Returns the hash with the bindings declared inside in that order,
+    or None past 'limit' nodes."""
+    inner = {id(binding) for current in scope for binding in current.bindings.values()}
+    order: dict[int, int] = {}
+    outer: dict[int, int] = {}
+    declared: list[Binding] = []
+
+    digest = hashlib.sha1()
+    stack = [scope.node]
+    count = 0
+    while stack:
+        node = normalize(stack.pop())
+        count += 1
+        if count > limit:
+            return None
+
+        # Declarations and expressions of a function are copies
+        root = node is scope.node
+        parts = ['function' if root else node.type]
+        children = []
+        for field, value in node.__dict__.items():
+            if field in SKIPPED or root and field == 'id':
+                continue
+            if isinstance(value, Node):
+                parts.append(field)
+                children.append(value)
+            elif isinstance(value, list):
+                # Holes of arrays are part of the structure
+                parts.append(field + "".join('_' if child is None else '.' for child in value))
+                children.extend(child for child in value if isinstance(child, Node))
+            elif field == 'name' and node.type == Syntax.Identifier:
+                binding = bindings.get(id(node))
+                if binding is None:
+                    # Globals and property names
+                    parts.append(value)
+                elif id(binding) in inner:
+                    if id(binding) not in order:
+                        order[id(binding)] = len(order)
+                        declared.append(binding)
+                    parts.append(f"#{order[id(binding)]}")
+                else:
+                    parts.append(f"@{outer.setdefault(id(binding), len(outer))}")
+            else:
+                parts.append(f"{field}={value!r}")
+
+        digest.update("\0".join(parts).encode())
+        digest.update(b"\1")
+        stack.extend(reversed(children))
+
+    if count < minimum:
+        return None
+    return digest.hexdigest(), declared
+
+def find_duplicates(visitor: Visitor, scopes: list[Scope], limit: int = 5000) -> dict[Scope, tuple[Scope, dict[str, str]]]:
+    """Copies of the function scopes of 'scopes', which are compared in this order so
+    that the first one is the original. Maps every scope of a copy to the matching
+    scope of the original with the names of its bindings in the original."""
+    bindings = binding_index(visitor)
+    originals: dict[str, list[Binding]] = {}
+    duplicates: dict[Scope, tuple[Scope, dict[str, str]]] = {}
+    for scope in scopes:
+        if scope.node is None or scope.node.type not in FUNCTIONS or scope in duplicates:
+            continue
+        result = fingerprint(scope, bindings, limit)
+        if result is None:
+            continue
+        key, declared = result
+        if key not in originals:
+            originals[key] = declared
+            continue
+        for copy, original in zip(declared, originals[key]):
+            duplicates.setdefault(copy.scope, (original.scope, {}))[1][copy.name] = original.name
+    return duplicates
@@ -1,7 +1,14 @@
-import ollama
-import esprima
 import re
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+
+from src.cache import PredictionCache
+from src.backend import Backend, OllamaBackend
+from src.metrics import Metrics
+from src.stream import JsonScanner
 
 class Model:
     NOT_ALLOWED = [
@@ -12,70 +19,271 @@ class Model:
         'switch', 'case', 'throw', 'try', 'catch', 'finally'
     ]
     system_prompt: str = "You are a specialist in Javascript Desobfuscation."
+    # Bump when the predict prompt changes so that cached names are not reused
+    prompt_version: int = 2
 
-    def __init__(self, model: str = 'llama3.2'):
+    def __init__(self, model: str = 'llama3.2', parallel: int = None, cache: PredictionCache = None, backend: Backend = None, metrics: Metrics = None, structured: bool = False):
         self.model = model
+        self.cache: PredictionCache | None = cache
+        self.backend: Backend = backend or OllamaBackend()
+        self.metrics: Metrics = metrics or Metrics()
         self.context_size = 4096
+        # Tokens of code sent as context, leaving room for the prompt and the answer
+        self.context_budget = 1024
         self.context: str = ""
+        # Answers constrained by a JSON schema instead of asked in a ```json block
+        self.structured: bool = structured
+
+        # Requests in flight, should match OLLAMA_NUM_PARALLEL on the server
+        self.parallel: int = parallel or int(os.environ.get('OLLAMA_NUM_PARALLEL', 1))
+        self.executor = ThreadPoolExecutor(max_workers=self.parallel) if self.parallel > 1 else None
+        # Streams of concurrent requests would be interleaved
+        self.verbose: bool = self.parallel == 1
 
     def clear_context(self):
         self.context = ""
 
-    def generate(self, prompt: str, num_predict: int) -> str:
-        print(prompt)
-        stream = ollama.generate(self.model, prompt, system=self.system_prompt, options={'num_predict': num_predict, 'num_ctx': self.context_size}, stream=True)
+    def generate(self, prompt: str, num_predict: int, complete: Callable[[str], bool] = None, format: dict = None, language: str = 'json') -> str:
+        """Stream a response, stopped at the end of its ```'language' block, or as soon as a JSON
+        object for which 'complete' is true closes. Closing the stream drops the connection,
+        which makes Ollama stop decoding. 'format' is a JSON schema the response follows."""
+        if self.verbose:
+            print(prompt)
+        start = time.perf_counter()
+        stream = self.backend.generate(self.model, prompt, self.system_prompt, {'num_predict': num_predict, 'num_ctx': self.context_size}, format)
 
-        response = ''
-        print("[LLM]")
+        response: list[str] = []
+        scanner = JsonScanner(language)
+        stats = {}
+        tokens = 0
+        first_token = None
+        if self.verbose:
+            print("[LLM]")
         for chunk in stream:
             if chunk['done']:
-                self.context = chunk['context']
-                print(f"\nPrompt Size: {chunk['prompt_eval_count']} | Eval Count: {chunk['eval_count']}")
+                self.context = chunk.get('context')
+                stats = chunk
+                if self.verbose:
+                    print(f"\nPrompt Size: {chunk.get('prompt_eval_count')} | Eval Count: {chunk.get('eval_count')}")
             data = chunk['response']
-            response += data
+            response.append(data)
+            # Ollama streams a token per chunk
+            tokens += 1 if data else 0
+            if data and first_token is None:
+                first_token = time.perf_counter() - start
+
+            if self.verbose:
+                print(data, end='', flush=True)
 
-            if re.search(r"\`\`\`json([\s\S]*?)\`\`\`", response):
-                print('stopping')
+            objects = scanner.feed(data)
+            if scanner.fenced or (complete and any(complete(text) for text in objects)):
                 break
 
-            print(data, end='', flush=True)
+        saved = 0
+        if not stats:
+            # At most 'num_predict' tokens would have been generated
+            saved = max(num_predict - tokens, 0)
+            if hasattr(stream, 'close'):
+                stream.close()
+            if self.verbose:
+                print(f"\nstopping, saved up to {saved} tokens")
 
-        return response
+        self.metrics.add_generation(stats, tokens, saved, first_token)
+        return "".join(response)
+
+    def load_json(self, text: str):
+        return json.loads(text.replace("'", '"'))
+
+    def extract_json(self, response: str) -> str:
+        # Early stops may leave a ```json block open, or end before any block
+        scanner = JsonScanner()
+        scanner.feed(response)
+        if scanner.fenced:
+            return response.split('```json')[1].split('```')[0]
+        if scanner.objects:
+            return scanner.objects[-1]
+        return response.split('```')[1].split('```')[0]
+
+    def answers(self, text: str, keys: list[str]) -> bool:
+        """Whether 'text' is a JSON object giving a valid name for each of 'keys'."""
+        try:
+            names = self.load_json(text)
+        except ValueError:
+            return False
+        if not isinstance(names, dict):
+            return False
+        return all(isinstance(names.get(key), str) and self.is_valid_name(names[key].replace(' ', '_')) for key in keys)
+
+    def predict_many(self, queries: list[tuple[str, str]], declared: set) -> Iterator[str]:
+        """Predict the names of several (var, context) queries, up to 'parallel' at once.
+        Names are yielded in query order as soon as they are known. Concurrent predictions
+        only know the names in 'declared', so the caller has to check them against each other.
+        The first query runs alone only when others share its context, as the cached prefix
+        is of no use to queries with a window or slice of their own."""
+        if not self.executor:
+            names = set()
+            for var, context in queries:
+                name = self.predict(var, context, declared | names)
+                names.add(name)
+                yield name
+            return
+
+        futures = []
+        if len(queries) > 1 and any(context == queries[0][1] for var, context in queries[1:]):
+            # Evaluated once before the others start, the shared code is cached for them
+            var, context = queries[0]
+            futures.append(self.executor.submit(self.predict, var, context, declared))
+            futures[0].result()
+        futures += [self.executor.submit(self.predict, var, context, declared) for var, context in queries[len(futures):]]
+        for future in futures:
+            yield future.result()
 
-    def transform(self, code):
+    def transform(self, code: str, num_predict: int, error: str = None) -> str:
+        """Recopy 'code' with readable names, the caller checks that nothing else changed.
+        'error' tells why the previous answer was rejected."""
         self.clear_context()
-        prompt = f"Read the following Javascript code and recopy it while only changing the variable name to make them more readable and meaningful.\n\n```javascript{code}``` When done, give me a JSON object indicating all the variable names that have been changed in this format:\n\n```json\n{{'old_name': 'new_name', 'old_name2': 'new_name2', 'old_name3': 'new_name3'...}}\n```Make sure you haven't forgotten to include any names.\n\n"
-        response = self.generate(prompt, len(code) + 500)
-        transformed_code = response.split('```javascript')[1].split('```')[0]
-        changes = response.split('```json')[1].split('```')[0]
-        
-        while True:
-            try:
-                ast = esprima.parseScript(transformed_code)
-                break
-            except esprima.Error as e:
-                print("Parsing error:", e)
-                prompt = f"This javascript code is not valid. Please rewrite it and fix the following error:\n\nError: {e}\n\n```javascript{transformed_code}```"
-                response = self.generate(prompt, len(code) + 200)
+        prompt = self.code_prompt(code) + "Recopy this code while only changing the names of its variables, functions and parameters to make them more readable and meaningful. Do not change anything else: keep the properties, strings, comments and structure as they are. Answer with the code only, in a ```javascript block."
+        if error:
+            prompt += f"\nYour previous answer was rejected because {error}."
+        response = self.generate(prompt, num_predict, language='javascript')
+
+        if '```javascript' in response:
+            return response.split('```javascript')[1].split('```')[0]
+        if response.count('```') >= 2:
+            return response.split('```')[1].split('```')[0]
+        return response
+
+    def is_valid_name(self, name) -> bool:
+        return isinstance(name, str) and re.fullmatch(r"[A-Za-z_$][\w$]*", name) is not None and name not in self.NOT_ALLOWED
+
+    def code_prompt(self, context: str) -> str:
+        # Prompts start with the code and end with the question, so that the requests sent with
+        # the same context share a prefix whose evaluation Ollama keeps cached. Only the variables
+        # of a scope fitting in the budget and asked one by one, and the retries, share it
+        return f"Here is a piece of Javascript code:\n\n```javascript\n{context}\n```\n\n"
+
+    def name_schema(self, keys: list[str]) -> dict:
+        identifier = {'type': 'string', 'pattern': r"^[A-Za-z_$][A-Za-z0-9_$]*$"}
+        return {
+            'type': 'object',
+            'properties': {key: identifier for key in keys},
+            'required': list(keys),
+        }
+
+    def parse_names(self, response: str) -> dict:
+        try:
+            names = self.load_json(self.extract_json(response))
+        except (IndexError, ValueError) as e:
+            print("JSON error:", e)
+            return {}
+        return names if isinstance(names, dict) else {}
+
+    def predict_batch(self, vars: list[str], context: str, declared: set, attempts: int = 3) -> dict[str, str]:
+        """Predict the names of all 'vars' of a scope whose code is 'context' in a single request.
+        Only missing, invalid or conflicting entries are asked again, and the ones still
+        missing after 'attempts' requests are predicted one by one."""
+        names: dict[str, str] = {}
+        keys: dict[str, str] = {}
+        if self.cache:
+            for var in vars:
+                keys[var] = self.cache.key(self.model, self.prompt_version, var, context)
+                name = self.cache.get(keys[var])
+                if name and (name == var or (name not in declared and name not in names.values())):
+                    names[var] = name
+                    self.metrics.set_cached(var)
+        cached = set(names)
+
+        remaining = [var for var in vars if var not in names]
+        attempt = 0
+        while remaining and attempt < attempts:
+            attempt += 1
+            self.clear_context()
+            taken = sorted(declared | set(names.values()))
+            listed = ", ".join(f"`{var}`" for var in remaining)
+            example = ", ".join(f"'{var}': '<newName>'" for var in remaining)
+            if attempt == 1:
+                prompt = self.code_prompt(context) + f"Predict the original names of the variables/functions {listed} of this code before obfuscation. If the context is unclear, give names which are the more meaningful possible to make the code more readable. If a variable/function already makes sense, keep its name.\n\nEach new name must be unique and must not be one of these names already used in the code: {', '.join(taken)}.\nIMPORTANT: You absolutely need to terminate by summarizing your response in this JSON format which indicates the new name of each variable/function: \n\n```json\n{{{example}}}\n```"
+            else:
+                prompt = self.code_prompt(context) + f"Some names were missing, invalid or already used. Give new names only for the variables/functions {listed} of this code.\n\nEach new name must be unique and must not be one of these names already used in the code: {', '.join(taken)}.\nAnswer in this JSON format: \n\n```json\n{{{example}}}\n```"
+            # Tokens and time of a request are shared by the variables it asks for
+            format = self.name_schema(remaining) if self.structured else None
+            with self.metrics.span('predict', *remaining), self.metrics.track(*remaining):
+                response = self.generate(prompt, 20 * len(remaining) + 300, lambda text: self.answers(text, remaining), format)
+
+            proposals = self.parse_names(response)
+            for var in remaining:
+                name = proposals.get(var)
+                if isinstance(name, str):
+                    name = name.replace(' ', '_')
+                if not self.is_valid_name(name):
+                    continue
+                if name != var and (name in declared or name in names.values()):
+                    continue
+                names[var] = name
+            remaining = [var for var in vars if var not in names]
+
+        for var in remaining:
+            with self.metrics.span('predict', var), self.metrics.track(var):
+                names[var] = self.predict_model(var, context, declared | set(names.values()))
+
+        if self.cache:
+            for var, name in names.items():
+                if var not in cached and name != "failedAttempt":
+                    self.cache.put(keys[var], name)
+        return names
+
+    def predict(self, var: str, context: str, declared: set):
+        if not self.cache:
+            with self.metrics.span('predict', var), self.metrics.track(var):
+                return self.predict_model(var, context, declared)
+
+        key = self.cache.key(self.model, self.prompt_version, var, context)
+        name = self.cache.get(key)
+        if name and (name == var or name not in declared):
+            self.metrics.set_cached(var)
+            return name
+
+        with self.metrics.span('predict', var), self.metrics.track(var):
+            name = self.predict_model(var, context, declared)
+        if name != "failedAttempt":
+            self.cache.put(key, name)
+        return name
+
+    def predict_structured(self, var: str, context: str, declared: set, attempts: int = 3) -> str:
+        """Predict with the answer constrained to {"name": identifier}, so that it always
+        parses. Only reserved or already declared names are asked again."""
+        schema = self.name_schema(['name'])
+        complete = lambda text: self.answers(text, ['name'])
+        rejected: list[str] = []
+        for attempt in range(attempts):
+            self.clear_context()
+            prompt = self.code_prompt(context) + f"Predict the original name of the variable/function `{var}` of this code before obfuscation. If the context is unclear, give the most meaningful name possible. However, many variables haven't been obfuscated: if the variable/function `{var}` makes sense, return the same name.\n\nAnswer with a JSON object giving the new name of `{var}`: {{\"name\": \"<myNewName>\"}}"
+            if rejected:
+                prompt += f"\nThese names are already used or reserved, give another one: {', '.join(rejected)}."
+            response = self.generate(prompt, 50, complete, schema)
 
-                transformed_code = response.split('```javascript')[1].split('```')[0]
-        
-        while True:
             try:
-                json.loads(changes)
-                break
-            except json.JSONDecodeError as e:
+                name = self.load_json(self.extract_json(response)).get('name')
+            except (IndexError, ValueError, AttributeError) as e:
                 print("JSON error:", e)
-                prompt = f"This javascript code is not valid. Please rewrite it and fix the following error:\n\nError: {e}\n\n```javascript{changes}```"
-                response = self.generate(prompt, len(code) + 200)
+                continue
+            if isinstance(name, str):
+                name = name.replace(' ', '_')
+            if self.is_valid_name(name) and (name == var or name not in declared):
+                return name
+            if isinstance(name, str):
+                rejected.append(name)
+
+        return "failedAttempt"
+
+    def predict_model(self, var: str, context: str, declared: set):
+        if self.structured:
+            return self.predict_structured(var, context, declared)
 
-                transformed_code = response.split('```javascript')[1].split('```')[0]
-        return ast, json.loads(changes)
-    
-    def predict(self, var: str, context: str, declared: set):
         self.clear_context()
-        prompt = f"Given the following piece of code, predict the original name of the variable/function `{var}` before obfuscation. If the context is unclear, give me a name which is the more meaningful possible to make it more readable. However, many variables haven't been obfuscated: if the variable/function `{var}` make sense, return the same name.\nMake sure the new name isn't already used in the code by another variable or function !\n\nHere some examples where the variable/function `{var}` appears:\n\n```javascript{context}```\n\nDon't give multiple proposals. Make sure the new name isn't already used in the code by another variable or function ! Think before predicting. IMPORTANT: You absolutely need to terminate by summarizing your response in this JSON format which indicates the new name of the variable/function `{var}`: \n\n```json\n{{'name': '<myNewName>'}}\n```"
-        response = self.generate(prompt, 300)
+        prompt = self.code_prompt(context) + f"Predict the original name of the variable/function `{var}` of this code before obfuscation. If the context is unclear, give me a name which is the more meaningful possible to make it more readable. However, many variables haven't been obfuscated: if the variable/function `{var}` make sense, return the same name.\nMake sure the new name isn't already used in the code by another variable or function !\n\nDon't give multiple proposals. Think before predicting. IMPORTANT: You absolutely need to terminate by summarizing your response in this JSON format which indicates the new name of the variable/function `{var}`: \n\n```json\n{{'name': '<myNewName>'}}\n```"
+        complete = lambda text: self.answers(text, ['name'])
+        response = self.generate(prompt, 300, complete)
 
         attempt = 0
         while True:
@@ -83,12 +291,7 @@ class Model:
                 if attempt > 6:
                     return "failedAttempt"
                 attempt += 1
-                if '```json' in response:
-                    formated_response = response.split('```json')[1].split('```')[0].replace("'", '"')
-                else:
-                    formated_response = response.split('```')[1].split('```')[0].replace("'", '"')
-
-                name = json.loads(formated_response)
+                name = self.load_json(self.extract_json(response))
                 if isinstance(name, json.JSONDecodeError):
                     raise name
                 if not 'name' in name:
@@ -103,15 +306,15 @@ class Model:
                 break
             except ValueError as e:
                 print("JSON error:", e)
-                prompt = f"Your JSON response is not valid. Please rewrite it in the format: \n```json\n{{'name': '<myNewName>'}}\n```Ensure you have specified the 'name' field.\nThe new name for the variable/function `{var}` need to be more meaningful and not already used in the code.\nAnd fix the following error:\nError: {e}\n\nHere is the code where the variable/function `{var}` appears:\n\n```\ncjavascript{context}\n```"
-                response = self.generate(prompt, 50)
+                prompt = self.code_prompt(context) + f"Your JSON response is not valid. Please rewrite it in the format: \n```json\n{{'name': '<myNewName>'}}\n```Ensure you have specified the 'name' field.\nThe new name for the variable/function `{var}` of this code need to be more meaningful and not already used in the code.\nAnd fix the following error:\nError: {e}"
+                response = self.generate(prompt, 50, complete)
             except IndexError as e:
                 print("Index error:", e)
-                prompt = f"Your JSON response is not valid. Please rewrite it in the format: \n```json\n{{'name': '<myNewName>'}}\n```Ensure you have specified the 'name' field.\nThe new name for the variable/function `{var}` need to be more meaningful and not already used in the code.\n\nHere is the code where the variable/function `{var}` appears:\n\n```javascript\n{context}\n```"
-                response = self.generate(prompt, 50)
+                prompt = self.code_prompt(context) + f"Your JSON response is not valid. Please rewrite it in the format: \n```json\n{{'name': '<myNewName>'}}\n```Ensure you have specified the 'name' field.\nThe new name for the variable/function `{var}` of this code need to be more meaningful and not already used in the code."
+                response = self.generate(prompt, 50, complete)
             except NameError as e:
                 print("Value error:", e)
-                prompt = f"The name `{name['name']}` has been already declared in the code. Please give a new similar name for the variable/function `{var}` and format your response using this format: \n```json\n{{'name': '<myNewName>'}}\n```Ensure you have specified the 'name' field.\nThe new name for the variable/function `{var}` need to be more meaningful and not already used in the code.\n\nHere is the code where the variable/function `{var}` appears:\n\n```javascript\n{context}\n```"
-                response = self.generate(prompt, 200)
+                prompt = self.code_prompt(context) + f"The name `{name['name']}` has been already declared in the code. Please give a new similar name for the variable/function `{var}` of this code and format your response using this format: \n```json\n{{'name': '<myNewName>'}}\n```Ensure you have specified the 'name' field.\nThe new name for the variable/function `{var}` need to be more meaningful and not already used in the code."
+                response = self.generate(prompt, 200, complete)
 
         return name_formated
\ No newline at end of file
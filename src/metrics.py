@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Shares of the requests summed over the variables, the durations returned by Ollama are in nanoseconds
+COUNTERS = [
+    'prompt_tokens', 'eval_tokens', 'saved_tokens',
+    'load_duration', 'prompt_eval_duration', 'eval_duration', 'total_duration', 'first_token_seconds'
+]
+DURATIONS = {
+    'load_duration': 'load',
+    'prompt_eval_duration': 'prompt_eval',
+    'eval_duration': 'eval',
+    'total_duration': 'total',
+}
+
+class Metrics:
+    """Per-variable spans of a run: time spent building contexts, renaming and saving,
+    and the tokens, durations and retries of the model requests. Records of a scope are
+    appended to a JSONL file when the scope is done, the totals can be printed as a
+    table or written as a Prometheus textfile."""
+
+    def __init__(self, file: str = None, prometheus_file: str = None, interval: float = 10.0):
+        self.file: str | None = file
+        self.prometheus_file: str | None = prometheus_file
+        self.interval: float = interval
+        self.last_write: float = time.monotonic()
+
+        self.scope: int = 0
+        self.records: dict[tuple[int, str], dict] = {}
+        self.stages: dict[str, list[float]] = {}
+        self.totals: dict[str, float] = {counter: 0 for counter in COUNTERS}
+        self.requests: int = 0
+        self.stopped: int = 0
+        self.variables: int = 0
+        self.cached: int = 0
+        self.retries: int = 0
+        # Time to first token of the first request of a scope, and of the next ones which
+        # may reuse the evaluation of the code they share with it
+        self.first_tokens: dict[str, list[float]] = {'cold': [0, 0.0], 'warm': [0, 0.0]}
+        self.last_scope: int | None = None
+
+        # Model requests run on a thread pool, each thread tracks its own variables
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def record(self, var: str) -> dict:
+        with self.lock:
+            key = (self.scope, var)
+            if key not in self.records:
+                self.records[key] = {'scope': self.scope, 'var': var, 'requests': 0, **{counter: 0 for counter in COUNTERS}}
+            return self.records[key]
+
+    @contextmanager
+    def track(self, *vars: str):
+        # Model requests made in this block are accounted to 'vars'
+        previous = getattr(self.local, 'records', None)
+        self.local.records = [self.record(var) for var in vars]
+        try:
+            yield self.local.records
+        finally:
+            self.local.records = previous
+
+    @contextmanager
+    def span(self, stage: str, *vars: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                total = self.stages.setdefault(stage, [0, 0.0])
+                total[0] += 1
+                total[1] += elapsed
+            # Shared by the variables of a batch
+            for var in vars:
+                record = self.record(var)
+                record[f"{stage}_seconds"] = record.get(f"{stage}_seconds", 0.0) + elapsed / len(vars)
+
+    def add_generation(self, chunk: dict, tokens: int = 0, saved: int = 0, first_token: float = None):
+        """Account a request to the tracked variables. Requests stopped early have no
+        statistics, their 'tokens' received are counted instead, and up to 'saved' more
+        tokens would have been generated. 'first_token' is the time to the first token."""
+        records = getattr(self.local, 'records', None)
+        if not records:
+            return
+
+        values = {
+            'prompt_tokens': chunk.get('prompt_eval_count') or 0,
+            'eval_tokens': chunk.get('eval_count') or tokens,
+            'saved_tokens': saved,
+            'first_token_seconds': first_token or 0.0,
+        }
+        for duration in DURATIONS:
+            values[duration] = chunk.get(duration) or 0
+
+        with self.lock:
+            self.requests += 1
+            self.stopped += 1 if not chunk else 0
+            if first_token is not None:
+                first_tokens = self.first_tokens['warm' if self.scope == self.last_scope else 'cold']
+                first_tokens[0] += 1
+                first_tokens[1] += first_token
+            self.last_scope = self.scope
+            for record in records:
+                # A variable asked again in another request has been retried
+                record['requests'] += 1
+                for counter, value in values.items():
+                    record[counter] += value / len(records)
+
+    def set_cached(self, var: str):
+        self.record(var)['cached'] = True
+
+    def flush(self, final: bool = False):
+        """Write and fold the records of the finished scopes into the totals."""
+        with self.lock:
+            records = list(self.records.values())
+            self.records = {}
+
+        lines = []
+        for record in records:
+            record['retries'] = max(record['requests'] - 1, 0)
+            for counter in COUNTERS:
+                self.totals[counter] += record[counter]
+            self.variables += 1
+            self.cached += 1 if record.get('cached') else 0
+            self.retries += record['retries']
+            lines.append(json.dumps(record))
+
+        if self.file and lines:
+            with open(self.file, 'a') as file:
+                file.write("\n".join(lines) + "\n")
+        if self.prometheus_file and (final or time.monotonic() - self.last_write >= self.interval):
+            self.write_prometheus()
+            self.last_write = time.monotonic()
+
+    def summary(self) -> str:
+        lines = [f"{'Stage':<16}{'Count':>10}{'Total (s)':>14}{'Mean (ms)':>14}"]
+        for stage, (count, seconds) in sorted(self.stages.items()):
+            lines.append(f"{stage:<16}{count:>10}{seconds:>14.3f}{1000 * seconds / count:>14.2f}")
+
+        variables = max(self.variables, 1)
+        lines.append("")
+        lines.append(f"{'Model':<16}{'Total':>10}{'Per variable':>14}")
+        lines.append(f"{'variables':<16}{self.variables:>10}{'':>14}")
+        lines.append(f"{'cached':<16}{self.cached:>10}{self.cached / variables:>14.2f}")
+        lines.append(f"{'requests':<16}{self.requests:>10}{self.requests / variables:>14.2f}")
+        lines.append(f"{'retries':<16}{self.retries:>10}{self.retries / variables:>14.2f}")
+        # Retries per variable sent to the model, to compare the prompting modes
+        predicted = self.variables - self.cached
+        lines.append(f"{'retry rate':<16}{'':>10}{self.retries / predicted if predicted else 0.0:>14.2f}")
+        lines.append(f"{'prompt tokens':<16}{round(self.totals['prompt_tokens']):>10}{self.totals['prompt_tokens'] / variables:>14.1f}")
+        lines.append(f"{'eval tokens':<16}{round(self.totals['eval_tokens']):>10}{self.totals['eval_tokens'] / variables:>14.1f}")
+        lines.append(f"{'stopped early':<16}{self.stopped:>10}{self.stopped / variables:>14.2f}")
+        lines.append(f"{'saved tokens':<16}{round(self.totals['saved_tokens']):>10}{self.totals['saved_tokens'] / variables:>14.1f}")
+        for duration, name in DURATIONS.items():
+            seconds = self.totals[duration] / 1e9
+            lines.append(f"{name + ' (s)':<16}{seconds:>10.1f}{seconds / variables:>14.3f}")
+
+        lines.append("")
+        lines.append(f"{'First token':<16}{'Requests':>10}{'Mean (ms)':>14}")
+        for prefix, (count, seconds) in self.first_tokens.items():
+            lines.append(f"{prefix:<16}{count:>10}{1000 * seconds / count if count else 0.0:>14.1f}")
+        return "\n".join(lines)
+
+    def write_prometheus(self):
+        lines = [
+            "# TYPE deobfuscator_stage_seconds_total counter",
+            *(f'deobfuscator_stage_seconds_total{{stage="{stage}"}} {seconds}' for stage, (count, seconds) in sorted(self.stages.items())),
+            "# TYPE deobfuscator_stage_count_total counter",
+            *(f'deobfuscator_stage_count_total{{stage="{stage}"}} {count}' for stage, (count, seconds) in sorted(self.stages.items())),
+            "# TYPE deobfuscator_model_seconds_total counter",
+            *(f'deobfuscator_model_seconds_total{{phase="{name}"}} {self.totals[duration] / 1e9}' for duration, name in DURATIONS.items()),
+            "# TYPE deobfuscator_first_token_seconds_total counter",
+            *(f'deobfuscator_first_token_seconds_total{{prefix="{prefix}"}} {seconds}' for prefix, (count, seconds) in self.first_tokens.items()),
+            "# TYPE deobfuscator_first_token_count_total counter",
+            *(f'deobfuscator_first_token_count_total{{prefix="{prefix}"}} {count}' for prefix, (count, seconds) in self.first_tokens.items()),
+            "# TYPE deobfuscator_variables_total counter",
+            f"deobfuscator_variables_total {self.variables}",
+            "# TYPE deobfuscator_cached_total counter",
+            f"deobfuscator_cached_total {self.cached}",
+            "# TYPE deobfuscator_requests_total counter",
+            f"deobfuscator_requests_total {self.requests}",
+            "# TYPE deobfuscator_retries_total counter",
+            f"deobfuscator_retries_total {self.retries}",
+            "# TYPE deobfuscator_prompt_tokens_total counter",
+            f"deobfuscator_prompt_tokens_total {round(self.totals['prompt_tokens'])}",
+            "# TYPE deobfuscator_eval_tokens_total counter",
+            f"deobfuscator_eval_tokens_total {round(self.totals['eval_tokens'])}",
+            "# TYPE deobfuscator_stopped_total counter",
+            f"deobfuscator_stopped_total {self.stopped}",
+            "# TYPE deobfuscator_saved_tokens_total counter",
+            f"deobfuscator_saved_tokens_total {round(self.totals['saved_tokens'])}",
+        ]
+
+        # Written atomically as the node exporter may read it at any time
+        temp = f"{self.prometheus_file}.tmp"
+        with open(temp, 'w') as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temp, self.prometheus_file)
@@ -0,0 +1,213 @@
+from collections import Counter
+
+from esprima.nodes import *
+
+from src.visitor import FUNCTIONS, Binding
+
+COUNTERS = ['i', 'j', 'k']
+
+class Index:
+    """Parent of every node of the AST with the field holding it, built once without
+    recursion, and the values each binding is defined with."""
+
+    def __init__(self, ast: Node):
+        self.parents: dict[int, tuple[Node, str, int | None]] = {}
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            for field, value in node.__dict__.items():
+                if isinstance(value, Node):
+                    self.parents[id(value)] = (node, field, None)
+                    stack.append(value)
+                elif isinstance(value, list):
+                    for position, child in enumerate(value):
+                        if isinstance(child, Node):
+                            self.parents[id(child)] = (node, field, position)
+                            stack.append(child)
+
+    def parent(self, node: Node) -> tuple[Node | None, str | None, int | None]:
+        return self.parents.get(id(node), (None, None, None))
+
+    def definitions(self, binding: Binding) -> list[Node]:
+        # Values assigned to the binding by its declaration and by plain assignments
+        values = []
+        for node in binding.references:
+            parent, field, _ = self.parent(node)
+            if parent is None:
+                continue
+            if parent.type == Syntax.VariableDeclarator and field == 'id' and parent.init is not None:
+                values.append(parent.init)
+            elif parent.type == Syntax.AssignmentExpression and field == 'left':
+                values.append(parent.right if parent.operator == '=' else parent)
+            elif parent.type == Syntax.UpdateExpression:
+                values.append(parent)
+        return values
+
+    def initializer(self, binding: Binding) -> Node | None:
+        # Only names holding a single value are named after it
+        values = self.definitions(binding)
+        return values[0] if len(values) == 1 else None
+
+    def parameter(self, binding: Binding) -> tuple[Node, int] | None:
+        # The function declaring 'binding' as a parameter, and its position
+        for node in binding.references:
+            parent, field, position = self.parent(node)
+            if parent is not None and parent.type in FUNCTIONS and field == 'params':
+                return parent, position
+        return None
+
+def method_call(node: Node | None, *methods: str) -> str | None:
+    # Name of the method called by 'node' if it is one of 'methods'
+    if node is None or node.type != Syntax.CallExpression or node.callee.type != Syntax.MemberExpression:
+        return None
+    callee = node.callee
+    if callee.computed or callee.property.type != Syntax.Identifier or callee.property.name not in methods:
+        return None
+    return callee.property.name
+
+def string_argument(node: Node, position: int = 0) -> str | None:
+    if len(node.arguments) > position and node.arguments[position].type == Syntax.Literal and isinstance(node.arguments[position].value, str):
+        return node.arguments[position].value
+    return None
+
+def camel_case(text: str) -> str:
+    words = [word for word in ''.join(char if char.isalnum() else ' ' for char in text).split() if word]
+    if not words:
+        return ''
+    name = words[0][0].lower() + words[0][1:] + ''.join(word[0].upper() + word[1:] for word in words[1:])
+    return name if not name[0].isdigit() else ''
+
+class Rule:
+    """Name a binding from how it is defined or used. 'match' returns the name with a
+    confidence between 0 and 1, or None when the rule does not apply."""
+
+    name: str = 'rule'
+
+    def match(self, binding: Binding, index: Index) -> tuple[str, float] | None:
+        raise NotImplementedError
+
+class DomFactoryRule(Rule):
+    name = 'dom'
+    TAGS = {'canvas': 'canvas', 'img': 'image', 'a': 'link', 'div': 'div', 'span': 'span', 'input': 'input', 'script': 'script', 'style': 'style', 'video': 'video', 'audio': 'audio', 'iframe': 'iframe'}
+
+    def match(self, binding, index):
+        value = index.initializer(binding)
+        method = method_call(value, 'createElement', 'getElementById', 'querySelector')
+        if method is None:
+            return None
+        argument = string_argument(value)
+        if method == 'createElement' and argument:
+            return self.TAGS.get(argument.lower(), camel_case(argument) + 'Element'), 0.9
+        if argument and camel_case(argument):
+            return camel_case(argument) + 'Element', 0.7
+        return 'element', 0.6
+
+class ContextRule(Rule):
+    name = 'context'
+
+    def match(self, binding, index):
+        value = index.initializer(binding)
+        if method_call(value, 'getContext') is None:
+            return None
+        argument = (string_argument(value) or '').lower()
+        return ('gl', 0.9) if 'webgl' in argument else ('context', 0.95)
+
+class EventListenerRule(Rule):
+    name = 'event'
+
+    def match(self, binding, index):
+        parameter = index.parameter(binding)
+        if parameter is None or parameter[1] != 0:
+            return None
+        function = parameter[0]
+        call, field, position = index.parent(function)
+        if field == 'arguments' and position == 1 and method_call(call, 'addEventListener', 'removeEventListener', 'on') is not None:
+            return 'event', 0.9
+        return None
+
+class PromiseRule(Rule):
+    name = 'promise'
+
+    def match(self, binding, index):
+        parameter = index.parameter(binding)
+        if parameter is None or parameter[1] > 1:
+            return None
+        function, position = parameter
+        call, field, argument = index.parent(function)
+        if field == 'arguments' and argument == 0 and call.type == Syntax.NewExpression and call.callee.type == Syntax.Identifier and call.callee.name == 'Promise':
+            return ('resolve', 'reject')[position], 0.95
+        return None
+
+class ConstructorRule(Rule):
+    name = 'new'
+    NAMES = {'XMLHttpRequest': 'xhr', 'Image': 'image', 'Date': 'date', 'RegExp': 'pattern', 'FileReader': 'reader', 'WebSocket': 'socket', 'Worker': 'worker', 'FormData': 'formData'}
+
+    def match(self, binding, index):
+        value = index.initializer(binding)
+        if value is None or value.type != Syntax.NewExpression or value.callee.type != Syntax.Identifier:
+            return None
+        if value.callee.name in self.NAMES:
+            return self.NAMES[value.callee.name], 0.95
+        # Other constructors of the page, or of the code itself
+        return camel_case(value.callee.name), 0.6
+
+class LoopRule(Rule):
+    """Counters of for loops, and the arrays whose length bounds them."""
+
+    name = 'loop'
+
+    def match(self, binding, index):
+        for node in binding.references:
+            parent, field, _ = index.parent(node)
+            if parent is None:
+                continue
+            # for (var a = 0; a < b.length; a++)
+            if parent.type == Syntax.VariableDeclarator and field == 'id':
+                declaration, _, _ = index.parent(parent)
+                loop, loop_field, _ = index.parent(declaration) if declaration is not None else (None, None, None)
+                if loop is not None and loop.type == Syntax.ForStatement and loop_field == 'init':
+                    # Nested loops count with the next letters
+                    depth = 0
+                    while loop is not None and loop.type not in FUNCTIONS:
+                        depth += loop.type == Syntax.ForStatement
+                        loop, _, _ = index.parent(loop)
+                    return COUNTERS[min(depth, len(COUNTERS)) - 1], 0.85
+            # b.length in the test of a loop
+            if parent.type == Syntax.MemberExpression and field == 'object' and not parent.computed and parent.property.name == 'length':
+                comparison, _, _ = index.parent(parent)
+                loop, loop_field, _ = index.parent(comparison) if comparison is not None else (None, None, None)
+                if loop is not None and loop.type == Syntax.ForStatement and loop_field == 'test':
+                    return 'items', 0.6
+        return None
+
+RULES = [DomFactoryRule(), ContextRule(), EventListenerRule(), PromiseRule(), ConstructorRule(), LoopRule()]
+
+class RuleEngine:
+    """Fast path naming bindings with pluggable rules before any model call. Only the
+    names proposed with at least 'threshold' confidence are used, the others are left
+    to the model. 'stats' counts the names given by each rule."""
+
+    def __init__(self, ast: Node, rules: list[Rule] = None, threshold: float = 0.8):
+        self.index = Index(ast)
+        self.rules: list[Rule] = list(RULES if rules is None else rules)
+        self.threshold: float = threshold
+        self.stats: Counter = Counter()
+
+    def register(self, rule: Rule):
+        self.rules.append(rule)
+
+    def propose(self, binding: Binding) -> tuple[str, float, str] | None:
+        """Most confident (name, confidence, rule) for 'binding'."""
+        best = None
+        for rule in self.rules:
+            match = rule.match(binding, self.index)
+            if match and match[0] and (best is None or match[1] > best[1]):
+                best = (match[0], match[1], rule.name)
+        return best
+
+    def name(self, binding: Binding) -> str | None:
+        proposal = self.propose(binding)
+        if proposal is None or proposal[1] < self.threshold:
+            return None
+        self.stats[proposal[2]] += 1
+        return proposal[0]
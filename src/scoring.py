@@ -0,0 +1,116 @@
+import math
+import re
+from collections import Counter
+
+from esprima.nodes import *
+
+from src.visitor import Binding, Scope, node_children
+
+# Words and abbreviations found in hand-written code, names made of them are kept
+WORDS = set("""
+an and or not is has can should will did do get set put add remove delete create make build init load
+save read write open close start stop run call apply bind emit on off once fire trigger handle update
+render draw paint show hide toggle enable disable check test parse format convert encode decode push pop
+shift unshift slice splice split join concat map filter reduce find sort reverse keys values entries
+each for while if else try catch finally throw error err warn log debug info event evt ev callback cb fn
+func handler listener resolve reject promise then done next prev previous first last id ids idx index
+key val value item items list array arr obj object dict hash table str string text char chars num number
+int float bool boolean date time now timer timeout interval delay count total sum min max avg size
+length len width height top left right bottom dx dy pos position offset end begin from to src
+dst source target dest result res ret response resp request req data buf buffer bytes byte bits bit mask
+flag flags opts options config conf cfg settings params param args arg argv name names type types kind
+mode state status ctx context self that this parent child children node nodes elem element el els root
+doc document win window body head html dom canvas image img video audio sound url uri path file dir
+query search match regex re pattern tmp temp old new cur current orig original copy clone cache store
+model view controller component comp module mod lib util utils helper api client server socket conn
+connection db user users msg message input output out in inner outer page row col column cell grid line
+lines point points rect box shape color colour style styles class cls font label title content container
+wrapper frame layer layers scale scroll zoom angle radius rad deg speed step steps frames tick ticks
+loop loops iter iterator counter cnt seq queue stack heap tree graph edge edges vertex route link links
+token tokens word words letter letters digit digits part parts chunk chunks block blocks group groups
+field fields prop props attr attrs attribute attributes method methods fns funcs proto prototype ok fail
+failed success valid invalid empty full visible hidden active enabled disabled ready loaded async sync
+await yield wait wrap unwrap inject require exports export import default global globals local locals
+vals ref refs $ _
+""".split())
+
+# Conventional names of loop counters
+COUNTERS = {'i', 'j', 'k', 'l', 'm', 'n', 'ii', 'jj', 'kk', 'idx'}
+
+HEX_NAME = re.compile(r"_?0x[0-9a-fA-F]+|_0x\w+")
+PARTS = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+LOOPS = {Syntax.ForStatement, Syntax.ForInStatement, Syntax.ForOfStatement}
+
+def split_words(name: str) -> list[str]:
+    return [part.lower() for part in PARTS.findall(name)]
+
+def entropy(name: str) -> float:
+    # Shannon entropy of the characters, normalized by its maximum for this length
+    if len(name) < 2:
+        return 1.0
+    counts = Counter(name)
+    value = -sum(count / len(name) * math.log2(count / len(name)) for count in counts.values())
+    return value / math.log2(len(name))
+
+class NameScorer:
+    """Decide which declared names need the model and how much renaming them helps.
+    'obfuscation' estimates whether a name has been minified from its letters, its
+    entropy and the dictionary words it is made of, while the impact of a name grows
+    with its references. Loop counters and names used once are left as they are."""
+
+    def __init__(self, ast: Node, threshold: float = 0.5, min_references: int = 2):
+        self.threshold: float = threshold
+        self.min_references: int = min_references
+        self.counters: set[int] = self.find_counters(ast)
+
+    def find_counters(self, ast: Node) -> set[int]:
+        # Identifiers declared or assigned by the head of a loop
+        counters = set()
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            if node.type in LOOPS:
+                head = node.init if node.type == Syntax.ForStatement else node.left
+                if head is not None:
+                    declarations = head.declarations if head.type == Syntax.VariableDeclaration else [head]
+                    for declaration in declarations:
+                        target = declaration.id if declaration.type == Syntax.VariableDeclarator else declaration
+                        if target is not None and target.type == Syntax.Identifier:
+                            counters.add(id(target))
+            stack.extend(node_children(node))
+        return counters
+
+    def obfuscation(self, name: str) -> float:
+        if name.lower() in WORDS:
+            return 0.0
+        if HEX_NAME.fullmatch(name):
+            return 1.0
+        if len(name) <= 2:
+            return 0.9
+
+        parts = split_words(name)
+        if parts and all(part in WORDS or part.isdigit() for part in parts):
+            return 0.1
+
+        letters = name.strip('_$') or name
+        known = sum(len(part) for part in parts if part in WORDS) / len(letters)
+        vowels = sum(char in 'aeiouAEIOU' for char in letters) / len(letters)
+        digits = sum(char.isdigit() for char in letters) / len(letters)
+        # Words have 25% to 55% of vowels, and minified names mix digits in
+        deviation = min(max(abs(vowels - 0.4) - 0.15, 0.0) * 4, 1.0)
+        return min((1 - known) * (0.3 + 0.6 * deviation + 0.1 * entropy(letters.lower())) + digits, 1.0)
+
+    def is_counter(self, binding: Binding) -> bool:
+        return binding.name in COUNTERS and any(id(node) in self.counters for node in binding.references)
+
+    def impact(self, binding: Binding) -> float:
+        """Expected gain of renaming 'binding', 0 when it does not need the model."""
+        if len(binding.references) < self.min_references or self.is_counter(binding):
+            return 0.0
+        score = self.obfuscation(binding.name)
+        return score * len(binding.references) if score >= self.threshold else 0.0
+
+    def select(self, scope: Scope) -> dict[str, float]:
+        """Names of 'scope' needing the model with their impact, highest first."""
+        impacts = {var: self.impact(scope.bindings[var]) for var in scope.declared if var in scope.bindings}
+        return dict(sorted(((var, impact) for var, impact in impacts.items() if impact > 0), key=lambda item: (-item[1], item[0])))
@@ -0,0 +1,94 @@
+import json
+import os
+import sqlite3
+from collections import Counter
+
+import esprima
+from esprima.nodes import *
+
+from src.fingerprint import binding_index, fingerprint
+from src.visitor import FUNCTIONS, Binding, Visitor
+
+class SignatureDatabase:
+    """Offline database of the functions of known libraries, keyed on the fingerprint of
+    their AST with the names replaced (see 'fingerprint'), so that a minified copy of a
+    function is recognized and gets the names of the library source back. Functions
+    under 'minimum' nodes are too common to tell where they come from."""
+
+    def __init__(self, file: str, minimum: int = 30):
+        self.file: str = file
+        self.minimum: int = minimum
+
+        folder = os.path.dirname(file)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.connection = sqlite3.connect(file, timeout=60.0)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS signatures (hash TEXT PRIMARY KEY, library TEXT NOT NULL, name TEXT, names TEXT NOT NULL)")
+
+    def close(self):
+        self.connection.close()
+
+    def add_library(self, library: str, files: list[str]) -> int:
+        """Fingerprint every function of the unminified sources of 'library'.
+        Returns the number of new signatures."""
+        added = 0
+        for file in files:
+            with open(file, 'r') as source:
+                program = source.read()
+            try:
+                ast = esprima.parseScript(program)
+            except esprima.Error:
+                ast = esprima.parseModule(program)
+            visitor = Visitor(ast)
+            bindings = binding_index(visitor)
+
+            rows = []
+            for scope in visitor.global_scope:
+                if scope.node is None or scope.node.type not in FUNCTIONS:
+                    continue
+                result = fingerprint(scope, bindings, minimum=self.minimum)
+                if result is not None:
+                    key, declared = result
+                    name = scope.node.id.name if scope.node.id else None
+                    rows.append((key, library, name, json.dumps([binding.name for binding in declared])))
+
+            with self.connection:
+                before = self.connection.total_changes
+                self.connection.executemany("INSERT OR IGNORE INTO signatures VALUES (?, ?, ?, ?)", rows)
+                added += self.connection.total_changes - before
+        return added
+
+    def lookup(self, key: str) -> tuple[str, str | None, list[str]] | None:
+        row = self.connection.execute("SELECT library, name, names FROM signatures WHERE hash = ?", (key,)).fetchone()
+        return (row[0], row[1], json.loads(row[2])) if row else None
+
+    def libraries(self) -> dict[str, int]:
+        return dict(self.connection.execute("SELECT library, COUNT(*) FROM signatures GROUP BY library ORDER BY library").fetchall())
+
+    def match(self, visitor: Visitor) -> tuple[dict[Binding, str], Counter]:
+        """Original names of the bindings of the known functions of 'visitor', and the
+        characters of the code covered by each library. Nested functions of a known
+        function are named with it."""
+        bindings = binding_index(visitor)
+        names: dict[Binding, str] = {}
+        coverage: Counter = Counter()
+        stack = [visitor.global_scope]
+        while stack:
+            scope = stack.pop()
+            result = None
+            if scope.node is not None and scope.node.type in FUNCTIONS:
+                result = fingerprint(scope, bindings, minimum=self.minimum)
+            signature = self.lookup(result[0]) if result else None
+            if signature is None:
+                stack.extend(reversed(scope.children))
+                continue
+
+            library, name, originals = signature
+            for binding, original in zip(result[1], originals):
+                names[binding] = original
+            if name and scope.node.id is not None and id(scope.node.id) in bindings:
+                names[bindings[id(scope.node.id)]] = name
+            start, end = getattr(scope.node, 'range', (0, 0))
+            coverage[library] += end - start
+        return names, coverage
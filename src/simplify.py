@@ -0,0 +1,691 @@
+import math
+import re
+from collections import Counter
+from decimal import Decimal
+
+import esprima
+import escodegen
+from esprima.nodes import *
+
+from src.visitor import FUNCTIONS, node_children
+
+IDENTIFIER = re.compile(r"[A-Za-z_$][\w$]*")
+MEMBERS = {Syntax.MemberExpression}
+CONTAINERS = {Syntax.Program, Syntax.BlockStatement} | FUNCTIONS
+BRANCHES = {Syntax.IfStatement, Syntax.ForStatement, Syntax.ForInStatement, Syntax.WhileStatement, Syntax.DoWhileStatement, Syntax.SwitchStatement, Syntax.TryStatement, Syntax.ConditionalExpression, Syntax.LogicalExpression}
+
+class NotConstant(Exception):
+    pass
+
+def walk(node: Node):
+    # Nodes under 'node' in field order, without recursion
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node_children(node)))
+
+def walk_containers(node: Node):
+    # Nodes under 'node' with the innermost block or function holding them
+    stack = [(node, None)]
+    while stack:
+        node, container = stack.pop()
+        yield node, container
+        inner = node if node.type in CONTAINERS else container
+        stack.extend((child, inner) for child in reversed(node_children(node)))
+
+def transform(root: Node, function) -> Node:
+    """Replace every node under 'root' by 'function(node)', children first, without recursion."""
+    replaced: dict[int, Node] = {}
+    stack = [(root, False)]
+    while stack:
+        node, done = stack.pop()
+        if not done:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node_children(node))
+            continue
+        for field, value in node.__dict__.items():
+            if isinstance(value, Node) and id(value) in replaced:
+                setattr(node, field, replaced.pop(id(value)))
+            elif isinstance(value, list):
+                value[:] = [replaced.pop(id(child), child) if isinstance(child, Node) else child for child in value]
+        new = function(node)
+        if new is not node:
+            replaced[id(node)] = new
+    return replaced.get(id(root), root)
+
+def pattern_targets(node: Node | None) -> list[Node]:
+    # Identifiers and members written by a binding or assignment target
+    targets = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        if node.type in (Syntax.Identifier,) or node.type in MEMBERS:
+            targets.append(node)
+        elif node.type == Syntax.ObjectPattern:
+            stack.extend(prop if prop.type == Syntax.RestElement else prop.value for prop in node.properties)
+        elif node.type == Syntax.ArrayPattern:
+            stack.extend(node.elements)
+        elif node.type == Syntax.AssignmentPattern:
+            stack.append(node.left)
+        elif node.type == Syntax.RestElement:
+            stack.append(node.argument)
+    return targets
+
+def binding_targets(node: Node) -> list[Node]:
+    # Targets declared or assigned by 'node'
+    if node.type == Syntax.VariableDeclarator:
+        return pattern_targets(node.id)
+    if node.type in FUNCTIONS:
+        return pattern_targets(node.id) + [target for param in node.params for target in pattern_targets(param)]
+    if node.type in (Syntax.ClassDeclaration, Syntax.ClassExpression):
+        return pattern_targets(node.id)
+    if node.type == Syntax.CatchClause:
+        return pattern_targets(node.param)
+    if node.type == Syntax.AssignmentExpression:
+        return pattern_targets(node.left)
+    if node.type == Syntax.UpdateExpression:
+        return pattern_targets(node.argument)
+    if node.type in (Syntax.ForInStatement, Syntax.ForOfStatement) and node.left.type != Syntax.VariableDeclaration:
+        return pattern_targets(node.left)
+    return []
+
+def clone(value):
+    # Nodes answer None for any missing attribute, which 'copy.deepcopy' does not expect
+    if isinstance(value, Node):
+        node = object.__new__(type(value))
+        node.__dict__.update({field: clone(child) for field, child in value.__dict__.items()})
+        return node
+    if isinstance(value, list):
+        return [clone(child) for child in value]
+    return value
+
+# Conversions of Javascript for the values of literals
+
+# StringNumericLiteral of ECMAScript, anything else is NaN
+NUMERIC = re.compile(r"[+-]?(?:Infinity|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)|0[xX][0-9a-fA-F]+|0[oO][0-7]+|0[bB][01]+")
+# WhiteSpace and LineTerminator of ECMAScript
+SPACES = " \t\n\v\f\r\u00a0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000\ufeff"
+
+def to_number(value) -> float:
+    if isinstance(value, (bool, int, float)):
+        return float(value)
+    if value is None:
+        return 0.0
+    if isinstance(value, str):
+        text = value.strip(SPACES)
+        if not text:
+            return 0.0
+        if not NUMERIC.fullmatch(text):
+            return math.nan
+        if text[1:2] in ('x', 'X', 'o', 'O', 'b', 'B'):
+            return float(int(text[2:], {'x': 16, 'o': 8, 'b': 2}[text[1].lower()]))
+        return float(text.replace('Infinity', 'inf'))
+    return math.nan
+
+def number_to_string(value: float) -> str:
+    # Number::toString of ECMAScript, the shortest digits are those of 'repr'
+    if math.isnan(value):
+        return 'NaN'
+    if value == 0:
+        return '0'
+    if value < 0:
+        return '-' + number_to_string(-value)
+    if math.isinf(value):
+        return 'Infinity'
+    decimal = Decimal(repr(value)).normalize()
+    digits = ''.join(map(str, decimal.as_tuple().digits))
+    k = len(digits)
+    n = decimal.as_tuple().exponent + k
+    if k <= n <= 21:
+        return digits + '0' * (n - k)
+    if 0 < n <= 21:
+        return digits[:n] + '.' + digits[n:]
+    if -6 < n <= 0:
+        return '0.' + '0' * -n + digits
+    exponent = f"e{'+' if n > 0 else '-'}{abs(n - 1)}"
+    return (digits if k == 1 else digits[0] + '.' + digits[1:]) + exponent
+
+def to_string(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if value is None:
+        return 'null'
+    return number_to_string(float(value))
+
+def to_boolean(value) -> bool:
+    if isinstance(value, list):
+        return True
+    if isinstance(value, float):
+        return value != 0 and not math.isnan(value)
+    return bool(value)
+
+def to_int32(value: float) -> int:
+    if math.isnan(value) or math.isinf(value):
+        return 0
+    value = int(value) & 0xFFFFFFFF
+    return value - 0x100000000 if value & 0x80000000 else value
+
+def parse_int(value) -> float:
+    # parseInt without a radix
+    match = re.match(r"([+-]?)(?:0[xX]([0-9a-fA-F]+)|(\d+))", to_string(value).lstrip(SPACES))
+    if not match:
+        return math.nan
+    number = float(int(match.group(2), 16)) if match.group(2) else float(int(match.group(3)))
+    return -number if match.group(1) == '-' else number
+
+def binary(operator: str, left, right):
+    """Value of a binary operation on primitive values."""
+    if isinstance(left, list) or isinstance(right, list):
+        raise NotConstant(operator)
+    if operator == '+':
+        if isinstance(left, str) or isinstance(right, str):
+            return to_string(left) + to_string(right)
+        return to_number(left) + to_number(right)
+    if operator in ('-', '*', '/', '%'):
+        a, b = to_number(left), to_number(right)
+        if operator == '-':
+            return a - b
+        if operator == '*':
+            return a * b
+        if operator == '/':
+            if b == 0:
+                return math.nan if a == 0 or math.isnan(a) else math.copysign(math.inf, a) * math.copysign(1, b)
+            return a / b
+        return math.fmod(a, b) if b and not math.isinf(a) else math.nan
+    if operator in ('|', '&', '^', '<<', '>>', '>>>'):
+        a, b = to_int32(to_number(left)), to_int32(to_number(right))
+        if operator == '|':
+            return float(a | b)
+        if operator == '&':
+            return float(a & b)
+        if operator == '^':
+            return float(a ^ b)
+        if operator == '<<':
+            return float(to_int32(a << (b & 31)))
+        if operator == '>>':
+            return float(a >> (b & 31))
+        return float((a & 0xFFFFFFFF) >> (b & 31))
+    if operator in ('===', '!=='):
+        numbers = all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in (left, right))
+        equal = (numbers or type(left) == type(right)) and left == right
+        return equal if operator == '===' else not equal
+    raise NotConstant(operator)
+
+def literal(value) -> Node | None:
+    """Node of a primitive value, None when it has no literal."""
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value) or value == 0 and math.copysign(1, value) < 0:
+            return None
+        if value.is_integer() and abs(value) < 2 ** 53:
+            value = int(value)
+    if isinstance(value, str):
+        return Literal(value, None)
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value < 0:
+        return UnaryExpression('-', Literal(-value, to_string(-value)))
+    return Literal(value, to_string(value))
+
+def constant(node: Node) -> bool:
+    return node.type == Syntax.Literal and getattr(node, 'regex', None) is None
+
+def member_key(node: Node) -> str | None:
+    # Name of the property read by 'node', if known statically
+    if node.type not in MEMBERS:
+        return None
+    if node.computed:
+        return node.property.value if constant(node.property) and isinstance(node.property.value, str) else None
+    return node.property.name
+
+class Simplifier:
+    """Pre-pass on the AST undoing the transforms of javascript-obfuscator that hide what
+    the code does. The string array read through a decoder function is inlined when the
+    decoder and the rotation of the array at startup can be evaluated statically, then
+    constant expressions are folded, obj['name'] becomes obj.name and the proxy functions
+    and objects forwarding their parameters to an operator or a call are collapsed at their
+    call sites. What is left unused is removed. Only the decoders and proxies whose name
+    is declared once, by any binding form, are considered, and only their references in
+    the block or function declaring them are replaced. Encoded string arrays (base64, rc4)
+    are left as they are."""
+
+    def __init__(self, ast: Node):
+        self.ast: Node = ast
+        self.stats: Counter = Counter()
+
+        # Per name: declarations and assignments, uses, static reads of a property, and writes of properties
+        self.declarations: Counter = Counter()
+        self.uses: Counter = Counter()
+        self.members: Counter = Counter()
+        self.written: set[str] = set()
+        # Block or function declaring the decoders and proxies, and the identifiers referring to them
+        self.containers: dict[str, Node] = {}
+        self.resolved: dict[int, Identifier] = {}
+
+    def simplify(self, passes: int = 5) -> Node:
+        self.decode_strings()
+        for _ in range(passes):
+            before = self.stats['proxies']
+            self.count_names()
+            proxies = self.find_proxies()
+            self.resolved = self.resolve(set(proxies))
+            self.ast = transform(self.ast, lambda node: self.fold(node, proxies))
+            # Folding is done children first, only inlined proxies make more to simplify
+            if self.stats['proxies'] == before:
+                break
+            self.count_names()
+            self.remove({name for name in proxies if self.uses[name] == 1}, set())
+        return self.ast
+
+    def count_names(self):
+        self.declarations = Counter()
+        self.uses = Counter()
+        self.members = Counter()
+        self.written = set()
+        for node in walk(self.ast):
+            # Every binding form counts, names declared twice are left as they are
+            for target in binding_targets(node):
+                if target.type == Syntax.Identifier:
+                    self.declarations[target.name] += 1
+                elif target.object.type == Syntax.Identifier:
+                    self.written.add(target.object.name)
+            if node.type == Syntax.UnaryExpression and node.argument.type in MEMBERS and node.argument.object.type == Syntax.Identifier:
+                self.written.add(node.argument.object.name)
+            elif node.type in MEMBERS and node.object.type == Syntax.Identifier and member_key(node) is not None:
+                self.members[node.object.name] += 1
+            elif node.type == Syntax.Identifier:
+                self.uses[node.name] += 1
+
+    def resolve(self, names: set[str]) -> dict[int, Identifier]:
+        """Identifiers referring to 'names', declared once in the block or function of
+        'self.containers'. The same names outside of it are globals. The identifiers are
+        kept so that their ids are not reused by the nodes of a transform."""
+        visible: dict[int, set[str]] = {}
+        for name in names:
+            visible.setdefault(id(self.containers[name]), set()).add(name)
+
+        resolved: dict[int, Identifier] = {}
+        stack = [(self.ast, frozenset())]
+        while stack:
+            node, active = stack.pop()
+            if id(node) in visible:
+                active = active | visible[id(node)]
+            if node.type == Syntax.Identifier and node.name in active:
+                resolved[id(node)] = node
+            stack.extend((child, active) for child in node_children(node))
+        return resolved
+
+    def refers(self, resolved: dict[int, Identifier], node: Node) -> str | None:
+        # Name of the decoder or proxy 'node' refers to
+        return node.name if resolved.get(id(node)) is node else None
+
+    def remove(self, names: set[str], statements: set[int]):
+        """Remove the declarations of 'names' and the statements of ids 'statements'."""
+        if not names and not statements:
+            return
+
+        def prune(node: Node) -> Node:
+            if node.type in (Syntax.Program, Syntax.BlockStatement):
+                body = []
+                for statement in node.body:
+                    if id(statement) in statements:
+                        continue
+                    if statement.type == Syntax.FunctionDeclaration and statement.id.name in names:
+                        continue
+                    if statement.type == Syntax.VariableDeclaration and not statement.declarations:
+                        continue
+                    body.append(statement)
+                node.body = body
+            elif node.type == Syntax.VariableDeclaration:
+                node.declarations = [declaration for declaration in node.declarations if not (declaration.id.type == Syntax.Identifier and declaration.id.name in names)]
+            elif node.type == Syntax.ForStatement and node.init is not None and node.init.type == Syntax.VariableDeclaration and not node.init.declarations:
+                node.init = None
+            return node
+
+        self.ast = transform(self.ast, prune)
+        self.stats['removed'] += len(names) + len(statements)
+
+    # String arrays
+
+    def decode_strings(self):
+        self.count_names()
+        for array, values in self.find_arrays().items():
+            decoders = self.find_decoders(array)
+            rotation = self.find_rotation(array) if decoders else None
+            if not decoders or rotation is False or rotation and not self.rotate(rotation, values, decoders):
+                continue
+
+            # The rotation is left as it is, it runs at startup
+            skipped = {id(node) for node in walk(rotation)} if rotation else set()
+            def decode(node: Node) -> Node:
+                if id(node) in skipped:
+                    return node
+                if node.type == Syntax.CallExpression and self.refers(self.resolved, node.callee) in decoders and node.arguments:
+                    try:
+                        value = self.lookup(values, decoders[node.callee.name], [self.evaluate(argument) for argument in node.arguments])
+                    except (NotConstant, IndexError):
+                        return node
+                    self.stats['strings'] += 1
+                    return literal(value)
+                return node
+            self.ast = transform(self.ast, decode)
+
+            # Once every string is inlined, the array, its decoders and the rotation go away
+            names = set(decoders) | {array}
+            if not self.referenced(names, rotation):
+                statements = {id(statement) for statement in walk(self.ast) if statement.type == Syntax.ExpressionStatement and statement.expression is rotation}
+                self.remove(names, statements)
+
+    def referenced(self, names: set[str], rotation: Node | None) -> bool:
+        # Whether 'names' are used outside their declarations and the rotation
+        stack = [self.ast]
+        while stack:
+            node = stack.pop()
+            if node is rotation:
+                continue
+            if node.type == Syntax.FunctionDeclaration and node.id.name in names:
+                continue
+            if node.type == Syntax.VariableDeclarator and node.id.type == Syntax.Identifier and node.id.name in names:
+                continue
+            if node.type == Syntax.Identifier and node.name in names:
+                return True
+            stack.extend(node_children(node))
+        return False
+
+    def find_arrays(self) -> dict[str, list[str]]:
+        # var a = ['...', ...] or function a() { var b = ['...', ...]; a = function () { return b; }; return a(); }
+        arrays = {}
+        for node in walk(self.ast):
+            if node.type == Syntax.VariableDeclarator and node.id.type == Syntax.Identifier and node.init is not None:
+                values = self.string_array(node.init)
+                if values is not None and self.declarations[node.id.name] == 1:
+                    arrays[node.id.name] = values
+            elif node.type == Syntax.FunctionDeclaration and node.body.body:
+                first = node.body.body[0]
+                if first.type == Syntax.VariableDeclaration and len(first.declarations) == 1 and first.declarations[0].init is not None:
+                    values = self.string_array(first.declarations[0].init)
+                    # Declared, then replaced by the closure returning the array
+                    if values is not None and self.declarations[node.id.name] == 2:
+                        arrays[node.id.name] = values
+        return arrays
+
+    def string_array(self, node: Node) -> list[str] | None:
+        if node.type != Syntax.ArrayExpression or len(node.elements) < 2:
+            return None
+        if not all(element is not None and element.type == Syntax.Literal and isinstance(element.value, str) for element in node.elements):
+            return None
+        return [element.value for element in node.elements]
+
+    def find_decoders(self, array: str) -> dict[str, float]:
+        """Functions returning the element of 'array' at their first parameter minus an
+        offset, and their aliases, with the offset."""
+        decoders = {}
+        for node, container in walk_containers(self.ast):
+            function, name = None, None
+            if node.type == Syntax.FunctionDeclaration:
+                function, name = node, node.id.name
+            elif node.type == Syntax.VariableDeclarator and node.id.type == Syntax.Identifier and node.init is not None and node.init.type == Syntax.FunctionExpression:
+                function, name = node.init, node.id.name
+            if function is None or not function.params or name == array:
+                continue
+            # Declared once, but for the decoder replacing itself on the first call
+            reassigned = sum(1 for child in walk(function.body) if child.type == Syntax.AssignmentExpression and child.left.type == Syntax.Identifier and child.left.name == name)
+            if self.declarations[name] != 1 + reassigned:
+                continue
+            offset = self.decoder_offset(function, name, array)
+            if offset is not None:
+                decoders[name] = offset
+                self.containers[name] = container
+
+        # var b = decoder;
+        resolved = self.resolve(set(decoders))
+        for node, container in walk_containers(self.ast):
+            if node.type == Syntax.VariableDeclarator and node.id.type == Syntax.Identifier and node.init is not None and node.init.type == Syntax.Identifier:
+                if self.refers(resolved, node.init) in decoders and self.declarations[node.id.name] == 1:
+                    decoders[node.id.name] = decoders[node.init.name]
+                    self.containers[node.id.name] = container
+        self.resolved = self.resolve(set(decoders))
+        return decoders
+
+    def decoder_offset(self, function: Node, name: str, array: str) -> float | None:
+        # Plain decoders only call the array function and themselves, without branches
+        offset = None
+        uses_array = False
+        for node in walk(function.body):
+            if node.type in BRANCHES:
+                return None
+            if node.type == Syntax.Identifier and node.name == array:
+                uses_array = True
+            if node.type == Syntax.CallExpression and not (node.callee.type == Syntax.Identifier and node.callee.name in (array, name)):
+                return None
+            # a = a - 0x1f0 or a -= 0x1f0
+            if node.type == Syntax.AssignmentExpression and node.left.type == Syntax.Identifier:
+                value = node.right
+                if node.operator == '=' and value.type == Syntax.BinaryExpression and value.operator == '-' and value.left.type == Syntax.Identifier and value.left.name == node.left.name:
+                    value = value.right
+                elif node.operator != '-=':
+                    continue
+                try:
+                    offset = to_number(self.evaluate(value))
+                except NotConstant:
+                    return None
+        return offset if uses_array and offset is not None else None
+
+    def lookup(self, values: list[str], offset: float, arguments: list) -> str:
+        index = to_number(arguments[0]) - offset
+        if not index.is_integer() or not 0 <= index < len(values):
+            raise IndexError(index)
+        return values[int(index)]
+
+    def find_rotation(self, array: str) -> Node | bool | None:
+        # Call of a function expression with the array and a number shifting the array in a loop
+        for node in walk(self.ast):
+            if node.type != Syntax.CallExpression or node.callee.type != Syntax.FunctionExpression or len(node.arguments) != 2:
+                continue
+            target = node.arguments[0]
+            if target.type != Syntax.Identifier or target.name != array:
+                continue
+            if any(child.type == Syntax.Identifier and child.name == 'shift' or constant(child) and child.value == 'shift' for child in walk(node.callee.body)):
+                return node
+            return False # Another use of the array that cannot be evaluated
+        return None
+
+    def rotate(self, rotation: Node, values: list[str], decoders: dict[str, float]) -> bool:
+        """Apply the rotation to 'values'. Returns False when it cannot be evaluated."""
+        try:
+            count = to_number(self.evaluate(rotation.arguments[1]))
+        except NotConstant:
+            return False
+
+        check = self.rotation_check(rotation.callee)
+        if check is None:
+            # (function (a, b) { var c = function (d) { while (--d) a.push(a.shift()); }; c(++b); })(array, count)
+            if not count.is_integer() or not values:
+                return False
+            shift = int(count) % len(values)
+            values[:] = values[shift:] + values[:shift]
+            self.stats['rotations'] += 1
+            return True
+
+        # The array is shifted until an expression of decoded strings gives 'count'
+        aliases = dict(decoders)
+        for node in walk(rotation.callee.body):
+            if node.type == Syntax.VariableDeclarator and node.id.type == Syntax.Identifier and node.init is not None and node.init.type == Syntax.Identifier and node.init.name in decoders and self.declarations[node.id.name] == 1:
+                aliases[node.id.name] = decoders[node.init.name]
+        call = lambda callee, arguments: self.lookup(values, aliases[callee], arguments) if callee in aliases else None
+        for _ in range(len(values)):
+            try:
+                value = self.evaluate(check, call)
+                if isinstance(value, float) and value == count:
+                    self.stats['rotations'] += 1
+                    return True
+            except (NotConstant, IndexError, OverflowError):
+                pass
+            values.append(values.pop(0))
+        return False
+
+    def rotation_check(self, function: Node) -> Node | None:
+        # var a = parseInt(b(0x1f0)) / 0x1 + ...; if (a === count) break;
+        if len(function.params) < 2 or function.params[1].type != Syntax.Identifier:
+            return None
+        target = function.params[1].name
+        declared = {}
+        for node in walk(function.body):
+            if node.type == Syntax.VariableDeclarator and node.id.type == Syntax.Identifier and node.init is not None:
+                declared[node.id.name] = node.init
+            if node.type == Syntax.IfStatement and node.test.type == Syntax.BinaryExpression and node.test.operator in ('===', '=='):
+                left, right = node.test.left, node.test.right
+                if right.type == Syntax.Identifier and right.name == target:
+                    left, right = right, left
+                if left.type == Syntax.Identifier and left.name == target:
+                    return declared.get(right.name, right) if right.type == Syntax.Identifier else right
+        return None
+
+    def evaluate(self, node: Node, call=None):
+        """Value of a constant expression, 'call' giving the values of calls by name."""
+        if constant(node):
+            return node.value
+        if node.type == Syntax.ArrayExpression and not node.elements:
+            return []
+        if node.type == Syntax.UnaryExpression:
+            value = self.evaluate(node.argument, call)
+            if node.operator == '!':
+                return not to_boolean(value)
+            if isinstance(value, list):
+                raise NotConstant(node.operator)
+            if node.operator == '-':
+                return -to_number(value)
+            if node.operator == '+':
+                return to_number(value)
+            if node.operator == '~':
+                return float(~to_int32(to_number(value)))
+            raise NotConstant(node.operator)
+        if node.type == Syntax.BinaryExpression:
+            return binary(node.operator, self.evaluate(node.left, call), self.evaluate(node.right, call))
+        if node.type == Syntax.CallExpression and node.callee.type == Syntax.Identifier:
+            arguments = [self.evaluate(argument, call) for argument in node.arguments]
+            if node.callee.name == 'parseInt' and arguments:
+                return parse_int(arguments[0])
+            if call is not None:
+                value = call(node.callee.name, arguments)
+                if value is not None:
+                    return value
+        raise NotConstant(node.type)
+
+    # Folding and proxies
+
+    def find_proxies(self) -> dict[str, Node]:
+        """Proxy functions and objects of proxy functions and strings, never reassigned."""
+        proxies = {}
+        for node, container in walk_containers(self.ast):
+            name, value = None, None
+            if node.type == Syntax.FunctionDeclaration:
+                name, value = node.id.name, node
+            elif node.type == Syntax.VariableDeclarator and node.id.type == Syntax.Identifier and node.init is not None:
+                name, value = node.id.name, node.init
+            if name is None or self.declarations[name] != 1:
+                continue
+            if value.type in FUNCTIONS and self.template(value) is not None:
+                proxies[name] = value
+            elif value.type == Syntax.ObjectExpression and value.properties and all(self.proxy_property(prop) for prop in value.properties):
+                # Only read with static keys
+                if name not in self.written and self.uses[name] == self.members[name] + 1:
+                    proxies[name] = value
+            if name in proxies:
+                self.containers[name] = container
+        return proxies
+
+    def template(self, function: Node) -> Node | None:
+        """Expression returned by a function using each of its parameters once, in order."""
+        if function.type == Syntax.ArrowFunctionExpression and function.expression:
+            body = function.body
+        elif function.type != Syntax.ArrowFunctionExpression and len(function.body.body) == 1 and function.body.body[0].type == Syntax.ReturnStatement:
+            body = function.body.body[0].argument
+        else:
+            return None
+        if body is None or function.generator or function.isAsync or not all(param.type == Syntax.Identifier for param in function.params):
+            return None
+        # Arguments of a logical expression might not be evaluated
+        if body.type not in (Syntax.BinaryExpression, Syntax.CallExpression, Syntax.NewExpression):
+            return None
+
+        params = [param.name for param in function.params]
+        used = []
+        for node in walk(body):
+            if node.type in FUNCTIONS or node.type in BRANCHES or node.type in MEMBERS or node.type in (Syntax.ThisExpression, Syntax.AssignmentExpression, Syntax.UpdateExpression, Syntax.SpreadElement):
+                return None
+            if node.type == Syntax.Identifier:
+                if node.name not in params:
+                    return None
+                used.append(node.name)
+        return body if used == params else None
+
+    def proxy_property(self, prop: Node) -> bool:
+        if prop.type != Syntax.Property or prop.kind != 'init' or prop.computed or prop.shorthand or prop.method:
+            return False
+        if prop.key.type not in (Syntax.Identifier, Syntax.Literal):
+            return False
+        if constant(prop.value):
+            return isinstance(prop.value.value, str)
+        return prop.value.type in FUNCTIONS and self.template(prop.value) is not None
+
+    def proxy_member(self, node: Node, proxies: dict[str, Node]) -> Node | None:
+        # Value of obj.key for a proxy object
+        key = member_key(node)
+        name = self.refers(self.resolved, node.object) if key is not None else None
+        if name not in proxies or proxies[name].type != Syntax.ObjectExpression:
+            return None
+        for prop in proxies[name].properties:
+            if (prop.key.name if prop.key.type == Syntax.Identifier else prop.key.value) == key:
+                return prop.value
+        return None
+
+    def inline(self, function: Node, arguments: list[Node]) -> Node | None:
+        if len(arguments) != len(function.params) or any(argument.type == Syntax.SpreadElement for argument in arguments):
+            return None
+        body = self.template(function)
+        values = dict(zip((param.name for param in function.params), arguments))
+        # Called through a parameter, a method would get another 'this'
+        if body.type in (Syntax.CallExpression, Syntax.NewExpression) and body.callee.type == Syntax.Identifier and values[body.callee.name].type in MEMBERS:
+            return None
+        return transform(clone(body), lambda node: values[node.name] if node.type == Syntax.Identifier and node.name in values else node)
+
+    def fold(self, node: Node, proxies: dict[str, Node]) -> Node:
+        if node.type == Syntax.BinaryExpression and constant(node.left) and constant(node.right):
+            try:
+                value = literal(binary(node.operator, node.left.value, node.right.value))
+            except NotConstant:
+                return node
+            if value is not None:
+                self.stats['folded'] += 1
+                return value
+        elif node.type == Syntax.UnaryExpression and node.operator == '!' and (constant(node.argument) or node.argument.type == Syntax.ArrayExpression and not node.argument.elements):
+            self.stats['folded'] += 1
+            return literal(not to_boolean(node.argument.value if constant(node.argument) else []))
+        elif node.type == Syntax.CallExpression:
+            if self.refers(self.resolved, node.callee) in proxies:
+                function = proxies[node.callee.name]
+            else:
+                function = self.proxy_member(node.callee, proxies)
+            if function is not None and function.type in FUNCTIONS:
+                inlined = self.inline(function, node.arguments)
+                if inlined is not None:
+                    self.stats['proxies'] += 1
+                    return inlined
+        elif node.type in MEMBERS:
+            value = self.proxy_member(node, proxies)
+            if value is not None and constant(value):
+                self.stats['proxies'] += 1
+                return literal(value.value)
+            if node.computed and constant(node.property) and isinstance(node.property.value, str) and IDENTIFIER.fullmatch(node.property.value):
+                self.stats['members'] += 1
+                return StaticMemberExpression(node.object, Identifier(node.property.value))
+        return node
+
+def simplify_program(program: str) -> tuple[str, Counter]:
+    """Code of 'program' simplified, with the number of each simplification."""
+    simplifier = Simplifier(esprima.parseScript(program))
+    ast = simplifier.simplify()
+    return escodegen.generate(ast), simplifier.stats
@@ -0,0 +1,169 @@
+import re
+
+import escodegen
+from esprima.nodes import *
+
+from src.fingerprint import binding_index
+from src.rules import Index
+from src.simplify import walk
+from src.visitor import Binding, Scope, Visitor, count_tokens, node_children
+
+# Stands for the elided nodes in the generated code
+ELIDED = "__elided__"
+# Lists of statements, elided wherever they do not hold a kept node
+STATEMENTS = {Syntax.Program: 'body', Syntax.BlockStatement: 'body', Syntax.SwitchCase: 'consequent'}
+# Lists elided only in the nodes holding a kept node, minified code packs whole modules in them
+PARTS = {Syntax.ObjectExpression: 'properties', Syntax.SequenceExpression: 'expressions', Syntax.VariableDeclaration: 'declarations'}
+DECLARATIONS = {Syntax.FunctionDeclaration, Syntax.ClassDeclaration, Syntax.FunctionExpression, Syntax.ClassExpression}
+
+def is_statement(node: Node) -> bool:
+    return node.type.endswith('Statement') or node.type.endswith('Declaration')
+
+def placeholder(node: Node) -> Node:
+    # Node of the list of 'node' standing for elided ones
+    if node.type == Syntax.ObjectExpression:
+        return Property('init', Identifier(ELIDED), False, Identifier(ELIDED), False, True)
+    if node.type == Syntax.SequenceExpression:
+        return Identifier(ELIDED)
+    if node.type == Syntax.VariableDeclaration:
+        return VariableDeclarator(Identifier(ELIDED), None)
+    return ExpressionStatement(Identifier(ELIDED))
+
+class Slicer:
+    """Contexts made of the code defining, reading or passing a binding in the scope
+    declaring it, with the code defining the other bindings it uses, up to 'hops' times.
+    The units kept are statements, or declarators and expressions of a sequence since
+    minified code packs whole modules in those. The rest is elided as /* ... */ while
+    the nodes holding a kept unit keep their header. The index of the AST is built once."""
+
+    def __init__(self, visitor: Visitor, hops: int = 1):
+        self.index = Index(visitor.ast)
+        self.bindings: dict[int, Binding] = binding_index(visitor)
+        self.hops: int = hops
+
+    def unit(self, node: Node) -> Node | None:
+        # Innermost statement holding 'node', or declarator or expression of a sequence
+        while True:
+            parent, _, _ = self.index.parent(node)
+            if parent is None:
+                return None
+            if parent.type in (Syntax.SequenceExpression, Syntax.VariableDeclaration):
+                return node
+            if is_statement(parent):
+                return parent
+            node = parent
+
+    def is_definition(self, node: Identifier) -> bool:
+        parent, field, _ = self.index.parent(node)
+        if parent is None:
+            return False
+        if parent.type == Syntax.VariableDeclarator or parent.type in DECLARATIONS:
+            return field == 'id'
+        if parent.type == Syntax.AssignmentExpression:
+            return field == 'left'
+        return parent.type == Syntax.UpdateExpression
+
+    def direct_identifiers(self, unit: Node) -> list[Identifier]:
+        # Identifiers of 'unit' outside its nested statements
+        identifiers = []
+        stack = node_children(unit)
+        while stack:
+            node = stack.pop()
+            if node.type == Syntax.Identifier:
+                identifiers.append(node)
+            elif not is_statement(node):
+                stack.extend(node_children(node))
+        return identifiers
+
+    def ancestors(self, node: Node, root: Node) -> list[Node] | None:
+        # Nodes from 'node' up to 'root', None if 'node' is not under 'root'
+        chain = []
+        while node is not None:
+            chain.append(node)
+            if node is root:
+                return chain
+            node, _, _ = self.index.parent(node)
+        return None
+
+    def slice(self, binding: Binding, hops: int, whole: bool = True) -> str:
+        """Code of the scope declaring 'binding' reduced to its slice. With 'whole', the
+        units defining 'binding', like the body of a function, are kept whole."""
+        root = binding.scope.node
+        kept: set[int] = set()
+        needed: set[int] = set()
+
+        def keep(units):
+            added = []
+            for unit in units:
+                if unit is None or id(unit) in kept:
+                    continue
+                chain = self.ancestors(unit, root)
+                if chain is not None:
+                    kept.add(id(unit))
+                    needed.update(id(node) for node in chain)
+                    added.append(unit)
+            return added
+
+        frontier = keep(self.unit(node) for node in binding.references)
+        if whole:
+            for node in binding.references:
+                unit = self.unit(node)
+                if unit is not None and id(unit) in kept and self.is_definition(node):
+                    needed.update(id(child) for child in walk(unit))
+        seen = {id(binding)}
+        for _ in range(hops):
+            # Definitions of the bindings used by the units kept at the previous hop
+            dependencies = []
+            for unit in frontier:
+                for identifier in self.direct_identifiers(unit):
+                    dependency = self.bindings.get(id(identifier))
+                    if dependency is not None and id(dependency) not in seen:
+                        seen.add(id(dependency))
+                        dependencies.append(dependency)
+            frontier = keep(self.unit(node) for dependency in dependencies for node in dependency.references if self.is_definition(node))
+
+        return self.render(root, needed)
+
+    def render(self, root: Node, needed: set[int]) -> str:
+        # Lists are pruned in place for the generation, then restored
+        changes = []
+        placeholders: set[int] = set()
+        stack = [root]
+        try:
+            while stack:
+                node = stack.pop()
+                pruned_field = STATEMENTS.get(node.type) or (PARTS.get(node.type) if id(node) in needed else None)
+                for field, value in node.__dict__.items():
+                    if field == pruned_field:
+                        pruned = []
+                        for child in value:
+                            if child is not None and id(child) in needed:
+                                pruned.append(child)
+                                stack.append(child)
+                            elif not pruned or id(pruned[-1]) not in placeholders:
+                                pruned.append(placeholder(node))
+                                placeholders.add(id(pruned[-1]))
+                        changes.append((node, field, value))
+                        setattr(node, field, pruned)
+                    elif isinstance(value, Node):
+                        stack.append(value)
+                    elif isinstance(value, list):
+                        stack.extend(child for child in value if isinstance(child, Node))
+            code = escodegen.generate(root)
+        finally:
+            for node, field, value in changes:
+                setattr(node, field, value)
+        return re.sub(rf"(?m)^(\s*){ELIDED};$", r"\1/* ... */", code).replace(ELIDED, "/* ... */")
+
+    def get_context(self, scope: Scope, var: str, limit: int) -> str:
+        """Slice of the code for 'var' within 'limit' tokens, with fewer hops if needed, or
+        the context of 'Scope.get_context' when even the units of 'var' do not fit."""
+        binding = scope.resolve(var)
+        if binding is not None and binding.scope.node is not None:
+            for hops, whole in [(hops, True) for hops in range(self.hops, -1, -1)] + [(0, False)]:
+                context = self.slice(binding, hops, whole)
+                tokens = count_tokens(context)
+                if tokens <= limit:
+                    # Nothing worth eliding, the whole code reads better
+                    return binding.scope.get_code() if binding.scope.get_tokens() <= tokens else context
+        return scope.get_context(None, limit, var)
@@ -0,0 +1,67 @@
+FENCE = "```"
+
+class JsonScanner:
+    """Incremental scan of a streamed response: each character is read once to find
+    the top-level {...} objects as soon as they close and the end of the first block fenced
+    with ```'language'. Quotes are only tracked inside objects, so that apostrophes in
+    prose are ignored."""
+
+    def __init__(self, language: str = 'json'):
+        self.opening: str = FENCE + language
+        self.length: int = 0
+        self.depth: int = 0
+        self.quote: str | None = None
+        self.escape: bool = False
+        self.current: list[str] = []
+        self.objects: list[str] = []
+
+        # Last characters of the previous chunks, to find fences split between chunks
+        self.tail: str = ""
+        self.fence_start: int | None = None
+        self.fenced: bool = False
+
+    def feed(self, data: str) -> list[str]:
+        """Scan the next chunk and return the objects closed in it."""
+        closed = []
+        for char in data:
+            if self.depth == 0:
+                if char == '{':
+                    self.depth = 1
+                    self.current = [char]
+                continue
+
+            self.current.append(char)
+            if self.quote:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == self.quote:
+                    self.quote = None
+            elif char in '"\'':
+                self.quote = char
+            elif char == '{':
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    closed.append("".join(self.current))
+                    self.current = []
+
+        self.objects.extend(closed)
+        self.scan_fences(data)
+        return closed
+
+    def scan_fences(self, data: str):
+        window = self.tail + data
+        offset = self.length - len(self.tail)
+        if self.fence_start is None:
+            index = window.find(self.opening)
+            if index >= 0:
+                self.fence_start = offset + index + len(self.opening)
+        if self.fence_start is not None and not self.fenced:
+            index = window.find(FENCE, max(self.fence_start - offset, 0))
+            self.fenced = index >= 0
+
+        self.length += len(data)
+        self.tail = window[-len(self.opening):]
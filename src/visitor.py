@@ -1,142 +1,340 @@
 from esprima.nodes import *
 from typing import Callable
 
+import esprima
 import escodegen
+import re
+import sys
+
+TOKEN = re.compile(r"[\w$]+|[^\w\s]")
+
+# Wrapping making the generated code of a scope node parseable, and the identifiers it adds
+WRAPPERS = {
+    Syntax.FunctionExpression: ('(', ')', 0),
+    Syntax.ArrowFunctionExpression: ('(', ')', 0),
+    Syntax.ClassBody: ('class _ ', '', 1),
+}
+
+def allow_deep_recursion():
+    # The Visitor and the passes of this package are iterative, but esprima parses and
+    # escodegen generates recursively: a chain of a thousand '+' exceeds Python's default limit
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+
+def count_tokens(code: str) -> int:
+    # Estimate of the number of tokens the model will see, stable across renames
+    return len(TOKEN.findall(code))
+
+def node_children(node: Node) -> list[Node]:
+    children = []
+    for value in node.__dict__.values():
+        if isinstance(value, Node):
+            children.append(value)
+        elif isinstance(value, list):
+            children.extend(child for child in value if isinstance(child, Node))
+    return children
+
+def node_types(node: Node) -> list[str]:
+    # Types of the nodes under 'node' in field order, to compare the structure of two trees
+    types = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        types.append(node.type)
+        stack.extend(reversed(node_children(node)))
+    return types
+
+def walk_identifiers(node: Node) -> list[tuple[Identifier, Node | None]]:
+    """Identifiers under 'node' in field order, each with its innermost statement.
+    Iterative, as generated code can be deeply nested."""
+    identifiers = []
+    stack = [(node, None)]
+    while stack:
+        node, statement = stack.pop()
+        if node.type == Syntax.Identifier:
+            identifiers.append((node, statement))
+            continue
+        if node.type.endswith('Statement') or node.type.endswith('Declaration'):
+            statement = node
+        stack.extend((child, statement) for child in reversed(node_children(node)))
+    return identifiers
+
+def locate_identifiers(node: Node, code: str) -> dict[int, tuple[int, int, int, int]]:
+    """Map the id of every Identifier under 'node' to its bounds in 'code', the code
+    generated from 'node', followed by the bounds of its innermost statement.
+    The code is parsed again and both trees are matched identifier by identifier."""
+    prefix, suffix, skip = WRAPPERS.get(node.type, ('', '', 0))
+    try:
+        parsed = esprima.parseScript(prefix + code + suffix, range=True)
+    except esprima.Error:
+        return {}
+
+    original = walk_identifiers(node)
+    generated = walk_identifiers(parsed)[skip:]
+    if len(original) != len(generated):
+        return {}
+
+    offset = len(prefix)
+    positions = {}
+    for (node, _), (identifier, statement) in zip(original, generated):
+        start, end = identifier.range
+        statement_start, statement_end = statement.range if statement else identifier.range
+        positions[id(node)] = (
+            start - offset, end - offset,
+            max(statement_start - offset, 0), min(statement_end - offset, len(code))
+        )
+    return positions
+
+def align_identifiers(node: Node, code: str, rewritten: str) -> dict[int, str]:
+    """Map the id of every Identifier under 'node' to its name in 'rewritten', a copy of
+    'code' (the code generated from 'node') where only names should have changed.
+    Raises ValueError when 'rewritten' does not parse or has another structure."""
+    prefix, suffix, skip = WRAPPERS.get(node.type, ('', '', 0))
+    rewritten = rewritten.strip()
+    if not code.rstrip().endswith(';'):
+        rewritten = rewritten.rstrip(';')
+    try:
+        original = esprima.parseScript(prefix + code + suffix)
+        parsed = esprima.parseScript(prefix + rewritten + suffix)
+    except esprima.Error as e:
+        raise ValueError(f"the code does not parse ({e})")
+    if node_types(original) != node_types(parsed):
+        raise ValueError("the structure of the code has changed")
+
+    identifiers = walk_identifiers(node)
+    renamed = walk_identifiers(parsed)[skip:]
+    if len(identifiers) != len(renamed):
+        raise ValueError("identifiers have been added or removed")
+    return {id(identifier): new.name for (identifier, _), (new, _) in zip(identifiers, renamed)}
+
+class Binding:
+    def __init__(self, name: str, scope: 'Scope'):
+        self.name: str = name
+        self.scope: Scope = scope
+        self.references: list[Identifier] = []
+        self.scopes: set[Scope] = set()
+        self.containers: set[Scope] = set()
+        self.shorthands: list[Property] = []
+
+    def __repr__(self):
+        return f"Binding({self.name}, references={len(self.references)})"
+
+    def add_reference(self, node: Identifier, scope: 'Scope', container: 'Scope' = None):
+        # 'scope' resolves the name, 'container' is the innermost scope whose code holds the node
+        self.references.append(node)
+        self.scopes.add(scope)
+        self.containers.add(container or scope)
+
+    def is_captured(self, name: str) -> bool:
+        # A reference would be captured if a scope between it and the declaration declares 'name'
+        for scope in self.scopes:
+            while scope and scope != self.scope:
+                if name in scope.declared:
+                    return True
+                scope = scope.parent
+        return False
+
+    def rename(self, new_name: str):
+        for node in self.references:
+            node.name = new_name
+        for prop in self.shorthands:
+            prop.shorthand = False
+        for container in self.containers:
+            container.invalidate()
+        self.name = new_name
 
 class Scope:
     def __init__(self, parent = None, node = None):
         self.parent: Scope = parent
         self.node: Node = node
         self.declared = set()
+        self.bindings: dict[str, Binding] = {}
         self.children: list[Scope] = []
 
-    def __repr__(self, depth: int = 0):
-        text = f"{'  ' * depth}Scope(declared={self.declared}:"
-        for child in self.children:
-            text += f"\n{child.__repr__(depth + 1)}"
-        return text
+        # Generated code cache, dropped for this scope and its ancestors on rename
+        self.code: str | None = None
+        self.tokens: int | None = None
+        self.positions: dict[int, tuple[int, int, int, int]] | None = None
+
+    def __repr__(self):
+        lines = []
+        stack = [(self, 0)]
+        while stack:
+            scope, depth = stack.pop()
+            lines.append(f"{'  ' * depth}Scope(declared={scope.declared}:")
+            stack.extend((child, depth + 1) for child in reversed(scope.children))
+        return "\n".join(lines)
     
     def __iter__(self):
-        for child in self.children:
-            yield from child
+        # Scopes in traversal order, without recursion
+        stack = [self]
+        while stack:
+            scope = stack.pop()
+            yield scope
+            stack.extend(reversed(scope.children))
 
     def count_declared(self) -> int:
-        total = len(self.declared)
-        for child in self.children:
-            total += child.count_declared()
-        return total
+        return sum(len(scope.declared) for scope in self)
     
     def get_parent_defined(self, var: str) -> bool:
-        if var in self.declared:
-            return True
-        if self.parent:
-            return self.parent.get_parent_defined(var)
+        scope = self
+        while scope:
+            if var in scope.declared:
+                return True
+            scope = scope.parent
         return False
 
+    def resolve(self, var: str) -> Binding | None:
+        scope = self
+        while scope:
+            if var in scope.bindings:
+                return scope.bindings[var]
+            scope = scope.parent
+        return None
+
+    def declare(self, var: str) -> Binding:
+        self.declared.add(var)
+        if var not in self.bindings:
+            self.bindings[var] = Binding(var, self)
+        return self.bindings[var]
+
     def change_name(self, visitor: 'Visitor', old_name: str, new_name: str):
-        if old_name not in self.declared:
-            print(f"Variable '{old_name}' not declared in scope")
+        self.change_names(visitor, {old_name: new_name})
+
+    def change_names(self, visitor: 'Visitor', changes: dict[str, str]) -> dict[str, str]:
+        """Rename several bindings of this scope at once. Renames are simultaneous,
+        so swaps and chains (a -> b, b -> c) behave as expected. Returns the names
+        that have been applied once collisions are resolved."""
+        undeclared = {old: new for old, new in changes.items() if old not in self.declared}
+        if undeclared:
+            print(f"Variables {list(undeclared)} not declared in scope")
             if self.parent:
-                self.parent.change_name(visitor, old_name, new_name)
-                return
-            
-        while self.get_parent_defined(new_name):
-            new_name = "_" + new_name
-        
-        if new_name in self.declared:
-            new_name = "_" + new_name
-            while self.get_parent_defined(new_name):
+                self.parent.change_names(visitor, undeclared)
+
+        changes = {old: new for old, new in changes.items() if old in self.declared and old != new}
+        if not changes:
+            return {}
+
+        # Names still declared once the batch is applied
+        taken = self.declared - changes.keys()
+        applied: dict[str, str] = {}
+        for old_name, new_name in changes.items():
+            binding = self.bindings[old_name]
+            while (new_name in taken
+                   or (self.parent and self.parent.get_parent_defined(new_name))
+                   or binding.is_captured(new_name)):
                 new_name = "_" + new_name
-        
-        # Rename in declared and used lists
-        if old_name in self.declared:
-            self.declared.remove(old_name)
+            taken.add(new_name)
+            applied[old_name] = new_name
+
+        # Rename in declared list and binding table
+        bindings = {old_name: self.bindings.pop(old_name) for old_name in applied}
+        self.declared.difference_update(applied.keys())
+        for old_name, new_name in applied.items():
             self.declared.add(new_name)
-        
-        # Define the task to rename identifiers in the AST
-        def task(node: Node, scope: Scope):
-            if old_name in scope.declared:
-                return
-            if node.type == Syntax.Identifier and node.name == old_name:
-                node.name = new_name
-
-        # Set the task and visit the nodes in this scope
-        visitor.set_task(task)
-        visitor.visit(self)
+            self.bindings[new_name] = bindings[old_name]
+
+            # Only the identifiers resolving to this binding are touched
+            bindings[old_name].rename(new_name)
+
+        return applied
+
+    def invalidate(self, structure: bool = False):
+        # Renames keep the token estimate, a change of 'structure' drops it
+        scope = self
+        while scope:
+            scope.code = None
+            scope.positions = None
+            if structure:
+                scope.tokens = None
+            scope = scope.parent
 
     def replace_ast(self, visitor: 'Visitor', new_ast: Script):
         self.node = new_ast.body[0]
+        self.invalidate(True)
 
     def get_code(self) -> str:
-        return escodegen.generate(self.node)
-
-    def get_context(self, visitor: 'Visitor', limit: int, var: str) -> str:
+        if self.code is None:
+            self.code = escodegen.generate(self.node)
+        return self.code
+
+    def get_length(self) -> int:
+        return len(self.get_code())
+
+    def get_tokens(self) -> int:
+        # Renames do not change the estimate, so it is never invalidated by them
+        if self.tokens is None:
+            self.tokens = count_tokens(self.get_code())
+        return self.tokens
+
+    def get_positions(self) -> dict[int, tuple[int, int, int, int]]:
+        if self.positions is None:
+            self.positions = locate_identifiers(self.node, self.get_code())
+        return self.positions
+
+    def get_enclosing(self, limit: int) -> 'Scope':
+        # Largest enclosing scope whose code fits in 'limit' tokens
         current_scope = self
         while True:
             if not current_scope.parent:
                 break
-            if len(escodegen.generate(current_scope.parent.node)) <= limit:
+            if current_scope.parent.get_tokens() <= limit:
                 current_scope = current_scope.parent
             else:
                 break
-        
-        code = escodegen.generate(current_scope.node)
-        if len(code) <= limit:
+        return current_scope
+
+    def get_context(self, visitor: 'Visitor', limit: int, var: str) -> str:
+        """Code where 'var' appears, within 'limit' tokens. When the enclosing code is too long,
+        only the statements holding a reference to the binding are kept, or their line when
+        a statement is itself too long."""
+        enclosing = self.get_enclosing(limit)
+        code = enclosing.get_code()
+        if enclosing.get_tokens() <= limit:
             return code
 
-        # Trouver toutes les positions des occurrences de la variable 'var' dans le code
-        occurrences = []
-        index = code.find(var)
-        while index != -1:
-            occurrences.append(index)
-            index = code.find(var, index + len(var))
+        binding = self.resolve(var)
+        positions = enclosing.get_positions()
+        occurrences = sorted(positions[id(node)] for node in binding.references if id(node) in positions) if binding else []
+        if not occurrences:
+            # The generated code could not be matched with the AST, fall back on the text
+            occurrences = [(match.start(), match.end(), 0, len(code)) for match in re.finditer(rf"(?<![\w$.]){re.escape(var)}(?![\w$])", code)]
 
         if not occurrences:
             return ""  # La variable n'est pas présente dans le code
 
-        # Regrouper les occurrences proches en clusters
-        clusters = []
-        cluster = [occurrences[0]]
-        for i in range(1, len(occurrences)):
-            if occurrences[i] - occurrences[i - 1] <= 50:  # Seuil de proximité (ajustable)
-                cluster.append(occurrences[i])
+        window_limit = max(limit // len(occurrences), 32)
+        windows = []
+        for start, end, statement_start, statement_end in occurrences:
+            if count_tokens(code[statement_start:statement_end]) > window_limit:
+                statement_start = code.rfind('\n', 0, start) + 1
+                statement_end = code.find('\n', end)
+                if statement_end == -1:
+                    statement_end = len(code)
+
+                # Clip long lines around the reference, about 4 characters per token
+                if count_tokens(code[statement_start:statement_end]) > window_limit:
+                    statement_start = max(statement_start, start - window_limit * 2)
+                    statement_end = min(statement_end, end + window_limit * 2)
+            windows.append((statement_start, statement_end))
+
+        # Merge the windows overlapping or only separated by blanks
+        windows.sort()
+        merged = [windows[0]]
+        for start, end in windows[1:]:
+            if start <= merged[-1][1] or not code[merged[-1][1]:start].strip():
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
             else:
-                clusters.append(cluster)
-                cluster = [occurrences[i]]
-        clusters.append(cluster)  # Ajouter le dernier cluster
+                merged.append((start, end))
 
-        # Générer les fragments autour de chaque cluster
         fragments = []
-        total_length = 0
-        max_fragment_size = limit // len(clusters)  # Taille maximale par fragment
-
-        for cluster in clusters:
-            # Déterminer les bornes du fragment pour le cluster
-            start = cluster[0]
-            end = cluster[-1] + len(var)
-
-            # Étendre le fragment pour ajouter du contexte, sans dépasser les limites
-            context_size = (max_fragment_size - (end - start)) // 2
-            context_size = max(context_size, 30)  # Contexte minimum de 30 caractères de chaque côté
-
-            fragment_start = max(0, start - context_size)
-            fragment_end = min(len(code), end + context_size)
-
-            fragment = code[fragment_start:fragment_end]
-
-            fragment_length = len(fragment)
-            if total_length + fragment_length > limit:
-                # Si ajouter ce fragment dépasse la limite, on doit ajuster la taille
-                available_length = limit - total_length
-                if available_length <= 0:
-                    break  # Plus d'espace disponible
-                fragment = fragment[:available_length]
-                fragments.append(fragment)
-                total_length += len(fragment)
+        total_tokens = 0
+        for start, end in merged:
+            fragment = code[start:end]
+            tokens = count_tokens(fragment)
+            if total_tokens + tokens > limit:
                 break
-            else:
-                fragments.append(fragment)
-                total_length += fragment_length
+            fragments.append(fragment)
+            total_tokens += tokens
 
         # Combiner les fragments avec des séparateurs
         return "\n[...]\n".join(fragments)
@@ -144,25 +342,90 @@ class Scope:
 class Visitor:
     def __init__(self, ast: Script):
         self.ast: Script = ast
-        self.current_task: Callable = lambda node, scope: None
+        self.current_task: Callable | None = None
+        self.task_types: set[str] | None = None
         self.global_scope = Scope(node=self.ast)
         self.current_scope = self.global_scope
+        self.node_scopes: dict[int, Scope] = {id(self.ast): self.global_scope}
+
+        # Node types needing more than visiting the fields listed in CHILDREN
+        self.handlers: dict[str, Callable] = {
+            Syntax.Identifier: self.visit_identifier,
+            Syntax.VariableDeclaration: self.visit_variable_declaration,
+            Syntax.MemberExpression: self.visit_member_expression,
+            Syntax.BlockStatement: self.visit_block_statement,
+            Syntax.FunctionDeclaration: self.visit_function,
+            Syntax.FunctionExpression: self.visit_function,
+            Syntax.ArrowFunctionExpression: self.visit_function,
+            Syntax.ClassDeclaration: self.visit_class,
+            Syntax.ClassExpression: self.visit_class,
+            Syntax.ClassBody: self.visit_class_body,
+            Syntax.MethodDefinition: self.visit_method_definition,
+            Syntax.Property: self.visit_property,
+            Syntax.Literal: self.visit_literal,
+        }
+        self.references: list[tuple[Identifier, Scope]] = []
+        self.shorthands: list[tuple[Property, Scope]] = []
+
+        # Bound identifiers in source order and shorthand properties, used by render()
+        self.identifiers: list[Identifier] = []
+        self.shorthand_values: dict[int, Property] = {}
+
+        # Function scopes holding the identifier of their own declaration
+        self.containers: dict[int, Scope] = {}
 
         # First pass to build the scope tree
         self.initialized = False
         self.visit_node(self.ast)
         self.initialized = True
 
+        self.bind_references()
+
+    def bind_references(self):
+        # Resolve once the scope tree is complete so that hoisted declarations are seen
+        for node, scope in self.references:
+            binding = scope.resolve(node.name)
+            if binding:
+                binding.add_reference(node, scope, self.containers.get(id(node)))
+                self.identifiers.append(node)
+        for prop, scope in self.shorthands:
+            binding = scope.resolve(prop.value.name)
+            if binding:
+                binding.shorthands.append(prop)
+                self.shorthand_values[id(prop.value)] = prop
+        self.references = []
+        self.shorthands = []
+        self.containers = {}
+
+        if self.identifiers and getattr(self.identifiers[0], 'range', None):
+            self.identifiers.sort(key=lambda node: node.range[0])
+
+    def render(self, program: str) -> str:
+        """Build the output by splicing the current names into the original source.
+        The AST must have been parsed from 'program' with range=True."""
+        output = []
+        position = 0
+        for node in self.identifiers:
+            start, end = node.range
+            output.append(program[position:start])
+            prop = self.shorthand_values.get(id(node))
+            if prop and not prop.shorthand:
+                output.append(f"{prop.key.name}: {node.name}")
+            else:
+                output.append(node.name)
+            position = end
+        output.append(program[position:])
+        return "".join(output)
+
     def enter_scope(self, node: Node):
         if node == self.current_scope.node:
             return
-        for child in self.current_scope.children:
-            if child.node == node:
-                self.current_scope = child
-                return
-        new_scope = Scope(parent=self.current_scope, node=node)
-        self.current_scope.children.append(new_scope)
-        self.current_scope = new_scope
+        scope = self.node_scopes.get(id(node))
+        if scope is None:
+            scope = Scope(parent=self.current_scope, node=node)
+            self.current_scope.children.append(scope)
+            self.node_scopes[id(node)] = scope
+        self.current_scope = scope
 
     def exit_scope(self):
         if self.current_scope.parent:
@@ -170,12 +433,22 @@ class Visitor:
         else:
             self.current_scope = None
 
-    def declare_identifier(self, name: str):
+    def declare_identifier(self, name: str, hoisted: bool = False):
+        # 'hoisted' names are declared in the enclosing function or program, not in a block
+        if not self.initialized:
+            scope = self.current_scope
+            while hoisted and scope.node.type not in HOISTING:
+                scope = scope.parent
+            scope.declare(name)
+
+    def reference_identifier(self, node: Identifier):
         if not self.initialized:
-            self.current_scope.declared.add(name)
+            self.references.append((node, self.current_scope))
 
-    def set_task(self, task: Callable = lambda node, scope: None):
+    def set_task(self, task: Callable = None, types: set[str] = None):
+        # 'types' restricts the node types the task is called on
         self.current_task = task
+        self.task_types = types
 
     def visit(self, scope: Scope = None):
         if scope is None:
@@ -184,230 +457,168 @@ class Visitor:
         self.current_scope = scope
         self.visit_node(node)
 
-    def visit_node(self, node: Node, scope: bool = False):
-        self.current_task(node, self.current_scope)
-        match node.type:
-            case Syntax.Program:
-                for body in node.body:
-                    self.visit_node(body)
-            case Syntax.Identifier:
-                pass
-
-            case Syntax.VariableDeclarator:
-                if node.id.type == Syntax.Identifier:
-                    self.declare_identifier(node.id.name)
-
-                self.visit_node(node.id)
-                if node.init:
-                    self.visit_node(node.init)
-
-            case Syntax.ExpressionStatement:
-                self.visit_node(node.expression)
-            case Syntax.AssignmentExpression:
-                self.visit_node(node.left)
-                self.visit_node(node.right)
-            case Syntax.MemberExpression:
-                self.visit_node(node.object)
-                self.visit_node(node.property)
-            case Syntax.UnaryExpression:
-                self.visit_node(node.argument)
-            case Syntax.NewExpression:
-                self.visit_node(node.callee)
-                for arg in node.arguments:
-                    assert arg
-                    self.visit_node(arg)
-            case Syntax.CallExpression:
-                self.visit_node(node.callee)       
-                for arg in node.arguments:
-                    self.visit_node(arg)
-            case Syntax.IfStatement:
-                self.visit_node(node.test)
-                self.visit_node(node.consequent)
-
-                if node.alternate:
-                    self.visit_node(node.alternate)
-            case Syntax.VariableDeclaration:
-                for decl in node.declarations:
-                    assert decl
-                    self.visit_node(decl)
-
-            case Syntax.BlockStatement:
-                if not scope:
-                    self.enter_scope(node)
-                for body in node.body:
-                    self.visit_node(body)
-                if not scope:
-                    self.exit_scope()
-
-            case Syntax.FunctionDeclaration:
-                if node.id and node.id.type == Syntax.Identifier:
-                    self.declare_identifier(node.id.name)
-                    self.visit_node(node.id)
-
-                self.enter_scope(node)
-                for param in node.params:
-                    if param.type == Syntax.Identifier:
-                        self.declare_identifier(param.name)
-                    self.visit_node(param)
-
-                self.visit_node(node.body, scope=True)
-                self.exit_scope()
-
-            case Syntax.FunctionExpression | Syntax.ArrowFunctionExpression:
-                self.enter_scope(node)
-
-                for param in node.params:
-                    if param.type == Syntax.Identifier:
-                        self.declare_identifier(param.name)
-                    self.visit_node(param)
-
-                self.visit_node(node.body, scope=True)
-                self.exit_scope()
-
-            case Syntax.ClassDeclaration:
-                if node.id and node.id.type == Syntax.Identifier:
-                    self.declare_identifier(node.id.name)
-                    self.visit_node(node.id)
-
-                if node.body:
-                    self.visit_node(node.body)
-
-            case Syntax.ClassExpression:
-                if node.id and node.id.type == Syntax.Identifier:
-                    self.declare_identifier(node.id.name)
-                    self.visit_node(node.id)
-
-                if node.body:
-                    self.visit_node(node.body)
-
-            case Syntax.ClassBody:
-                self.enter_scope(node)
-                for element in node.body:
-                    self.visit_node(element)
-                self.exit_scope()
-
-            case Syntax.MethodDefinition:
-                if node.key:
-                    self.visit_node(node.key)
-                    self.declare_identifier(node.key.name)
-
-                if node.value:
-                    self.visit_node(node.value)
-
-
-            case Syntax.ThisExpression:
-                pass
-            case Syntax.BinaryExpression:
-                self.visit_node(node.left)
-                self.visit_node(node.right)
-            case Syntax.UpdateExpression:
-                self.visit_node(node.argument)
-            case Syntax.LogicalExpression:
-                self.visit_node(node.left)
-                self.visit_node(node.right)
-            case Syntax.ReturnStatement:
-                if node.argument:
-                    self.visit_node(node.argument)
-
-            case Syntax.WhileStatement | Syntax.DoWhileStatement:
-                self.visit_node(node.test)
-                self.visit_node(node.body)
-
-            case Syntax.ForInStatement | Syntax.ForOfStatement:
-                self.visit_node(node.left)
-                self.visit_node(node.right)
-                self.visit_node(node.body)
-
-            case Syntax.ArrayExpression:
-                for element in node.elements:
-                    self.visit_node(element)
-            case Syntax.ObjectExpression:
-                for prop in node.properties:
-                    self.visit_node(prop)
-            case Syntax.Property:
-                self.visit_node(node.key)
-                self.visit_node(node.value)
-            case Syntax.ConditionalExpression:
-                self.visit_node(node.test)
-                self.visit_node(node.consequent)
-                if node.alternate:
-                    self.visit_node(node.alternate)
-            case Syntax.ArrayPattern:
-                for element in node.elements:
-                    self.visit_node(element)
-            case Syntax.ObjectPattern:
-                for prop in node.properties:
-                    self.visit_node(prop)
-            case Syntax.SpreadElement:
-                self.visit_node(node.argument)
-            case Syntax.AssignmentExpression:
-                self.visit_node(node.left)
-                self.visit_node(node.right)
-            case Syntax.AssignmentPattern:
-                self.visit_node(node.left)
-                self.visit_node(node.right)
-
-            case Syntax.ForStatement:
-                if node.init:
-                    self.visit_node(node.init)
-                if node.test:
-                    self.visit_node(node.test)
-                if node.update:
-                    self.visit_node(node.update)
-                self.visit_node(node.body)
-
-            case Syntax.TryStatement:
-                self.visit_node(node.block)
-                if node.handler:
-                    self.visit_node(node.handler)
-                if node.finalizer:
-                    self.visit_node(node.finalizer)
-            case Syntax.CatchClause:
-                self.visit_node(node.param)
-                self.visit_node(node.body)
-            case Syntax.SwitchStatement:
-                self.visit_node(node.discriminant)
-                for case in node.cases:
-                    self.visit_node(case)
-            case Syntax.SwitchCase:
-                if node.test:
-                    self.visit_node(node.test)
-                for consequent in node.consequent:
-                    self.visit_node(consequent)
-            case Syntax.BreakStatement:
-                if node.label:
-                    self.visit_node(node.label)
-            case Syntax.ContinueStatement:
-                if node.label:
-                    self.visit_node(node.label)
-            case Syntax.ReturnStatement:
-                if node.argument:
-                    self.visit_node(node.argument)
-            case Syntax.WithStatement:
-                self.visit_node(node.object)
-            case Syntax.TaggedTemplateExpression:
-                self.visit_node(node.tag)
-                self.visit_node(node.quasi)
-            case Syntax.MethodDefinition:
-                if node.computed:
-                    self.visit_node(node.computed)
-                if node.value:
-                    self.visit_node(node.value)
-            case Syntax.TemplateLiteral:
-                for expression in node.expressions:
-                    self.visit_node(expression)
-            case Syntax.TemplateElement:
-                self.visit_node(node.value)
-            case Syntax.MetaProperty:
-                self.visit_node(node.meta)
-            case Syntax.Literal:
-                # Fix bugs in escodegen
-                if isinstance(node.value, str):
-                    # Escape inner double quotes
-                    node.value = node.value.replace("'", '"')
-
-            case Syntax.SequenceExpression:
-                for expression in node.expressions:
-                    self.visit_node(expression)
-            case _:
-                print(f"Type unknown: {node.type} from path {node.path}")
\ No newline at end of file
+    def visit_node(self, node: Node, scope: bool = False, reference: bool = True):
+        # Explicit stack instead of recursion: items are (node, scope, reference) or actions to run
+        stack: list = [(node, scope, reference)]
+        while stack:
+            item = stack.pop()
+            if callable(item):
+                item()
+                continue
+
+            node, scope, reference = item
+            if self.current_task and (self.task_types is None or node.type in self.task_types):
+                self.current_task(node, self.current_scope)
+
+            handler = self.handlers.get(node.type)
+            if handler:
+                handler(node, scope, reference, stack)
+                continue
+
+            fields = CHILDREN.get(node.type)
+            if fields is None:
+                print(f"Type unknown: {node.type} from path {node.path}")
+                continue
+            push_children(stack, node, fields)
+
+    def visit_identifier(self, node: Identifier, scope: bool, reference: bool, stack: list):
+        if reference:
+            self.reference_identifier(node)
+
+    def visit_variable_declaration(self, node: VariableDeclaration, scope: bool, reference: bool, stack: list):
+        for declarator in node.declarations:
+            if declarator.id.type == Syntax.Identifier:
+                self.declare_identifier(declarator.id.name, node.kind == 'var')
+        push_children(stack, node, CHILDREN[Syntax.VariableDeclaration])
+
+    def visit_member_expression(self, node: StaticMemberExpression, scope: bool, reference: bool, stack: list):
+        stack.append((node.property, False, bool(node.computed)))
+        stack.append((node.object, False, True))
+
+    def visit_block_statement(self, node: BlockStatement, scope: bool, reference: bool, stack: list):
+        # Function bodies belong to the scope of their function
+        if not scope:
+            self.enter_scope(node)
+            stack.append(self.exit_scope)
+        push_children(stack, node, CHILDREN[Syntax.BlockStatement])
+
+    def visit_function(self, node: FunctionDeclaration, scope: bool, reference: bool, stack: list):
+        def enter():
+            self.enter_scope(node)
+            if node.id and node.type == Syntax.FunctionDeclaration and not self.initialized:
+                self.containers[id(node.id)] = self.current_scope
+            for param in node.params:
+                if param.type == Syntax.Identifier:
+                    self.declare_identifier(param.name)
+
+        stack.append(self.exit_scope)
+        stack.append((node.body, True, True))
+        stack.extend((param, False, True) for param in reversed(node.params))
+        stack.append(enter)
+        if node.type == Syntax.FunctionDeclaration and node.id and node.id.type == Syntax.Identifier:
+            self.declare_identifier(node.id.name, True)
+            stack.append((node.id, False, True))
+
+    def visit_class(self, node: ClassDeclaration, scope: bool, reference: bool, stack: list):
+        if node.body:
+            stack.append((node.body, False, True))
+        if node.id and node.id.type == Syntax.Identifier:
+            self.declare_identifier(node.id.name)
+            stack.append((node.id, False, True))
+
+    def visit_class_body(self, node: ClassBody, scope: bool, reference: bool, stack: list):
+        self.enter_scope(node)
+        stack.append(self.exit_scope)
+        push_children(stack, node, CHILDREN[Syntax.ClassBody])
+
+    def visit_method_definition(self, node: MethodDefinition, scope: bool, reference: bool, stack: list):
+        if node.value:
+            stack.append((node.value, False, True))
+        if node.key:
+            if node.key.type == Syntax.Identifier:
+                self.declare_identifier(node.key.name)
+            stack.append((node.key, False, True))
+
+    def visit_property(self, node: Property, scope: bool, reference: bool, stack: list):
+        stack.append((node.value, False, True))
+        stack.append((node.key, False, bool(node.computed)))
+        if node.shorthand and node.value.type == Syntax.Identifier and not self.initialized:
+            self.shorthands.append((node, self.current_scope))
+
+    def visit_literal(self, node: Literal, scope: bool, reference: bool, stack: list):
+        # Fix bugs in escodegen
+        if isinstance(node.value, str):
+            # Escape inner double quotes
+            node.value = node.value.replace("'", '"')
+
+def push_children(stack: list, node: Node, fields: tuple[tuple[str, bool], ...]):
+    # Pushed in reverse so that children are visited in field order
+    for field, reference in reversed(fields):
+        value = getattr(node, field)
+        if isinstance(value, list):
+            stack.extend((child, False, reference) for child in reversed(value) if child is not None)
+        elif value is not None:
+            stack.append((value, False, reference))
+
+FUNCTIONS = {Syntax.FunctionExpression, Syntax.ArrowFunctionExpression, Syntax.FunctionDeclaration}
+# Scopes holding the 'var' and function declarations of their blocks
+HOISTING = {Syntax.Program} | FUNCTIONS
+
+# Children visited for each node type, with whether an Identifier in the field is a reference
+CHILDREN: dict[str, tuple[tuple[str, bool], ...]] = {
+    Syntax.Program: (('body', True),),
+    Syntax.Identifier: (),
+    Syntax.VariableDeclarator: (('id', True), ('init', True)),
+    Syntax.ExpressionStatement: (('expression', True),),
+    Syntax.AssignmentExpression: (('left', True), ('right', True)),
+    Syntax.UnaryExpression: (('argument', True),),
+    Syntax.NewExpression: (('callee', True), ('arguments', True)),
+    Syntax.CallExpression: (('callee', True), ('arguments', True)),
+    Syntax.IfStatement: (('test', True), ('consequent', True), ('alternate', True)),
+    Syntax.VariableDeclaration: (('declarations', True),),
+    Syntax.BlockStatement: (('body', True),),
+    Syntax.ClassBody: (('body', True),),
+    Syntax.ThisExpression: (),
+    Syntax.BinaryExpression: (('left', True), ('right', True)),
+    Syntax.UpdateExpression: (('argument', True),),
+    Syntax.LogicalExpression: (('left', True), ('right', True)),
+    Syntax.ReturnStatement: (('argument', True),),
+    Syntax.WhileStatement: (('test', True), ('body', True)),
+    Syntax.DoWhileStatement: (('test', True), ('body', True)),
+    Syntax.ForInStatement: (('left', True), ('right', True), ('body', True)),
+    Syntax.ForOfStatement: (('left', True), ('right', True), ('body', True)),
+    Syntax.ArrayExpression: (('elements', True),),
+    Syntax.ObjectExpression: (('properties', True),),
+    Syntax.ConditionalExpression: (('test', True), ('consequent', True), ('alternate', True)),
+    Syntax.ArrayPattern: (('elements', True),),
+    Syntax.ObjectPattern: (('properties', True),),
+    Syntax.SpreadElement: (('argument', True),),
+    Syntax.AssignmentPattern: (('left', True), ('right', True)),
+    Syntax.ForStatement: (('init', True), ('test', True), ('update', True), ('body', True)),
+    Syntax.TryStatement: (('block', True), ('handler', True), ('finalizer', True)),
+    Syntax.CatchClause: (('param', True), ('body', True)),
+    Syntax.SwitchStatement: (('discriminant', True), ('cases', True)),
+    Syntax.SwitchCase: (('test', True), ('consequent', True)),
+    Syntax.BreakStatement: (('label', False),),
+    Syntax.ContinueStatement: (('label', False),),
+    Syntax.WithStatement: (('object', True),),
+    Syntax.TaggedTemplateExpression: (('tag', True), ('quasi', True)),
+    Syntax.TemplateLiteral: (('expressions', True),),
+    Syntax.MetaProperty: (('meta', False),),
+    Syntax.SequenceExpression: (('expressions', True),),
+    Syntax.ThrowStatement: (('argument', True),),
+    Syntax.EmptyStatement: (),
+    Syntax.DebuggerStatement: (),
+    Syntax.LabeledStatement: (('label', False), ('body', True)),
+    Syntax.RestElement: (('argument', True),),
+    Syntax.AwaitExpression: (('argument', True),),
+    Syntax.YieldExpression: (('argument', True),),
+    Syntax.Super: (),
+    Syntax.Import: (),
+    # Modules, for the library sources: imported names are left unresolved like globals
+    Syntax.ImportDeclaration: (),
+    Syntax.ExportNamedDeclaration: (('declaration', True), ('specifiers', True)),
+    Syntax.ExportDefaultDeclaration: (('declaration', True),),
+    Syntax.ExportAllDeclaration: (),
+    Syntax.ExportSpecifier: (('local', True),),
+}
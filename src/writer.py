@@ -0,0 +1,86 @@
+import atexit
+import os
+import threading
+import time
+from typing import Callable
+
+class Writer:
+    """Single background writer keeping only the newest snapshot of the output.
+
+    The snapshot is rendered on the caller thread (the AST is never read
+    concurrently) at most every `interval` seconds or `renames` renames, and
+    written atomically through a temporary file."""
+
+    def __init__(self, path: str, render: Callable[[], str], interval: float = 5.0, renames: int = 50):
+        self.path: str = path
+        self.render: Callable[[], str] = render
+        self.interval: float = interval
+        self.renames: int = renames
+
+        self.pending_renames: int = 0
+        self.last_render: float = 0.0
+        self.snapshot: str | None = None
+        self.writing: bool = False
+        self.closed: bool = False
+        self.condition = threading.Condition()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def update(self, renames: int = 0):
+        self.pending_renames += renames
+        if self.pending_renames >= self.renames or time.monotonic() - self.last_render >= self.interval:
+            self.submit()
+
+    def submit(self):
+        output = self.render()
+        self.pending_renames = 0
+        self.last_render = time.monotonic()
+        with self.condition:
+            # An older snapshot not yet written is simply replaced
+            self.snapshot = output
+            self.condition.notify_all()
+
+    def flush(self):
+        if self.pending_renames or self.last_render == 0.0:
+            self.submit()
+        with self.condition:
+            while self.snapshot is not None or self.writing:
+                self.condition.wait()
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.snapshot is None and not self.closed:
+                    self.condition.wait()
+                if self.snapshot is None:
+                    return
+                output, self.snapshot = self.snapshot, None
+                self.writing = True
+
+            try:
+                self.write(output)
+            except OSError as e:
+                print(f"Could not save {self.path}: {e}")
+            finally:
+                with self.condition:
+                    self.writing = False
+                    self.condition.notify_all()
+
+    def write(self, output: str):
+        temp = f"{self.path}.tmp"
+        with open(temp, 'w') as file:
+            file.write(output)
+        os.replace(temp, self.path)
+
+        print(f"Saved {self.path}")
@@ -0,0 +1,36 @@
+import pytest # type: ignore
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.backend import Backend
+from src.batch import run_file
+
+
+class NameBackend(Backend):
+    # Names each variable asked alone 'renamed_<name>', or as given in 'names',
+    # and raises KeyboardInterrupt once 'limit' prompts have been answered
+    def __init__(self, limit=None, names=None):
+        self.prompts = []
+        self.limit = limit
+        self.names = names or {}
+
+    def generate(self, model, prompt, system, options, format=None):
+        if self.limit is not None and len(self.prompts) == self.limit:
+            raise KeyboardInterrupt
+        self.prompts.append(prompt)
+        var = prompt.split("variable/function `")[1].split("`")[0]
+        yield {'response': "```json\n{'name': '%s'}\n```" % self.names.get(var, 'renamed_' + var), 'done': False}
+
+
+@pytest.fixture
+def deobfuscate(tmp_path):
+    """Run 'code' written to app.js through run_file, without prediction cache nor batch
+    prompts unless 'options' says otherwise. Outputs go to the folder 'name' of tmp_path."""
+    def run(code: str, options: dict = None, backend: Backend = None, name: str = 'out') -> dict:
+        (tmp_path / 'app.js').write_text(code)
+        options = {'cache_file': None, 'batch': False, **(options or {})}
+        return run_file(str(tmp_path / 'app.js'), str(tmp_path / name / 'app'), options, backend or NameBackend())
+    return run
@@ -0,0 +1,29 @@
+import pytest # type: ignore
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.backend import Backend, RecordingBackend, ReplayBackend
+from src.local import Model
+
+
+class FakeBackend(Backend):
+    def generate(self, model, prompt, system, options, format=None):
+        yield {'response': "The name is ", 'done': False}
+        yield {'response': "```json\n{'name': 'color'}\n```", 'done': False}
+        yield {'response': "", 'done': True, 'context': [1, 2], 'prompt_eval_count': 12, 'eval_count': 5}
+
+
+def test_1(tmp_path):
+    transcript = str(tmp_path / 'transcript.jsonl')
+
+    model = Model(backend=RecordingBackend(FakeBackend(), transcript))
+    assert model.predict('f', "g.fillStyle = f;", set()) == 'color'
+
+    model = Model(backend=ReplayBackend(transcript, chunk_size=3))
+    assert model.predict('f', "g.fillStyle = f;", set()) == 'color'
+
+    with pytest.raises(KeyError):
+        model.predict('k', "k.globalAlpha = 1;", set())
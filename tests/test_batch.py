@@ -0,0 +1,39 @@
+import pytest # type: ignore
+
+import sys
+import os
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.backend import Backend, RateLimitedBackend
+from src.batch import expand_inputs, output_folders
+
+
+class FakeBackend(Backend):
+    def generate(self, model, prompt, system, options, format=None):
+        yield {'response': "```json\n{'name': 'value'}\n```", 'done': False}
+
+
+def test_1(tmp_path):
+    (tmp_path / 'dist' / 'vendor').mkdir(parents=True)
+    for name in ['dist/app.js', 'dist/vendor/lib.js', 'dist/vendor/lib.mjs', 'dist/readme.txt']:
+        (tmp_path / name).write_text("var a = 1;")
+
+    files = expand_inputs([str(tmp_path / 'dist'), str(tmp_path / 'dist' / '*.js')])
+    assert [os.path.relpath(file, tmp_path) for file in files] == ['dist/app.js', 'dist/vendor/lib.js', 'dist/vendor/lib.mjs']
+
+    folders = output_folders(files, 'out')
+    assert sorted(folders.values()) == [os.path.join('out', 'app'), os.path.join('out', 'vendor', 'lib'), os.path.join('out', 'vendor', 'lib_mjs')]
+
+    with pytest.raises(FileNotFoundError):
+        expand_inputs([str(tmp_path / 'missing.js')])
+
+
+def test_2(deobfuscate):
+    backend = RateLimitedBackend(FakeBackend(), threading.Semaphore(1))
+
+    result = deobfuscate("function f(a) { return a.width; } f(1);", backend=backend)
+    assert result['variables'] == 2 and result['requests'] == 2
+    with open(result['output']) as file:
+        assert file.read() == "function value(_value) { return _value.width; } value(1);"
@@ -0,0 +1,37 @@
+import pytest # type: ignore
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.cache import PredictionCache
+
+
+def test_1(tmp_path):
+    cache = PredictionCache(str(tmp_path / 'predictions.db'))
+
+    key = cache.key('llama3.2', 1, 'a', "var a = b.getContext('2d'); a.fillRect(0, 0, c, d);")
+    assert cache.key('llama3.2', 1, 'e', "var e  = k.getContext('2d');\n e.fillRect(0, 0, g, f);") == key
+    assert cache.key('llama3.2', 1, 'k', "var e = k.getContext('2d'); e.fillRect(0, 0, g, f);") != key
+    assert cache.key('llama3.2', 2, 'a', "var a = b.getContext('2d'); a.fillRect(0, 0, c, d);") != key
+
+    assert cache.get(key) is None
+    cache.put(key, 'context')
+    assert cache.get(key) == 'context'
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+
+def test_2(tmp_path):
+    cache = PredictionCache(str(tmp_path / 'predictions.db'), max_entries=2)
+    cache.put('a', 'first')
+    cache.put('b', 'second')
+    cache.get('a')
+    cache.put('c', 'third')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'first'
+    cache.close()
+
+    cache = PredictionCache(str(tmp_path / 'predictions.db'), max_entries=2)
+    assert cache.count == 2
+    assert cache.get('c') == 'third'
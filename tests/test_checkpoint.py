@@ -0,0 +1,65 @@
+import pytest # type: ignore
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.deobfuscator import Desobfuscator
+
+from conftest import NameBackend
+
+
+CODE = """
+function f(a, b) { var c = a * b; return c + a; }
+function g(d) { var e = d.x, h = d.y; return e * h + d.z; }
+function k(m, n) { return function (p) { var q = m + p; return q * n; }; }
+f(1, 2); g({}); k(1, 2)(3);
+"""
+
+def run(file, folder, backend, resume=False):
+    engine = Desobfuscator(file, cache_file=None, batch=False, rules=False, backend=backend, output_folder=folder, resume=resume)
+    engine.progress_bar.disable = True
+    # Saved after every prediction, as if the interruption came just after a periodic save
+    engine.checkpoint.interval = 0.0
+    try:
+        engine.desobfuscate()
+    finally:
+        engine.writer.close()
+    with open(os.path.join(folder, "output.js")) as output:
+        return output.read()
+
+def test_1(tmp_path):
+    (tmp_path / 'app.js').write_text(CODE)
+
+    backend = NameBackend()
+    expected = run(str(tmp_path / 'app.js'), str(tmp_path / 'full'), backend)
+    assert "renamed_q" in expected
+
+    # Interrupted in the middle of a scope, then resumed
+    interrupted = NameBackend(limit=5)
+    with pytest.raises(KeyboardInterrupt):
+        run(str(tmp_path / 'app.js'), str(tmp_path / 'out'), interrupted)
+    resumed = NameBackend()
+    assert run(str(tmp_path / 'app.js'), str(tmp_path / 'out'), resumed, resume=True) == expected
+
+    # Nothing answered before the interruption is asked again
+    assert len(interrupted.prompts) + len(resumed.prompts) == len(backend.prompts)
+
+
+def test_2(tmp_path):
+    # 'b' is named before the parameter of its parent and both take 'data', replayed in traversal order 'b' takes '_data'
+    (tmp_path / 'app.js').write_text("""
+function helper(a) { a(a); return function (b) { return b.x + b.y + b.z + b.w; }; }
+function other(c) { return c; }
+helper(1)(2); other(3);
+""")
+    names = {'a': 'data', 'b': 'data'}
+
+    expected = run(str(tmp_path / 'app.js'), str(tmp_path / 'full'), NameBackend(names=names))
+    assert "function helper(data)" in expected and "function (data)" in expected
+
+    # Interrupted once both scopes are completed, the renames are replayed in the same order
+    with pytest.raises(KeyboardInterrupt):
+        run(str(tmp_path / 'app.js'), str(tmp_path / 'out'), NameBackend(limit=2, names=names))
+    assert run(str(tmp_path / 'app.js'), str(tmp_path / 'out'), NameBackend(names=names), resume=True) == expected
@@ -0,0 +1,36 @@
+import pytest # type: ignore
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import esprima
+
+from src.fingerprint import binding_index, fingerprint, find_duplicates
+from src.visitor import Visitor
+
+from conftest import NameBackend
+
+
+def test_1():
+    code = "var x; function f(a, b) { return a[b] + x; } var g = function (c, d) { return c[d] + x; }; function h(a, b) { return a[b] + 1; }"
+    visitor = Visitor(esprima.parseScript(code))
+    f, g, h = visitor.global_scope.children
+    bindings = binding_index(visitor)
+
+    assert fingerprint(f, bindings)[0] == fingerprint(g, bindings)[0] != fingerprint(h, bindings)[0]
+    assert [binding.name for binding in fingerprint(g, bindings)[1]] == ['c', 'd']
+    assert fingerprint(f, bindings, limit=3) is None
+    assert find_duplicates(visitor, [g, f, h]) == {f: (g, {'a': 'c', 'b': 'd'})}
+
+
+def test_2(tmp_path, deobfuscate):
+    backend = NameBackend()
+    result = deobfuscate("function f(a, b) { return a.x + a.y + b; } function g(c, d) { return c.x + c.y + d; } f(1, 2); g(3, 4);", backend=backend)
+    # 'c' and 'd' take the names of 'a' and 'b'
+    assert len(backend.prompts) == 4 and result['variables'] == 6
+    with open(result['output']) as file:
+        assert file.read() == "function renamed_f(renamed_a, renamed_b) { return renamed_a.x + renamed_a.y + renamed_b; } function renamed_g(renamed_a, renamed_b) { return renamed_a.x + renamed_a.y + renamed_b; } renamed_f(1, 2); renamed_g(3, 4);"
+    with open(f"{tmp_path / 'out' / 'app'}.log") as file:
+        assert "[DUPLICATES]: 2 names reused from the copies of a function, 1 scopes without request" in file.read()
@@ -0,0 +1,41 @@
+import pytest # type: ignore
+
+import sys
+import os
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.backend import Backend
+from src.local import Model
+from src.metrics import Metrics
+
+
+class FakeBackend(Backend):
+    def generate(self, model, prompt, system, options, format=None):
+        yield {'response': "", 'done': False}
+        yield {'response': "```json\n{'a': 'width', 'b': 'height'}\n```", 'done': True, 'prompt_eval_count': 40, 'eval_count': 10, 'eval_duration': 2000000000}
+
+
+def test_1(tmp_path):
+    metrics = Metrics(str(tmp_path / 'metrics.jsonl'), str(tmp_path / 'metrics.prom'))
+    model = Model(backend=FakeBackend(), metrics=metrics)
+
+    metrics.scope = 3
+    with metrics.span('context', 'a', 'b'):
+        pass
+    assert model.predict_batch(['a', 'b'], "a = c.width; b = c.height;", set()) == {'a': 'width', 'b': 'height'}
+    metrics.flush(final=True)
+
+    with open(tmp_path / 'metrics.jsonl') as file:
+        records = [json.loads(line) for line in file]
+    assert [(record['scope'], record['var']) for record in records] == [(3, 'a'), (3, 'b')]
+    assert records[0]['prompt_tokens'] == 20 and records[0]['eval_tokens'] == 5
+    assert records[0]['requests'] == 1 and records[0]['retries'] == 0
+    assert 'context_seconds' in records[0] and 'predict_seconds' in records[0]
+
+    with open(tmp_path / 'metrics.prom') as file:
+        prometheus = file.read()
+    assert "deobfuscator_requests_total 1" in prometheus
+    assert 'deobfuscator_model_seconds_total{phase="eval"} 2.0' in prometheus
+    assert "eval tokens" in metrics.summary()
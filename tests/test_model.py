@@ -0,0 +1,90 @@
+import pytest # type: ignore
+
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.backend import Backend
+from src.local import Model
+from src.metrics import Metrics
+
+
+class SchemaBackend(Backend):
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.formats = []
+
+    def generate(self, model, prompt, system, options, format=None):
+        self.formats.append(format)
+        yield {'response': self.answers.pop(0), 'done': False}
+        yield {'response': "", 'done': True, 'eval_count': 6}
+
+
+def test_1():
+    backend = SchemaBackend(['{"name": "canvas"}', '{"name": "context"}'])
+    metrics = Metrics()
+    model = Model(backend=backend, metrics=metrics, structured=True)
+
+    # 'canvas' is already declared and is asked again
+    assert model.predict('k', "k = d.getContext('2d');", {'canvas'}) == 'context'
+    assert backend.formats[0]['required'] == ['name']
+    assert backend.formats[0]['properties']['name']['type'] == 'string'
+
+    backend.answers = ['{"a": "width", "b": "height"}']
+    assert model.predict_batch(['a', 'b'], "a = c.width; b = c.height;", set()) == {'a': 'width', 'b': 'height'}
+    assert backend.formats[-1]['required'] == ['a', 'b']
+
+    metrics.flush()
+    assert metrics.retries == 1
+    assert "retry rate" in metrics.summary()
+
+
+class PromptBackend(Backend):
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, model, prompt, system, options, format=None):
+        self.prompts.append(prompt)
+        yield {'response': "```json\n{'name': 'value%d'}\n```" % len(self.prompts), 'done': False}
+
+
+def test_2():
+    backend = PromptBackend()
+    metrics = Metrics()
+    model = Model(backend=backend, metrics=metrics)
+    context = "function (a, b) { return a.width * b; }"
+
+    metrics.scope = 1
+    assert list(model.predict_many([('a', context), ('b', context)], set())) == ['value1', 'value2']
+    # The questions differ after the shared code
+    assert os.path.commonprefix(backend.prompts).startswith(model.code_prompt(context))
+    assert metrics.first_tokens['cold'][0] == 1 and metrics.first_tokens['warm'][0] == 1
+
+
+class CollidingBackend(Backend):
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, model, prompt, system, options, format=None):
+        self.prompts.append(prompt)
+        var = prompt.split("variable/function `")[1].split("`")[0]
+        # The first variables answer last
+        time.sleep(0.01 * (ord('z') - ord(var[0])) / 10)
+        name = 'value_' + var if "already declared" in prompt else 'value'
+        yield {'response': "```json\n{'name': '%s'}\n```" % name, 'done': False}
+
+
+def test_3(deobfuscate):
+    outputs = set()
+    for run in range(3):
+        backend = CollidingBackend()
+        result = deobfuscate("function f(a, b, c) { return a + b * c; } f(1, 2, 3);", {'rules': False, 'parallel': 4}, backend, f'out{run}')
+        with open(result['output']) as file:
+            outputs.add(file.read())
+        # 'b' and 'c' are asked again once the names of the scope are known
+        assert sum("already declared" in prompt for prompt in backend.prompts) == 2
+
+    # Every name was predicted as 'value' concurrently, the first in query order keeps it
+    assert outputs == {"function value(value, value_b, value_c) { return value + value_b * value_c; } value(1, 2, 3);"}
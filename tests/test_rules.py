@@ -0,0 +1,42 @@
+import pytest # type: ignore
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import esprima
+
+from src.rules import RuleEngine
+from src.visitor import Visitor
+
+from conftest import NameBackend
+
+
+def test_1():
+    code = """
+    function f(a, b) {
+        var c = document.createElement('canvas'), d = c.getContext('2d'), e = new XMLHttpRequest();
+        c.addEventListener('click', function (g) { d.fillText(g.x, 0, 0); });
+        for (var h = 0; h < a.length; h++) { for (var k = 0; k < h; k++) { b(a[h], k); } }
+        return new Promise(function (m, n) { e.onload = m; e.onerror = n; });
+    }
+    """
+    ast = esprima.parseScript(code)
+    visitor = Visitor(ast)
+    rules = RuleEngine(ast)
+    names = {var: rules.name(binding) for scope in visitor.global_scope for var, binding in scope.bindings.items() if var in scope.declared}
+
+    assert names == {'f': None, 'a': None, 'b': None, 'c': 'canvas', 'd': 'context', 'e': 'xhr', 'h': 'i', 'k': 'j', 'g': 'event', 'm': 'resolve', 'n': 'reject'}
+    # 'a' bounds a loop but the rule is not confident enough
+    assert rules.propose(visitor.global_scope.children[0].bindings['a']) == ('items', 0.6, 'loop')
+
+
+def test_2(deobfuscate):
+    backend = NameBackend()
+    result = deobfuscate("function f(a, b) { var c = document.createElement('div'); c.title = a; c.id = a; b.appendChild(c); } f(1, 2);", backend=backend)
+    # 'c' is not asked to the model
+    assert len(backend.prompts) == 3 and result['variables'] == 4
+    assert not any("variable/function `c`" in prompt for prompt in backend.prompts)
+    with open(result['output']) as file:
+        assert file.read() == "function renamed_f(renamed_a, renamed_b) { var div = document.createElement('div'); div.title = renamed_a; div.id = renamed_a; renamed_b.appendChild(div); } renamed_f(1, 2);"
@@ -0,0 +1,40 @@
+import pytest # type: ignore
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import esprima
+
+from src.scoring import NameScorer
+from src.visitor import Visitor
+
+
+def test_1():
+    ast = esprima.parseScript("function f(a, id, qZx, b) { for (var i = 0; i < a.length; i++) { b(a[i], id, qZx); } return a; }")
+    visitor = Visitor(ast)
+    scorer = NameScorer(ast)
+
+    assert scorer.obfuscation('fn') == 0.0 and scorer.obfuscation('canvasElement') < 0.5
+    assert scorer.obfuscation('qZx') >= 0.5 and scorer.obfuscation('_0x4f2a') == 1.0
+    # 'i' is a loop counter, 'id' a word and 'f' is never used
+    assert list(scorer.select(visitor.global_scope)) == []
+    assert list(scorer.select(visitor.global_scope.children[0])) == ['a', 'qZx', 'b']
+
+
+def test_2(deobfuscate):
+    result = deobfuscate("function f(a, b) { return a.x + a.y + a.z + b; } f(1, 2);", {'budget': 1})
+    # Only the scope with the most used names has been started
+    assert result['variables'] == 2
+    with open(result['output']) as file:
+        assert file.read() == "function f(renamed_a, renamed_b) { return renamed_a.x + renamed_a.y + renamed_a.z + renamed_b; } f(1, 2);"
+
+
+def test_3(deobfuscate):
+    code = "function f(a, b) { return a.x + a.y + a.z + b; } function g(d) { var c = document.createElement('div'); c.title = d; return c; } f(1, 2); g(3);"
+
+    # 'g' is skipped once the budget is exhausted, but 'c' is named by the rules
+    result = deobfuscate(code, {'budget': 1})
+    with open(result['output']) as file:
+        assert file.read() == "function f(renamed_a, renamed_b) { return renamed_a.x + renamed_a.y + renamed_a.z + renamed_b; } function g(d) { var div = document.createElement('div'); div.title = d; return div; } f(1, 2); g(3);"
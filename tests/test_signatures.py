@@ -0,0 +1,58 @@
+import pytest # type: ignore
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import esprima
+
+from src.signatures import SignatureDatabase
+from src.visitor import Visitor
+
+from conftest import NameBackend
+
+
+LIBRARY = """
+function once(func, message) {
+    var done = false, result;
+    return function () {
+        if (!done) {
+            done = true;
+            result = func.apply(this, arguments);
+            if (message) console.log(message, result);
+        }
+        return result;
+    };
+}
+"""
+
+def test_1(tmp_path, deobfuscate):
+    (tmp_path / 'lib.js').write_text(LIBRARY)
+    database = SignatureDatabase(str(tmp_path / 'signatures.db'))
+    assert database.add_library('once', [str(tmp_path / 'lib.js')]) == 2
+    assert database.add_library('once', [str(tmp_path / 'lib.js')]) == 0
+    assert database.libraries() == {'once': 2}
+    database.close()
+
+    backend = NameBackend()
+    code = "function a(b,c){var d=!1,e;return function(){if(!d){d=!0;e=b.apply(this,arguments);if(c)console.log(c,e)}return e}}var f=a(function(g){return g+1});f(1);f(2);"
+    result = deobfuscate(code, {'signatures_file': str(tmp_path / 'signatures.db')}, backend)
+    # Only the names outside the library are asked to the model
+    assert [prompt.split("variable/function `")[1].split("`")[0] for prompt in backend.prompts] == ['f', 'g']
+    with open(result['output']) as file:
+        assert file.read() == "function once(func,message){var done=!1,result;return function(){if(!done){done=!0;result=func.apply(this,arguments);if(message)console.log(message,result)}return result}}var renamed_f=once(function(renamed_g){return renamed_g+1});renamed_f(1);renamed_f(2);"
+    with open(f"{tmp_path / 'out' / 'app'}.log") as file:
+        assert "[LIBRARIES]: once 72.8% of the code" in file.read()
+
+def test_2(tmp_path):
+    # Functions exported by an ES module are indexed too
+    (tmp_path / 'lib.mjs').write_text("import { log } from './log.js';\nexport " + LIBRARY.strip().replace("console.log", "log") + "\nexport default function twice(func) { if (!func) throw new TypeError(func); return once(func); }")
+    database = SignatureDatabase(str(tmp_path / 'signatures.db'), minimum=10)
+    assert database.add_library('once', [str(tmp_path / 'lib.mjs')]) == 3
+
+    visitor = Visitor(esprima.parseScript("function a(b,c){var d=!1,e;return function(){if(!d){d=!0;e=b.apply(this,arguments);if(c)log(c,e)}return e}}function h(i){if(!i)throw new TypeError(i);return a(i)}", range=True))
+    names, coverage = database.match(visitor)
+    database.close()
+    assert sorted(names.values()) == ['done', 'func', 'func', 'message', 'once', 'result', 'twice']
+    assert list(coverage) == ['once']
@@ -0,0 +1,118 @@
+import pytest # type: ignore
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.simplify import simplify_program
+
+from conftest import NameBackend
+
+
+# Output of javascript-obfuscator: rotated string array, decoder with an offset and proxy object
+OBFUSCATED = """
+function _0x4a2c() {
+    var _0x1b2c3d = ["678xyz","getElementById","app","log","Hello ","world","length","push","join","12345abc"];
+    _0x4a2c = function () { return _0x1b2c3d; };
+    return _0x4a2c();
+}
+function _0x51f0(_0x3a1b2c, _0x2d4e5f) {
+    var _0x4a2c1d = _0x4a2c();
+    return _0x51f0 = function (_0x51f0a1, _0x1c2b3a) {
+        _0x51f0a1 = _0x51f0a1 - 0x1f0;
+        var _0x2a3b4c = _0x4a2c1d[_0x51f0a1];
+        return _0x2a3b4c;
+    }, _0x51f0(_0x3a1b2c, _0x2d4e5f);
+}
+(function (_0x1a2b3c, _0x4d5e6f) {
+    var _0x2b3c4d = _0x51f0, _0x3c4d5e = _0x1a2b3c();
+    while (!![]) {
+        try {
+            var _0x5e6f7a = parseInt(_0x2b3c4d(502)) / 0x1 + -parseInt(_0x2b3c4d(503)) / 0x2;
+            if (_0x5e6f7a === _0x4d5e6f) break;
+            else _0x3c4d5e['push'](_0x3c4d5e['shift']());
+        } catch (_0x1f2e3d) {
+            _0x3c4d5e['push'](_0x3c4d5e['shift']());
+        }
+    }
+}(_0x4a2c, 12006));
+function _0x12ab(_0x3f, _0x4e) {
+    var _0x5d = _0x51f0;
+    var _0x6c = {
+        'aBcDe': function (_0x7b, _0x8a) { return _0x7b + _0x8a; },
+        'fGhIj': function (_0x9f, _0x1e) { return _0x9f(_0x1e); },
+        'kLmNo': _0x5d(501),
+        'pQrSt': function (_0x2d, _0x3c) { return _0x2d < _0x3c; }
+    };
+    var _0x7a = [];
+    for (var _0x8b = 0x0; _0x6c['pQrSt'](_0x8b, _0x3f[_0x5d(499)]); _0x8b++) {
+        _0x7a[_0x5d(500)](_0x6c['aBcDe'](_0x3f[_0x8b], 0x2 * 0x3 + 0x1));
+    }
+    console[_0x5d(496)](_0x6c['aBcDe'](_0x5d(497), _0x5d(498)), _0x7a[_0x6c['kLmNo']]('-'));
+    return _0x6c['fGhIj'](_0x4e, _0x7a);
+}
+_0x12ab([0x1, 0x2, 0x3], function (_0x1a) { console['log'](_0x1a['length']); });
+"""
+
+# Older output: the array is rotated a fixed number of times and one index is computed at runtime
+ROTATED = """
+var _0xa1b2 = ["map","total","log","Done: "];
+(function (_0x1, _0x2) {
+    var _0x3 = function (_0x4) {
+        while (--_0x4) {
+            _0x1['push'](_0x1['shift']());
+        }
+    };
+    _0x3(++_0x2);
+}(_0xa1b2, 6));
+var _0xc3d4 = function (_0x5, _0x6) {
+    _0x5 = _0x5 - 0x0;
+    var _0x7 = _0xa1b2[_0x5];
+    return _0x7;
+};
+function _0xe5(_0x8, _0x9) { return _0x8 * _0x9; }
+var _0xf6 = [1, 2, 3][_0xc3d4('0x2')](function (_0x10) { return _0xe5(_0x10, 0x2); });
+var _0x11 = {};
+_0x11[_0xc3d4('0x3')] = _0xf6.length;
+console[_0xc3d4('0x0')](_0xc3d4('0x1') + _0xf6, _0x11[_0xc3d4('0x3')], _0xc3d4(_0xf6.length - 0x3));
+"""
+
+def test_1():
+    code, stats = simplify_program(OBFUSCATED)
+    assert " ".join(code.split()) == (
+        "function _0x12ab(_0x3f, _0x4e) { var _0x7a = []; for (var _0x8b = 0; _0x8b < _0x3f.length; _0x8b++) { _0x7a.push(_0x3f[_0x8b] + 7); } "
+        "console.log('Hello world', _0x7a.join('-')); return _0x4e(_0x7a); } "
+        "_0x12ab([ 1, 2, 3 ], function (_0x1a) { console.log(_0x1a.length); });"
+    )
+    assert stats['strings'] == 6 and stats['rotations'] == 1 and stats['proxies'] == 5
+
+    code, stats = simplify_program(ROTATED)
+    # The decoder is still needed for the index computed at runtime
+    assert "console.log('Done: ' + _0xf6, _0x11.total, _0xc3d4(_0xf6.length - 3));" in code
+    assert "return _0x10 * 2;" in code and "_0xe5" not in code
+
+
+def test_2(tmp_path, deobfuscate):
+    backend = NameBackend()
+    deobfuscate(OBFUSCATED, {'simplify': True}, backend)
+    assert backend.prompts and not any("_0x51f0" in prompt for prompt in backend.prompts)
+    with open(f"{tmp_path / 'out' / 'app'}.log") as file:
+        assert "[SIMPLIFY]" in file.read()
+
+def test_3():
+    # A catch parameter shadows the proxy
+    code, stats = simplify_program("function f(a, b) { return a + b; } try { g(); } catch (f) { f(1, 2); } h(f(1, 2));")
+    assert "f(1, 2);" in code and stats['proxies'] == 0
+
+    # Outside the function declaring it, the name is a global
+    code, stats = simplify_program("function g() { function p(a, b) { return a * b; } return p(2, 3); } p(2, 3);")
+    assert "return 6;" in code and code.endswith("p(2, 3);") and stats['proxies'] == 1
+
+    # A parameter shadows the decoder
+    code, stats = simplify_program("var a = ['aa', 'bb']; var b = function (i) { i = i - 0; return a[i]; }; function z(b) { return b(0); } h(b(1), z(k));")
+    assert code.endswith("h(b(1), k(0));") and stats['strings'] == 0
+
+    # Numbers are converted as in Javascript
+    code, _ = simplify_program("h('x' + 1e-7, '1_000' - 0, 'inf' * 1, ' 0x1f ' * 1, 1e21 + '');")
+    assert code == "h('x1e-7', '1_000' - 0, 'inf' * 1, 31, '1e+21');"
@@ -0,0 +1,79 @@
+import pytest # type: ignore
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import esprima
+import escodegen
+
+from src.slicer import Slicer
+from src.visitor import Visitor
+
+from conftest import NameBackend
+
+
+CODE = """
+function f(a, b) {
+    var c = document.createElement('canvas'), q = 5;
+    var d = c.getContext('2d');
+    var e = a.width * 2;
+    log(q), d.fillRect(0, 0, e, b);
+    if (a.visible) { log('x'); log('y'); }
+    h.fx = { add: function (x) { return x; }, remove: function (x) { return q + x; } };
+    return c;
+}
+f({ width: 1 }, 2);
+"""
+
+
+def test_1():
+    visitor = Visitor(esprima.parseScript(CODE, range=True))
+    slicer = Slicer(visitor)
+    scope = visitor.global_scope.children[0]
+    code = escodegen.generate(visitor.ast)
+
+    # Statements of 'c' with the definitions of the bindings they use
+    assert slicer.get_context(scope, 'c', 1024) == """function f(a, b) {
+    var c = document.createElement('canvas'), /* ... */;
+    var d = c.getContext('2d');
+    /* ... */
+    return c;
+}"""
+    assert slicer.get_context(scope, 'q', 1024) == """function f(a, b) {
+    var /* ... */, q = 5;
+    /* ... */
+    log(q), /* ... */;
+    /* ... */
+    h.fx = {
+        /* ... */,
+        remove: function (x) {
+            return q + x;
+        }
+    };
+    /* ... */
+}"""
+    # Without the hop, the definition of 'd' is elided
+    assert slicer.slice(scope.bindings['e'], 0) == """function f(a, b) {
+    /* ... */
+    var e = a.width * 2;
+    /* ... */, d.fillRect(0, 0, e, b);
+    /* ... */
+}"""
+    # The definition of a function is kept whole
+    assert "return q + x;" in slicer.get_context(visitor.global_scope, 'f', 1024)
+    # The AST is left untouched
+    assert escodegen.generate(visitor.ast) == code
+
+
+def test_2(deobfuscate):
+    prompts = {}
+    for slicing in (False, True):
+        backend = NameBackend()
+        deobfuscate(CODE, {'rules': False, 'slicing': slicing}, backend, f'out{slicing}')
+        prompts[slicing] = backend.prompts
+
+    assert len(prompts[True]) == len(prompts[False])
+    assert any("/* ... */" in prompt for prompt in prompts[True])
+    assert sum(map(len, prompts[True])) < sum(map(len, prompts[False]))
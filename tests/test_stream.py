@@ -0,0 +1,47 @@
+import pytest # type: ignore
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.backend import Backend
+from src.local import Model
+from src.metrics import Metrics
+from src.stream import JsonScanner
+
+
+class ProseBackend(Backend):
+    def __init__(self):
+        self.closed = False
+
+    def generate(self, model, prompt, system, options, format=None):
+        try:
+            for token in ["I'm sure", " it is {'name'", ": 'col", "or'", "}", " because", " the", " fill", " style"]:
+                yield {'response': token, 'done': False}
+            yield {'response': "", 'done': True, 'eval_count': 9}
+        finally:
+            self.closed = True
+
+
+def test_1():
+    scanner = JsonScanner()
+    assert scanner.feed("It's {'a': '}") == []
+    assert scanner.feed("', 'b': {'c': 1}}") == ["{'a': '}', 'b': {'c': 1}}"]
+    assert scanner.feed(" ``") == [] and not scanner.fenced
+    scanner.feed("`json\n{'name': 'x'}\n`")
+    assert not scanner.fenced
+    scanner.feed("``")
+    assert scanner.fenced and scanner.objects[-1] == "{'name': 'x'}"
+
+
+def test_2():
+    backend = ProseBackend()
+    metrics = Metrics()
+    model = Model(backend=backend, metrics=metrics)
+
+    assert model.predict('f', "g.fillStyle = f;", set()) == 'color'
+    assert backend.closed
+    metrics.flush()
+    assert metrics.stopped == 1
+    assert metrics.totals['eval_tokens'] == 5 and metrics.totals['saved_tokens'] == 295
@@ -0,0 +1,35 @@
+import pytest # type: ignore
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.backend import Backend
+from src.batch import run_file
+
+
+class RewriteBackend(Backend):
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.prompts = []
+
+    def generate(self, model, prompt, system, options, format=None):
+        self.prompts.append(prompt)
+        yield {'response': "```javascript\n" + self.answers.pop(0) + "\n```", 'done': False}
+
+
+def test_1(tmp_path):
+    (tmp_path / 'app.js').write_text("function f(a, b) { var c = a.width * b; return function (d) { return c + d; }; } f(1, 2);")
+    backend = RewriteBackend([
+        # Rejected: a statement has been added
+        "function area(width, height) { var size = width.width * height; size++; return function (x) { return size + x; }; } area(1, 2);",
+        # 'height' is not used by every reference of 'b', which keeps its name
+        "function area(element, scale) { var size = element.width * height; return function (offset) { return size + offset; }; } area(1, 2);",
+    ])
+
+    result = run_file(str(tmp_path / 'app.js'), str(tmp_path / 'out' / 'app'), {'cache_file': None, 'transform': True}, backend)
+    assert len(backend.prompts) == 2 and "structure" in backend.prompts[1]
+    assert result['variables'] == 5
+    with open(result['output']) as file:
+        assert file.read() == "function area(element, b) { var size = element.width * b; return function (offset) { return size + offset; }; } area(1, 2);"
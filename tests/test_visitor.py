@@ -323,4 +323,195 @@ def test_7():
             b(config);
         };
     }
-});"""
\ No newline at end of file
+});"""
+
+
+def test_8():
+    code = """
+    function f(a, b) {
+      var c = a.b + b;
+      function g(b) {
+        return function () {
+          return a + b + c;
+        };
+      }
+      return {a, c: g(b)};
+    }
+    """
+
+    ast = esprima.parseScript(code)
+    visitor = Visitor(ast)
+
+    scope = visitor.global_scope.children[0]
+    assert len(scope.bindings['a'].references) == 4
+    assert len(scope.bindings['b'].references) == 3
+
+    scope.change_name(visitor, 'a', 'b')
+    scope.change_name(visitor, 'c', 'value')
+    scope.change_name(visitor, '_b', 'first')
+    assert set(scope.bindings) == {'first', 'b', 'value', 'g'}
+    assert escodegen.generate(visitor.ast) == """function f(first, b) {
+    var value = first.b + b;
+    function g(b) {
+        return (function () {
+            return first + b + value;
+        });
+    }
+    return ({
+        a: first,
+        c: g(b)
+    });
+}"""
+
+def test_9():
+    code = """
+    function f(a, b, c) {
+      var d = a + b * c;
+      return function (e) {
+        return d + e + a;
+      };
+    }
+    """
+
+    ast = esprima.parseScript(code)
+    visitor = Visitor(ast)
+
+    scope = visitor.global_scope.children[0]
+    applied = scope.change_names(visitor, {'a': 'b', 'b': 'a', 'c': 'd', 'd': 'e', 'f': 'main'})
+    assert applied == {'a': 'b', 'b': 'a', 'c': 'd', 'd': '_e'}
+    assert visitor.global_scope.declared == {'main'}
+    assert scope.declared == {'a', 'b', 'd', '_e'}
+    assert escodegen.generate(visitor.ast) == """function main(b, a, d) {
+    var _e = b + a * d;
+    return (function (e) {
+        return _e + e + b;
+    });
+}"""
+
+def test_10():
+    code = """var a = 'it\\'s', b = {a, c: a.a};
+function f(a) { return a + b.a; }
+f(a);"""
+
+    ast = esprima.parseScript(code, range=True, loc=True)
+    visitor = Visitor(ast)
+
+    visitor.global_scope.change_names(visitor, {'a': 'text', 'b': 'object', 'f': 'print'})
+    visitor.global_scope.children[0].change_name(visitor, 'a', 'value')
+    assert visitor.render(code) == """var text = 'it\\'s', object = {a: text, c: text.a};
+function print(value) { return value + object.a; }
+print(text);"""
+
+def test_11():
+    code = """
+    function f(a) {
+      function g(b) {
+        return a + b;
+      }
+      return g(a);
+    }
+    var c = f(1);
+    """
+
+    ast = esprima.parseScript(code)
+    visitor = Visitor(ast)
+
+    scope_f = visitor.global_scope.children[0]
+    scope_g = scope_f.children[0]
+    codes = [scope.get_code() for scope in (visitor.global_scope, scope_f, scope_g)]
+    assert scope_g.get_code() is codes[2]
+
+    scope_f.change_name(visitor, 'a', 'value')
+    assert scope_g.code is None and scope_f.code is None and visitor.global_scope.code is None
+    assert visitor.global_scope.get_length() == len(codes[0]) + 3 * 4
+
+    visitor.global_scope.change_name(visitor, 'c', 'result')
+    assert scope_g.get_code() is not codes[2]
+    for scope in (visitor.global_scope, scope_f, scope_g):
+        scope.get_code()
+
+    scope_f.change_name(visitor, 'g', 'add')
+    assert scope_g.code is None and scope_f.code is None
+    for scope in (visitor.global_scope, scope_f, scope_g):
+        assert scope.get_length() == len(escodegen.generate(scope.node))
+        assert scope.get_code() == escodegen.generate(scope.node)
+    assert 'function add(b)' in scope_g.get_code()
+
+def test_12():
+    code = """
+    function tint(a, c, f) {
+      var d = v.createElement('canvas'), k = d.getContext('2d'), g = a.width, e = a.height;
+      d.width = g;
+      d.height = e;
+      var b = v.createElement('canvas');
+      b.width = g;
+      b.height = e;
+      g = b.getContext('2d');
+      g.fillStyle = f;
+      g.fillRect(0, 0, b.width, b.height);
+      g.globalCompositeOperation = 'destination-atop';
+      g.drawImage(a, 0, 0);
+      k.globalAlpha = 1;
+      k.drawImage(b, 0, 0);
+      c(d, function (f) { return f; });
+    }
+    """
+
+    ast = esprima.parseScript(code)
+    visitor = Visitor(ast)
+
+    scope = visitor.global_scope.children[0]
+    assert scope.get_context(visitor, 1000, 'f') == scope.get_code()
+    assert scope.get_context(visitor, 60, 'f') == """function tint(a, c, f) {
+[...]
+g.fillStyle = f;"""
+
+    scope.change_name(visitor, 'f', 'color')
+    assert scope.get_context(visitor, 60, 'color') == """function tint(a, c, color) {
+[...]
+g.fillStyle = color;"""
+
+def test_13():
+    code = "var r = function (a) { return " + " && ".join(["a"] * 3000) + "; };"
+
+    ast = esprima.parseScript(code)
+    visitor = Visitor(ast)
+
+    scope = visitor.global_scope.children[0]
+    assert len(scope.bindings['a'].references) == 3001
+
+    result = []
+    visitor.set_task(lambda node, scope: result.append(node.type), {Syntax.FunctionExpression, Syntax.ReturnStatement})
+    visitor.visit()
+    assert result == [Syntax.FunctionExpression, Syntax.ReturnStatement]
+    assert visitor.global_scope.count_declared() == 2
+
+
+def test_14():
+    code = "function f(x) { if (x) { var a = 1; function g() { return a; } } let b = 2; { let b = 3; } return a + g() + b; }"
+
+    ast = esprima.parseScript(code, range=True)
+    visitor = Visitor(ast)
+
+    # 'var' and function declarations belong to the function, 'let' to its block
+    scope = visitor.global_scope.children[0]
+    assert scope.declared == {'x', 'a', 'g', 'b'}
+    assert [child.declared for child in scope.children] == [set(), {'b'}]
+
+    scope.change_names(visitor, {'a': 'value', 'b': 'count'})
+    assert visitor.render(code) == "function f(x) { if (x) { var value = 1; function g() { return value; } } let count = 2; { let b = 3; } return value + g() + count; }"
+
+
+def test_15():
+    code = "function f(a) { var b = { a }; return b; }"
+
+    ast = esprima.parseScript(code, range=True)
+    visitor = Visitor(ast)
+
+    # The shorthand property gets a key, the length follows the code
+    scope = visitor.global_scope.children[0]
+    scope.get_code()
+    scope.change_name(visitor, 'a', 'key')
+    assert 'a: key' in scope.get_code()
+    assert scope.get_length() == len(scope.get_code())
+    assert visitor.render(code) == "function f(key) { var b = { a: key }; return b; }"
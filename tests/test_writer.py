@@ -0,0 +1,56 @@
+import pytest # type: ignore
+
+import sys
+import os
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.writer import Writer
+
+
+class BlockedWriter(Writer):
+    # Writes wait for 'release', so that snapshots pile up meanwhile
+    def __init__(self, *args, **kwargs):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.written = []
+        super().__init__(*args, **kwargs)
+
+    def write(self, output: str):
+        self.started.set()
+        self.release.wait()
+        self.written.append(output)
+        super().write(output)
+
+
+def test_1(tmp_path, monkeypatch):
+    replaced = []
+    replace = os.replace
+    monkeypatch.setattr(os, 'replace', lambda source, target: (replaced.append((source, target)), replace(source, target)))
+    path = str(tmp_path / 'output.js')
+    content = ["v0"]
+    writer = BlockedWriter(path, lambda: content[0], interval=3600.0, renames=100)
+
+    # The first snapshot is being written while three others are submitted
+    writer.submit()
+    assert writer.started.wait(5)
+    for version in range(1, 4):
+        content[0] = f"v{version}"
+        writer.submit()
+    writer.release.set()
+    writer.flush()
+    assert writer.written == ["v0", "v3"]
+
+    # Renames below the thresholds are only written by close()
+    content[0] = "v4"
+    writer.update(1)
+    assert writer.written == ["v0", "v3"]
+    writer.close()
+    assert writer.written == ["v0", "v3", "v4"]
+
+    with open(path) as file:
+        assert file.read() == "v4"
+    # Written through a temporary file replacing the output
+    assert replaced == [(f"{path}.tmp", path)] * 3
+    assert os.listdir(tmp_path) == ['output.js']